@@ -15,6 +15,8 @@ from models.lm_logging import LmLogger
 from users.dataset_generation import unit_test_dataset
 from users.users import Household
 from datamodels.codebot import CodeBot
+from datamodels.sandbox import CheckerSandbox
+from datamodels.key_registry import KeyRegistry
 from datetime import datetime
 from uuid import uuid4
 from users.benefits_programs import BenefitsProgramMeta
@@ -51,6 +53,132 @@ parser.add_argument(
     type=int,
     help="Number of times to attempt to rewrite code",
 )
+parser.add_argument(
+    "--code_gen_grammar",
+    default=None,
+    choices=["syntax", "strict"],
+    help="Constrain checker generation with a Python grammar (HF code models only). strict also forbids .get(, f-strings and try blocks",
+)
+parser.add_argument(
+    "--code_gen_samples",
+    default=1,
+    type=int,
+    help="Checker candidates to sample per code model request; failed attempts use the next candidate",
+)
+parser.add_argument(
+    "--code_gen_parallelism",
+    default=1,
+    type=int,
+    help="Key type and choice requests to run concurrently while building checkers",
+)
+parser.add_argument(
+    "--concurrent_checkers",
+    default=False,
+    type=lambda x: (
+        (str(x).lower() == "true")
+        if str(x).lower() in ("true", "false")
+        else (_ for _ in ()).throw(ValueError("Value must be 'true' or 'false'"))
+    ),
+    help="Generate up to --code_gen_parallelism checkers at once; their prompts only list keys known before the batch",
+)
+parser.add_argument(
+    "--code_gen_rate_limit",
+    default=None,
+    type=float,
+    help="Maximum code model requests per second while building checkers",
+)
+parser.add_argument(
+    "--key_inference",
+    default="per_key",
+    choices=["per_key", "batched"],
+    help="Infer key types and choices with one request per key or one structured request per batch of keys",
+)
+parser.add_argument(
+    "--key_batch_size",
+    default=12,
+    type=int,
+    help="Keys per request with --key_inference batched",
+)
+parser.add_argument(
+    "--static_key_inference",
+    default=False,
+    type=lambda x: (
+        (str(x).lower() == "true")
+        if str(x).lower() in ("true", "false")
+        else (_ for _ in ()).throw(ValueError("Value must be 'true' or 'false'"))
+    ),
+    help="Infer key types and yes/no choices from the checker code where unambiguous before asking the code model",
+)
+parser.add_argument(
+    "--sandbox_workers",
+    default=0,
+    type=int,
+    help="Worker processes that run generated checkers and their unit tests; 0 runs them in this process",
+)
+parser.add_argument(
+    "--sandbox_timeout",
+    default=10.0,
+    type=float,
+    help="Wall clock seconds a sandboxed checker may run before its worker is restarted",
+)
+parser.add_argument(
+    "--sandbox_cpu_timeout",
+    default=5.0,
+    type=float,
+    help="CPU seconds a sandboxed checker may use before its worker is restarted",
+)
+parser.add_argument(
+    "--sandbox_memory_mb",
+    default=1024,
+    type=int,
+    help="Memory in MB a sandbox worker may allocate beyond what it inherits",
+)
+parser.add_argument(
+    "--key_registry_path",
+    default=None,
+    type=str,
+    help="JSON file that keeps key questions, types and choices across households and runs",
+)
+parser.add_argument(
+    "--precompute_questions",
+    default=False,
+    type=lambda x: (
+        (str(x).lower() == "true")
+        if str(x).lower() in ("true", "false")
+        else (_ for _ in ()).throw(ValueError("Value must be 'true' or 'false'"))
+    ),
+    help="Phrase the questions for all literal checker keys when the checkers are synthesized (needs --key_registry_path)",
+)
+parser.add_argument(
+    "--local_answer_extraction",
+    default=False,
+    type=lambda x: (
+        (str(x).lower() == "true")
+        if str(x).lower() in ("true", "false")
+        else (_ for _ in ()).throw(ValueError("Value must be 'true' or 'false'"))
+    ),
+    help="Parse numbers, yes/no and choices from answers locally; ask the chat model in one request only when ambiguous",
+)
+parser.add_argument(
+    "--vectorize_members",
+    default=False,
+    type=lambda x: (
+        (str(x).lower() == "true")
+        if str(x).lower() in ("true", "false")
+        else (_ for _ in ()).throw(ValueError("Value must be 'true' or 'false'"))
+    ),
+    help="Ask for a member key of every household member in one question",
+)
+parser.add_argument(
+    "--batch_household_keys",
+    default=False,
+    type=lambda x: (
+        (str(x).lower() == "true")
+        if str(x).lower() in ("true", "false")
+        else (_ for _ in ()).throw(ValueError("Value must be 'true' or 'false'"))
+    ),
+    help="Ask for household keys the checker needs either way in one question",
+)
 parser.add_argument(
     "--synthetic_user_model_name",
     default="meta-llama/Meta-Llama-3-70B-Instruct",
@@ -130,6 +258,9 @@ TURNS_PER_PROGRAM = 20
 args = parser.parse_args()
 if args.synthetic_user_model_name == "same":
     args.synthetic_user_model_name = args.chat_model_id
+# A person is waiting on every turn, so schedule ahead of batch traffic
+if "human" in (args.synthetic_user_model_name, args.chatbot_strategy):
+    os.environ.setdefault("LM_PRIORITY", "interactive")
 now = datetime.now().strftime("%Y-%m-%d_%H:%M:%S")
 programs_abbreviation = len(args.programs)
 
@@ -215,6 +346,18 @@ last_turn_iteration = []
 num_benefits = len(args.programs)
 
 lm_logger = LmLogger(log_dir=output_dir)
+# Shared by the chatbots of all rows so the workers stay warm
+checker_sandbox = (
+    CheckerSandbox(
+        workers=args.sandbox_workers,
+        timeout=args.sandbox_timeout,
+        cpu_timeout=args.sandbox_cpu_timeout,
+        memory_mb=args.sandbox_memory_mb,
+    )
+    if args.sandbox_workers
+    else None
+)
+key_registry = KeyRegistry(args.key_registry_path) if args.key_registry_path else None
 
 
 def get_chatbot(
@@ -260,6 +403,20 @@ def get_chatbot(
             max_code_gen_attempts=args.max_code_gen_attempts,
             max_code_rewrite_attempts=args.max_code_rewrite_attempts,
             data_user_index=data_user_index,
+            code_gen_grammar=args.code_gen_grammar,
+            code_gen_samples=args.code_gen_samples,
+            code_gen_parallelism=args.code_gen_parallelism,
+            concurrent_checkers=args.concurrent_checkers,
+            code_gen_rate_limit=args.code_gen_rate_limit,
+            key_inference=args.key_inference,
+            key_batch_size=args.key_batch_size,
+            static_key_inference=args.static_key_inference,
+            sandbox=checker_sandbox,
+            key_registry=key_registry,
+            precompute_questions=args.precompute_questions,
+            local_answer_extraction=args.local_answer_extraction,
+            vectorize_members=args.vectorize_members,
+            batch_household_keys=args.batch_household_keys,
         )
     elif strategy == "cot":
         return CotChatBot(
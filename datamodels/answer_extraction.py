@@ -0,0 +1,135 @@
+"""Values read from user answers without the chat model.
+
+`extract_answer` parses plain numbers, yes/no and choices, and returns None
+whenever an answer could mean more than one thing or is hedged, a rate or in
+another unit. CodeBot then asks the chat model.
+"""
+
+from difflib import get_close_matches
+from typing import Optional
+import re
+
+NUMBER = re.compile(r"(?<![\w.])(\$)?\s?(\d{1,3}(?:,\d{3})+|\d+)(\.\d+)?(?![\w])")
+# Words after a number that scale it or make it a range
+SCALES = re.compile(
+    r"^\s*(k|m|b|thousand|million|billion|hundred|to|or|and|-)\b", re.IGNORECASE
+)
+# Rates and units after a number. Years are left alone: "36 years old" is an age
+PERIODS = r"(hour|hr|day|week|wk|month|mo|year|yr|annum)s?"
+UNITS = re.compile(
+    rf"^\s*((a|an|per|each|every|/)\s*{PERIODS}"
+    r"|(hours?|hrs?|days?|weeks?|wks?|months?|mos?)"
+    r"|(hourly|daily|weekly|biweekly|monthly|yearly|annually))\b",
+    re.IGNORECASE,
+)
+HEDGE_WORDS = set(
+    "maybe about around approximately approx roughly probably perhaps possibly"
+    " estimate almost nearly unsure over under minus negative".split()
+)
+HEDGE_PHRASES = ["not sure", "or so", "give or take", "at least", "i think", "i guess"]
+NUMBER_WORDS = {
+    word: i
+    for i, word in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve"
+        " thirteen fourteen fifteen sixteen seventeen eighteen nineteen"
+        " twenty".split()
+    )
+}
+DETERMINERS = {"no", "any", "every", "some", "each", "the", "this", "that"}
+# "don't" normalizes to "don t"
+NEGATIONS = {"not", "no", "never", "neither", "nor", "t"}
+YES_WORDS = {"yes", "yeah", "yep", "yup", "correct", "true", "sure"}
+NO_WORDS = {"no", "nope", "nah", "false", "never", "none"}
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9$]+", " ", text.lower()).split())
+
+
+def is_hedged(answer: str) -> bool:
+    """Whether `answer` qualifies what it says, e.g. "maybe" or "I think"."""
+    normal = _normalize(answer)
+    return bool(HEDGE_WORDS & set(normal.split())) or any(
+        f" {phrase} " in f" {normal} " for phrase in HEDGE_PHRASES
+    )
+
+
+def extract_number(answer: str, key_type: str) -> Optional[str]:
+    """The single number in `answer`, as an int or float string, or None."""
+    if is_hedged(answer):
+        return None
+    normal = _normalize(answer)
+    values = set()
+    for match in NUMBER.finditer(answer):
+        dollar, digits, decimals = match.groups()
+        rest = answer[match.end() :]
+        if SCALES.match(rest) or UNITS.match(rest):
+            return None
+        if answer[: match.start()].endswith(("-", "\u2212")):
+            return None
+        digits = digits.replace(",", "")
+        # A bare four digit number between 1900 and 2100 is likely a year
+        if not dollar and not decimals and 1900 <= int(digits) <= 2100:
+            return None
+        values.add(digits + (decimals or ""))
+    words = normal.split()
+    for i, word in enumerate(words):
+        # "no one" and "anyone" are not counts
+        if word in NUMBER_WORDS and not (
+            word == "one" and i and words[i - 1] in DETERMINERS
+        ):
+            values.add(str(NUMBER_WORDS[word]))
+    if len(values) != 1:
+        return None
+    value = values.pop()
+    if key_type == "int":
+        if "." in value and float(value) != int(float(value)):
+            return None
+        return str(int(float(value)))
+    return value
+
+
+def extract_choice(answer: str, choices: list[str]) -> Optional[str]:
+    """The one choice `answer` names, or None."""
+    by_normal = {}
+    for choice in choices:
+        by_normal.setdefault(_normalize(choice.replace("\\$", "$")), choice)
+    normal = _normalize(answer)
+    if normal in by_normal:
+        return by_normal[normal]
+
+    # Yes/no questions are mostly answered with a leading yes or no
+    words = normal.split()
+    if words and set(by_normal) == {"yes", "no"}:
+        if words[0] in YES_WORDS:
+            return by_normal["yes"]
+        if words[0] in NO_WORDS:
+            return by_normal["no"]
+        return None
+
+    # Choices named in the answer as whole words. A choice inside a longer
+    # named one ("income" in "no income") does not count
+    padded = f" {normal} "
+    named = [c for c in by_normal if c and f" {c} " in padded]
+    named = [c for c in named if not any(c != o and c in o for o in named)]
+    if len(named) == 1:
+        # "I'm not married" names a choice without choosing it
+        rest = padded.replace(f" {named[0]} ", " ").split()
+        return None if NEGATIONS & set(rest) else by_normal[named[0]]
+    if named:
+        return None
+    close = get_close_matches(normal, list(by_normal), n=2, cutoff=0.85)
+    if len(close) == 1:
+        return by_normal[close[0]]
+    return None
+
+
+def extract_answer(
+    answer: str, key_type: str, choices: Optional[list[str]] = None
+) -> Optional[str]:
+    """The value of a key of `key_type` given by `answer`, or None if unclear."""
+    if key_type in ("int", "float"):
+        return extract_number(answer, key_type)
+    if key_type == "choice" and choices:
+        return extract_choice(answer, choices)
+    return None
@@ -20,6 +20,10 @@ benefits_ready_prompt = {
 }
 
 
+# Token budget for prompts that ask the model to think out loud
+REASONING_MAX_NEW_TOKENS = 1024
+
+
 def example_array(n):
     return str([bool(x % 2) for x in range(n)])
 
@@ -68,6 +72,9 @@ class ChatBot:
         self.benefits_ready_prompt = "Eligibility requirements: {eligibility_requirements}. \n\nIs the information sufficient to determine whether any member of the user's household is eligible for all programs? Answer only in one word True or False in JSON format."
         self.benefits_prediction_prompt = "Eligibility: {eligibility_requirements}. \n\nPredict the programs for which any member of the user's household is eligible. Return only a boolean array of length {num_programs}, e.g. {example_array}, where the value at index `i` is true iff the user is eligible for program `i`. Only return the array. Do not return anything else in the response. If a user's eligibility is unclear, make your best guess. Answer in JSON format."
         self.predict_cq_prompt = "Eligibility: {eligibility_requirements}. \n\nAsk a clarifying question that will help you determine if any member of the user's household is eligible for benefits as efficiently as possible. Only ask about one fact at a time."
+        # Generation budget for predict_cq; None uses the role default
+        self.predict_cq_max_new_tokens = None
+        self.predict_cq_stop = None
 
         # self.benefits_ready_prompt = "Eligibility requirements: {eligibility_requirements}. \n\nIs the information sufficient to determine whether any member of the user's household is eligible for all programs? Think through your reasoning out loud. Then answer with True or False."
         # self.predict_benefits_reasoning_prompt = "Eligibility: {eligibility_requirements}. \n\nPredict the programs for which any member of the user's household is eligible. Return only a boolean array of length {num_programs}, e.g. {example_array}, where the value at index `i` is true iff the user is eligible for program `i`. Only return the array. Do not return anything else in the response. If a user's eligibility is unclear, make your best guess.Think through your reasoning out loud."
@@ -83,6 +90,8 @@ class ChatBot:
         )
         self.num_programs = no_of_programs
         self.eligibility_requirements = eligibility_requirements
+        # Probability of each answer of the last predict_benefits_ready call
+        self.benefits_ready_probs = None
 
     def predict_benefits_ready(self, history) -> bool:
         """
@@ -95,11 +104,12 @@ class ChatBot:
                 eligibility_requirements=self.eligibility_requirements
             ),
         }
-        raw_lm_output = self.lm_api.forward(
+        raw_lm_output, self.benefits_ready_probs = self.lm_api.forward_choice(
             history_ + [prompt],
             chat_model_id=self.chat_model_id,
             use_cache=self.use_cache,
             logging_role="predict_benefits_ready",
+            choices=["True", "False"],
         )
         lm_output = get_last_bool_in_str(str(raw_lm_output))
         return lm_output
@@ -171,6 +181,8 @@ class ChatBot:
             chat_model_id=chat_model_id,
             use_cache=self.use_cache,
             logging_role="predict_cq",
+            max_new_tokens=self.predict_cq_max_new_tokens,
+            stop=self.predict_cq_stop,
         )
         return cq
 
@@ -258,6 +270,9 @@ class CotChatBot(ChatBot):
         self.predict_benefits_reasoning_prompt = "Eligibility: {eligibility_requirements}. \n\nPredict the programs for which any member of the user's household is eligible. Return only a boolean array of length {num_programs}, e.g. {example_array}, where the value at index `i` is true iff the user is eligible for program `i`. Only return the array. Do not return anything else in the response. If a user's eligibility is unclear, make your best guess.Think through your reasoning out loud."
         self.predict_benefits_constrained_prompt = "Reasoning: {reasoning}. \n\nUsing the reasoning above, predict the programs for which any member of the user's household is eligible. Output a boolean array of length {num_programs}, e.g. {example_array}, where the value at index `i` is true iff the user is eligible for program `i`. If a user's eligibility is unclear, make your best guess."
         self.predict_cq_prompt = "Eligibility: {eligibility_requirements}. \n\nAsk a clarifying question that will help you determine if any member of the user's household is eligible for benefits as efficiently as possible. Only ask about one fact at a time. Think through your reasoning out loud, then state your question after a colon, e.g. Question: What is the user's age?"
+        # The reasoning runs over several paragraphs before the question
+        self.predict_cq_max_new_tokens = REASONING_MAX_NEW_TOKENS
+        self.predict_cq_stop = []
 
     def predict_cq(self, history, chat_model_id) -> str:
         cq = super().predict_cq(history, chat_model_id)
@@ -280,6 +295,7 @@ class CotChatBot(ChatBot):
             chat_model_id=self.chat_model_id,
             use_cache=self.use_cache,
             logging_role="predict_benefits_ready",
+            max_new_tokens=REASONING_MAX_NEW_TOKENS,
         )
         lm_output = get_last_bool_in_str(str(raw_lm_output))
         return lm_output
@@ -303,6 +319,7 @@ class CotChatBot(ChatBot):
             logging_role="predict_benefits_eligibility",
             chat_model_id=self.chat_model_id,
             use_cache=self.use_cache,
+            max_new_tokens=REASONING_MAX_NEW_TOKENS,
             # constraint_type="regex",
             # constraints=rf"(True|False)(,(True|False)){{{len(programs)-1}}}",
         )
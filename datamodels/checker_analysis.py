@@ -0,0 +1,173 @@
+"""Static inference of key types and choices from generated checkers.
+
+`analyze_checker` records how every literal key is used, e.g. `float(hh["x"])`
+or `hh["y"] == "yes"`, and `static_key_spec` turns those uses into a type and
+choices when they agree. Anything else is left to the code model.
+"""
+
+from typing import Optional
+import ast
+
+# String methods that keep a value a string
+NORMALIZERS = {"lower", "upper", "strip", "casefold", "title"}
+CASTS = {"int", "float"}
+YES_NO = {"yes", "no"}
+
+
+class KeyUse:
+    """
+    How a checker uses one key.
+
+    casts: `int`/`float` calls applied to the value
+    literals: string literals the value is compared with, in order
+    other: whether any use is neither of the above
+    per_member: whether the key is looked up on a member, as in `hh[i]["key"]`
+    """
+
+    def __init__(self):
+        self.casts = set()
+        self.literals = []
+        self.other = False
+        self.per_member = False
+
+    def add_literals(self, literals):
+        for literal in literals:
+            if literal not in self.literals:
+                self.literals.append(literal)
+
+
+def _str_constant(node) -> Optional[str]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+def _str_collection(node) -> Optional[list[str]]:
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        values = [_str_constant(x) for x in node.elts]
+        if values and all(x is not None for x in values):
+            return values
+    return None
+
+
+def _is_number(text: str) -> bool:
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+
+def _member_lookup(node, members: set[str]) -> bool:
+    """Whether `node`, the value being subscripted, is a household member."""
+    if isinstance(node, ast.Subscript):
+        return _str_constant(node.slice) is None
+    return isinstance(node, ast.Name) and node.id in members
+
+
+def analyze_checker(code: str) -> dict[str, KeyUse]:
+    """Uses of every string-literal key in `code`."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return {}
+    parents = {}
+    stores = {}
+    for node in ast.walk(tree):
+        for child in ast.iter_child_nodes(node):
+            parents[child] = node
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            stores[node.id] = stores.get(node.id, 0) + 1
+
+    # Names assigned once, from a key lookup or from a member
+    aliases = {}
+    members = set()
+    for node in ast.walk(tree):
+        if not (
+            isinstance(node, ast.Assign)
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name)
+            and stores[node.targets[0].id] == 1
+            and isinstance(node.value, ast.Subscript)
+        ):
+            continue
+        name = node.targets[0].id
+        key = _str_constant(node.value.slice)
+        if key is None:
+            members.add(name)
+        else:
+            aliases[name] = key
+
+    uses = {}
+
+    def classify(node, use):
+        # Look through string normalization such as `.lower()`
+        while (
+            isinstance(parents.get(node), ast.Attribute)
+            and parents[node].attr in NORMALIZERS
+            and isinstance(parents.get(parents[node]), ast.Call)
+            and not parents[parents[node]].args
+        ):
+            node = parents[parents[node]]
+        parent = parents.get(node)
+        if (
+            isinstance(parent, ast.Call)
+            and isinstance(parent.func, ast.Name)
+            and parent.func.id in CASTS
+            and parent.args == [node]
+        ):
+            use.casts.add(parent.func.id)
+        elif isinstance(parent, ast.Compare) and len(parent.ops) == 1:
+            op = parent.ops[0]
+            if parent.left is node:
+                other = parent.comparators[0]
+                if isinstance(op, (ast.Eq, ast.NotEq)) and _str_constant(other):
+                    use.add_literals([_str_constant(other)])
+                elif isinstance(op, (ast.In, ast.NotIn)) and _str_collection(other):
+                    use.add_literals(_str_collection(other))
+                else:
+                    use.other = True
+            elif isinstance(op, (ast.Eq, ast.NotEq)) and _str_constant(parent.left):
+                use.add_literals([_str_constant(parent.left)])
+            else:
+                use.other = True
+        elif not (
+            isinstance(parent, ast.Assign)
+            and isinstance(parent.targets[0], ast.Name)
+            and parent.targets[0].id in aliases
+        ):
+            use.other = True
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript) and _str_constant(node.slice) is not None:
+            use = uses.setdefault(node.slice.value, KeyUse())
+            if not isinstance(node.ctx, ast.Load):
+                use.other = True
+                continue
+            use.per_member = use.per_member or _member_lookup(node.value, members)
+            classify(node, use)
+        elif (
+            isinstance(node, ast.Name)
+            and isinstance(node.ctx, ast.Load)
+            and node.id in aliases
+        ):
+            classify(node, uses.setdefault(aliases[node.id], KeyUse()))
+    return uses
+
+
+def static_key_spec(use: KeyUse) -> tuple[Optional[str], Optional[list[str]]]:
+    """
+    The type and choices a key's uses imply. The type is None when the uses
+    are ambiguous. Choices are only given for yes/no keys, since comparisons
+    with other literals rarely list every value.
+    """
+    if use.other or (use.casts and use.literals):
+        return None, None
+    if use.casts:
+        return (next(iter(use.casts)), None) if len(use.casts) == 1 else (None, None)
+    # Comparing with "0" or "3.5" suggests a number stored as text
+    if not use.literals or any(_is_number(x) for x in use.literals):
+        return None, None
+    if {x.lower() for x in use.literals} <= YES_NO:
+        return "choice", ["yes", "no"]
+    return "choice", None
@@ -0,0 +1,198 @@
+"""Resumable execution of generated eligibility checkers.
+
+`ResumableExecution` runs a checker on its own thread and suspends it at each
+missing key until the answer is stored, instead of rerunning it from the top.
+Checkers with try blocks use `RerunExecution`; `execute_checker` picks one.
+"""
+
+from typing import Optional
+import ast
+import inspect
+import linecache
+import queue
+import sys
+import textwrap
+import threading
+import traceback
+
+
+class ImaginaryDataKeyError(Exception):
+    pass
+
+
+class CheckerCancelled(BaseException):
+    """Unwinds a suspended checker whose execution was closed."""
+
+    pass
+
+
+# The execution whose checker runs on the current thread, if any
+_state = threading.local()
+_CONTINUE = object()
+_CANCEL = object()
+
+
+def current_execution() -> Optional["ResumableExecution"]:
+    return getattr(_state, "execution", None)
+
+
+def find_line(frames, key, filename) -> Optional[str]:
+    """The innermost line of `filename` among `frames` that mentions `key`."""
+    for frame in frames[::-1]:
+        if frame.filename == filename:
+            if key in frame.line:
+                return frame.line
+    return None
+
+
+class PendingKey:
+    """
+    A missing key the checker is waiting for.
+
+    key, member_idx: as in `ImaginaryDataKeyError`
+    line: the checker line that looks the key up, or None if no line mentions it
+    stack: source lines from the checker call down to the lookup
+    """
+
+    def __init__(self, key, member_idx, line: Optional[str], stack: list[str]):
+        self.key = key
+        self.member_idx = member_idx
+        self.line = line
+        self.stack = stack
+
+    def __repr__(self):
+        return f"PendingKey({self.key!r}, member_idx={self.member_idx!r}, line={self.line!r})"
+
+
+class RerunExecution:
+    """Runs the checker from the top after every answer."""
+
+    def __init__(self, fn, hh, filename: str):
+        self.fn = fn
+        self.hh = hh
+        self.filename = filename
+        self.result = None
+
+    def resume(self) -> Optional[PendingKey]:
+        """
+        Run the checker. Return the key it is missing, or None once it has
+        finished and `result` is set. Other errors of the checker are raised.
+        """
+        try:
+            self.result = self.fn(hh=self.hh)
+            return None
+        except ImaginaryDataKeyError as e:
+            frames = traceback.extract_tb(e.__traceback__)
+            return PendingKey(
+                key=e.args[0],
+                member_idx=e.args[1],
+                line=find_line(frames, e.args[0], self.filename),
+                stack=[frame.line for frame in frames],
+            )
+
+    def close(self):
+        pass
+
+
+class ResumableExecution:
+    """Runs the checker once, suspending it at every missing key."""
+
+    def __init__(self, fn, hh, filename: str):
+        self.fn = fn
+        self.hh = hh
+        self.filename = filename
+        self.result = None
+        self._to_checker = queue.Queue(maxsize=1)
+        self._to_driver = queue.Queue(maxsize=1)
+        self._thread = None
+        self._finished = False
+
+    def _run(self):
+        _state.execution = self
+        try:
+            message = ("done", self.fn(hh=self.hh))
+        except CheckerCancelled:
+            return
+        except Exception as e:
+            message = ("error", e)
+        finally:
+            _state.execution = None
+        self._to_driver.put(message)
+
+    def resume(self) -> Optional[PendingKey]:
+        """
+        Start or continue the checker. Return the key it is missing, or None
+        once it has finished and `result` is set. Errors of the checker are
+        raised here.
+        """
+        assert not self._finished
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        else:
+            self._to_checker.put(_CONTINUE)
+        kind, value = self._to_driver.get()
+        if kind == "pending":
+            return value
+        self._finished = True
+        self._thread.join()
+        if kind == "error":
+            raise value
+        self.result = value
+        return None
+
+    def suspend(self, data, key):
+        """
+        Called on the checker thread by `data` for a missing `key`. Waits for
+        the driver to store the answer, then looks the key up again.
+        """
+        stack = []
+        frame = sys._getframe(1)
+        while (
+            frame is not None and frame.f_code is not ResumableExecution._run.__code__
+        ):
+            stack.append(frame)
+            frame = frame.f_back
+        frames = [
+            traceback.FrameSummary(
+                f.f_code.co_filename,
+                f.f_lineno,
+                f.f_code.co_name,
+                line=linecache.getline(f.f_code.co_filename, f.f_lineno).strip(),
+            )
+            for f in reversed(stack)
+        ]
+        pending = PendingKey(
+            key=key,
+            member_idx=data.index,
+            line=find_line(frames, key, self.filename),
+            stack=[frame.line for frame in frames],
+        )
+        self._to_driver.put(("pending", pending))
+        if self._to_checker.get() is _CANCEL:
+            raise CheckerCancelled()
+        return data._get(key)
+
+    def close(self):
+        """Unwind the checker if it is still waiting for a key."""
+        if self._thread is not None and not self._finished:
+            self._finished = True
+            self._to_checker.put(_CANCEL)
+            self._thread.join()
+
+
+def can_resume(fn) -> bool:
+    """Whether `fn` can be suspended without changing its result."""
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(fn)))
+    except (OSError, TypeError, SyntaxError):
+        return False
+    try_nodes = (ast.Try, getattr(ast, "TryStar", ast.Try))
+    return not any(isinstance(node, try_nodes) for node in ast.walk(tree))
+
+
+def execute_checker(fn, hh, filename: str):
+    """An execution of checker `fn` on `hh`, defined in `filename`."""
+    if can_resume(fn):
+        return ResumableExecution(fn, hh, filename)
+    return RerunExecution(fn, hh, filename)
@@ -0,0 +1,197 @@
+"""Lark grammar for generated eligibility checkers, used to constrain `code_gen`
+decoding to a single Python function definition.
+
+Outlines needs an LALR(1) grammar, so indentation levels up to `max_depth` are
+spelled out as separate rules. `strict=True` also forbids `.get(`, f-strings
+and try blocks, as `CodeBot.gen_checker_prompt` asks.
+"""
+
+import keyword
+import re
+import string
+
+INDENT = "    "
+# Keywords usable as names in the grammar; all others are reserved
+NAME_KEYWORDS = {"True", "False", "None", "pass", "break", "continue"}
+IDENTIFIER_START = string.ascii_letters + "_"
+IDENTIFIER_CHARS = IDENTIFIER_START + string.digits
+
+
+def _char_class(chars) -> str:
+    return "[" + "".join(re.escape(c) for c in sorted(chars)) + "]"
+
+
+def identifier_excluding(words) -> str:
+    """
+    Regex matching any Python identifier except `words`. Lookaheads are not
+    available to outlines, so the complement is spelled out over a trie.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for c in word:
+            node = node.setdefault(c, {})
+        node[""] = {}
+
+    def continuation(node, chars, depth) -> str:
+        children = sorted(c for c in node if c)
+        others = set(chars) - set(children)
+        parts = []
+        if others:
+            parts.append(_char_class(others) + r"\w*")
+        for c in children:
+            parts.append(re.escape(c) + continuation(node[c], IDENTIFIER_CHARS, 1))
+        body = "(?:" + "|".join(parts) + ")"
+        if depth and "" not in node:
+            # The prefix read so far is itself a valid identifier
+            return body + "?"
+        return body
+
+    return continuation(trie, IDENTIFIER_START, 0)
+
+
+def _blank_lines() -> str:
+    """Blank and comment-only lines, folded into the next line's indent."""
+    return r"(?:\n *(?:#[^\n]*)?)*"
+
+
+def _indented(depth: int, text: str = "") -> str:
+    return _blank_lines() + r"\n" + INDENT * depth + text
+
+
+def checker_grammar(
+    function_name: str = "check_eligibility", max_depth: int = 8, strict: bool = False
+) -> str:
+    """
+    Lark grammar accepting exactly one definition of `function_name` whose
+    blocks nest at most `max_depth` levels deep.
+    """
+    assert max_depth >= 1
+    reserved = set(keyword.kwlist) - NAME_KEYWORDS
+    terminals = {
+        "DEF_MAIN": rf"def +{re.escape(function_name)} *",
+        "NAME": identifier_excluding(reserved) + " *",
+        # `.get(` lookups hide missing keys from the conversation
+        "ATTR": identifier_excluding(reserved | {"get"} if strict else reserved) + " *",
+        "NUMBER": r"(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)? *",
+        "STRING": (r"" if strict else r"(?:[rRbBuUfF]{1,2})?")
+        + r"(?:\"(?:[^\"\\\n]|\\.)*\"|'(?:[^'\\\n]|\\.)*') *",
+        "LONG_STRING": r"\"\"\"(?:[^\"\\]|\\.|\"[^\"\\]|\"\"[^\"\\])*\"\"\" *",
+        "END": r"\n+",
+        "COMMENT": r"#[^\n]*",
+        "IF": r"if +",
+        "ELSE": r"else +",
+        "FOR": r"for +",
+        "IN": r"in +",
+        "NOT": r"not +",
+        "AND": r"and +",
+        "OR": r"or +",
+        "IS": r"is +",
+        "AS": r"as +",
+        "DEF": r"def +",
+        "RETURN": r"return +",
+        "RAISE": r"raise +",
+        "WHILE": r"while +",
+        "LAMBDA": r"lambda +",
+        "TRY": r"try *: *",
+        "LPAR": r"\( *",
+        "RPAR": r"\) *",
+        "LSQB": r"\[ *",
+        "RSQB": r"\] *",
+        "LBRACE": r"\{ *",
+        "RBRACE": r"\} *",
+        "COLON": r": *",
+        "COMMA": r", *",
+        "DOT": r"\. *",
+        "ARROW": r"-> *",
+        "EQUAL": r"= *",
+        # Longer operators first, for lexers that take the first alternative
+        "AUGASSIGN": r"(?://|\+|-|\*|/|%)= *",
+        "COMP": r"(?:==|>=|<=|!=|<|>) *",
+        "PLUS": r"\+ *",
+        "MINUS": r"- *",
+        "STAR": r"\* *",
+        "DSTAR": r"\*\* *",
+        "MULOP": r"(?://|/|%) *",
+    }
+    for k in range(1, max_depth + 1):
+        terminals[f"NL_{k}"] = _indented(k)
+        terminals[f"ELIF_{k}"] = _indented(k, "elif +")
+        terminals[f"ELSE_{k}"] = _indented(k, "else *: *")
+        terminals[f"EXCEPT_{k}"] = _indented(k, "except +")
+        terminals[f"EXCEPT_BARE_{k}"] = _indented(k, "except *: *")
+        terminals[f"FINALLY_{k}"] = _indented(k, "finally *: *")
+
+    rules = [
+        "start: main_def END?",
+        "main_def: DEF_MAIN LPAR [params] RPAR [ARROW test] COLON block_1",
+        "params: param (COMMA param)* [COMMA]",
+        "param: NAME [COLON test] [EQUAL test]",
+        "simple_stmt: expr_stmt | RETURN testlist | RAISE test",
+        "expr_stmt: testlist (EQUAL testlist)* | testlist AUGASSIGN testlist",
+        "?test: or_test | or_test IF or_test ELSE test | lambdef",
+        "lambdef: LAMBDA NAME (COMMA NAME)* COLON test",
+        "?or_test: and_test (OR and_test)*",
+        "?and_test: not_test (AND not_test)*",
+        "?not_test: NOT not_test | comparison",
+        "?comparison: expr (comp_op expr)*",
+        "comp_op: COMP | IN | NOT IN | IS | IS NOT",
+        "?expr: term ((PLUS | MINUS) term)*",
+        "?term: factor ((STAR | MULOP) factor)*",
+        "?factor: (PLUS | MINUS) factor | power",
+        "?power: atom_expr [DSTAR factor]",
+        "?atom_expr: atom_expr LPAR [arguments] RPAR"
+        " | atom_expr LSQB subscript RSQB"
+        " | atom_expr DOT ATTR"
+        " | atom",
+        "?atom: LPAR [tuple_or_comp] RPAR"
+        " | LSQB [tuple_or_comp] RSQB"
+        " | LBRACE [dict_or_set] RBRACE"
+        " | NAME | NUMBER | string+",
+        "string: STRING | LONG_STRING",
+        "subscript: test | [test] COLON [test]",
+        "arguments: argument (COMMA argument)* [COMMA] | test comp_for",
+        "argument: test | NAME EQUAL test | STAR test | DSTAR test",
+        "tuple_or_comp: test (comp_for | (COMMA test)* [COMMA])",
+        "dict_or_set: test COLON test (comp_for | (COMMA test COLON test)* [COMMA])"
+        " | test (comp_for | (COMMA test)* [COMMA])",
+        "comp_for: FOR exprlist IN or_test [comp_iter]",
+        "?comp_iter: comp_for | comp_if",
+        "comp_if: IF or_test [comp_iter]",
+        "exprlist: expr (COMMA expr)* [COMMA]",
+        "testlist: test (COMMA test)* [COMMA]",
+    ]
+    for k in range(1, max_depth + 1):
+        rules.append(f"block_{k}: (NL_{k} stmt_{k})+")
+        if k == max_depth:
+            rules.append(f"stmt_{k}: simple_stmt")
+            continue
+        inner = f"block_{k + 1}"
+        compound = [f"if_{k}", f"for_{k}", f"while_{k}", f"def_{k}"]
+        rules += [
+            f"if_{k}: IF test COLON {inner} (ELIF_{k} test COLON {inner})*"
+            f" [ELSE_{k} {inner}]",
+            f"for_{k}: FOR exprlist IN testlist COLON {inner}",
+            f"while_{k}: WHILE test COLON {inner}",
+            f"def_{k}: DEF NAME LPAR [params] RPAR [ARROW test] COLON {inner}",
+        ]
+        if not strict:
+            compound.append(f"try_{k}")
+            rules += [
+                f"try_{k}: TRY {inner} except_{k}+ [FINALLY_{k} {inner}]"
+                f" | TRY {inner} FINALLY_{k} {inner}",
+                f"except_{k}: EXCEPT_BARE_{k} {inner}"
+                f" | EXCEPT_{k} test [AS NAME] COLON {inner}",
+            ]
+        rules.append(f"stmt_{k}: simple_stmt | " + " | ".join(compound))
+
+    lines = rules + [""]
+    for name, pattern in terminals.items():
+        # Keywords before NAME, docstrings before the strings they start with
+        priority = {"NAME": "", "ATTR": "", "END": "", "LONG_STRING": ".3"}.get(
+            name, ".2"
+        )
+        pattern = pattern.replace("/", r"\/")
+        lines.append(f"{name}{priority}: /{pattern}/")
+    lines += ["", "%ignore COMMENT"]
+    return "\n".join(lines) + "\n"
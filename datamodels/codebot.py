@@ -20,15 +20,44 @@ import json
 
 from utils.utils import extract_function_definitions, remove_raise_statements, RoleEnum
 from datamodels.chatbot import ChatBot
+from datamodels.checker_grammar import checker_grammar
+from datamodels.checker_execution import (
+    ImaginaryDataKeyError,
+    execute_checker,
+    find_line,
+)
+from datamodels.imaginary_data import HOUSEHOLD_SIZE_KEY, ImaginaryData
+from datamodels.sandbox import CheckerError, CheckerSandbox
+from datamodels.key_registry import KeyRegistry, checker_hash, member_pattern
+from datamodels.answer_extraction import extract_answer, is_hedged
+from datamodels.checker_analysis import analyze_checker, static_key_spec
+from datamodels.symbolic import required_household_keys
+from datamodels.synthesis import (
+    RateLimiter,
+    key_specs_schema,
+    ordered_map,
+    parse_key_specs,
+)
 from utils.utils import hist_to_str
 from typing import Optional
 from copy import deepcopy
+from collections import Counter
 
 np.random.seed(0)
-# list_regex = r'(\["[^"]+"(?: *, *"[^"]+")+\])'
-list_regex = (
-    r'\{\"options\": (\["[^"]+"(?: *, *"[^"]+")+\])\}'  # {"options": ["a", "b", "c"]}
-)
+# {"options": ["a", "b", "c"]}
+options_schema = {
+    "type": "object",
+    "properties": {
+        "options": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+    },
+    "required": ["options"],
+    "additionalProperties": False,
+}
+
+
+def clean_choices(choices):
+    # strip quotes and escape every '$' that is not already escaped
+    return [re.sub(r"(?<!\\)\$", r"\\$", x.strip("\"'")) for x in choices]
 
 
 def convert_keys_to_int(d):
@@ -49,60 +78,11 @@ class ConstraintType:
     choice = "choice"
     regex = "regex"
     types = "types"
+    json_schema = "json_schema"
+    cfg = "cfg"
     none = "none"
 
 
-class ImaginaryDataKeyError(Exception):
-    pass
-
-
-class ImaginaryData:
-    def __init__(self, index=None):
-        super().__init__()
-        self.members = {}
-        self.tl_data = {}  # top level data i.e. household data
-        self.index = index  # index of the current member
-
-    def get(self, key, default=None):
-        return self._get(key)
-
-    def _get(self, key):
-        if isinstance(key, int) or (isinstance(key, str) and key.isdigit()):
-            int_key = int(key)
-            if int_key in self.members:
-                return self.members[int_key]
-            else:
-                if len(self.members) > 100:
-                    print("infinite loop caused too many members")
-                    raise NotImplementedError
-                self.members[int_key] = ImaginaryData(index=int_key)
-                return self.members[int_key]
-        elif key in self.tl_data:
-            return self.tl_data[key]
-        else:
-            raise ImaginaryDataKeyError(key, self.index)
-
-    def __setitem__(self, key, value):
-        self.tl_data[key] = value
-
-    def __getitem__(self, key):
-        return self._get(key)
-
-    def __eq__(self, other):
-        if not isinstance(other, ImaginaryData):
-            return False
-        return self.tl_data == other.tl_data and self.members == other.members
-
-    def __contains__(self, item):
-        return item in self.tl_data or item in self.members
-
-    def __len__(self):
-        return int(self.get("number of household members"))
-
-    # def __len__(self):
-    # raise KeyError("number of family members")
-
-
 class CodeBot(ChatBot):
     gen_checker_prompt = """{attempt_no}\nEligibility Requirements:\n{eligibility_requirement}\n\nWrite a python function called `check_eligibility` that takes a dictionary `hh` containing relevant information and determines user eligibility. hh is a special dictionary connected to a language model that is conversing with the user. Any time it does not contain a key, it will determine that information from the user. As a result here are some requirements for interacting with `hh`:
     - DO NOT use `dict.get()` anywhere in the code. Key errors will be handled elsewhere.
@@ -138,10 +118,28 @@ class CodeBot(ChatBot):
     # get_choices_prompt = """Context:\n{eligibility_requirements}\n\nCode:\n{code}\n\nTraget key:\n{key}\n\nQuestion: Given the code and context above, what are the possible choices of {key}? Return ONLY the list of possible values."""
     get_values_prompt = """Context:{eligibility_requirements}\n\nCode:\n{code}\n\nTraget key:\n{key}\n\nQuestion: Given the code and context above, what are the possible values of {key}? Return ONLY a JSON dict with they key "options" and the value being a list of possible values in a list of strings. For example, return `{{"options": ["a", "b", "c"]}}`."""
 
+    get_key_specs_prompt = """Context:\n{eligibility_requirements}\n\nCode:\n{code}\n\nTarget keys:\n{keys}\n\nQuestion: Given the code and context above, do you expect each target key to be an integer ("int"), a float ("float"), or one choice from a set of strings ("choice")? For choice keys, also list the possible values. Return ONLY a JSON dict mapping every target key to its type and options, with an empty options list for int and float keys. For example, return `{{"age": {{"type": "int", "options": []}}, "student": {{"type": "choice", "options": ["yes", "no"]}}}}`."""
+
     extract_value_from_ans_prompt = """Context:\n{eligibility_requirements}\n\nLine:\n```{line}```\n\nWe need to extract the value of {key} from the following dialog:\n\nQuestion: {cq}\n\nAnswer:\n{answer}\n\nWhat should we set as the value of {key}? Return ONLY the value."""
     key_error_prompt = """Context:\n{eligibility_requirements}\n\nLine:\n```{line}```\n\nWe need to determine what value of {key} should be stored in the `hh` dictionary. Ask a question to the user that would get this value. For example, for age_i, ask "What is the age of person i?". Return ONLY the question."""
     response_not_found_prompt = """Context:\n{eligibility_requirements}\n\nLine:\n```{line}```\n\nWe need to determine what value of {key} should be stored in the `hh` dictionary. Ask a question to the user that would get this value. For example, for age_i, ask "What is the age of person i?". Return ONLY the question. The user responded "{answer}" to the previous question, which was"{cq}", so try to clarify the communication breakdown."""
 
+    answer_and_value_prompt = """Context:\n{eligibility_requirements}\n\nLine:\n```{line}```\n\nWe need to extract the value of {key} from the following dialog:\n\nQuestion: {cq}\n\nAnswer:\n{answer}\n\nDoes the answer contain an answer to the question, and what should we set as the value of {key}? Return ONLY a JSON dict with the keys "answered" (true or false) and "value"."""
+
+    members_key_error_prompt = """Context:\n{eligibility_requirements}\n\nLine:\n```{line}```\n\nWe need to determine the value of {key} for {count} members of the household ({members}), where member 0 is the user. Ask one question to the user that would get this value for all of them at once. For example, for age_i, ask "What are the ages of everyone in your household?". Return ONLY the question."""
+    member_values_prompt = """Context:\n{eligibility_requirements}\n\nLine:\n```{line}```\n\nWe need to extract the value of {key} for each of these household members from the following dialog: {members}. Member 0 is the user.\n\nQuestion: {cq}\n\nAnswer:\n{answer}\n\nDoes the answer give the value for every one of them, and what are the values, in the order listed? Return ONLY a JSON dict with the keys "answered" (true or false) and "values"."""
+    # Members asked about in one question at most; the rest are asked one at a
+    # time. Keeps the per-member answer within the extract_member_values
+    # budget, although ImaginaryData allows up to 100 members
+    max_vectorized_members = 20
+
+    household_keys_error_prompt = """Context:\n{eligibility_requirements}\n\nLine:\n```{line}```\n\nWe need to determine the values of these keys: {keys}. Ask one question to the user that would get all of them at once. Return ONLY the question."""
+    household_values_prompt = """Context:\n{eligibility_requirements}\n\nLine:\n```{line}```\n\nWe need to extract the values of these keys from the following dialog: {keys}.\n\nQuestion: {cq}\n\nAnswer:\n{answer}\n\nWhat should we set as the value of each key? Use null for keys the answer does not give. Return ONLY a JSON dict with one entry per key."""
+    # Household keys asked for in one question at most
+    max_batched_keys = 4
+    # Bounds on the symbolic execution that finds them
+    batch_enumeration_limits = {"max_paths": 64, "max_steps": 10_000}
+
     did_response_contain_answer_prompt = """Context:\nQuestion: {cq}\n\nResponse: {answer}\n\nDoes the response contain an answer to the question? Answer ONLY yes or no."""
     # type_error_prompt = """Context:\n{eligibility_requirements}\n\nDialog:{dialog}\n\nLine:\n```{line}```\n\nThe string value, {value}, cannot be cast to type {target_type}. What string can we use instead that can be cast to type {target_type}? Return ONLY the value."""
     # str_error_prompt = """Context:\n{eligibility_requirements}\n\nDialog:{dialog}\n\nLine:\n```{line}```\n\nThe string value, {value}, is not one of {target_options}. Which option of {target_options} is most similar to {value}? Return ONLY the value."""
@@ -181,7 +179,66 @@ class CodeBot(ChatBot):
         max_code_gen_attempts: int = 1,
         max_code_rewrite_attempts: int = 0,
         data_user_index: int = 0,  # user data index used for tracking progress
+        code_gen_grammar: Optional[str] = None,
+        code_gen_samples: int = 1,
+        code_gen_parallelism: int = 1,
+        concurrent_checkers: bool = False,
+        code_gen_rate_limit: Optional[float] = None,
+        key_inference: str = "per_key",
+        key_batch_size: int = 12,
+        static_key_inference: bool = False,
+        sandbox: Optional[CheckerSandbox] = None,
+        key_registry: Optional[KeyRegistry] = None,
+        precompute_questions: bool = False,
+        local_answer_extraction: bool = False,
+        vectorize_members: bool = False,
+        batch_household_keys: bool = False,
     ):
+        """
+        code_gen_grammar: constrain checker generation to a valid definition of
+            `check_eligibility` ("syntax"), additionally without `.get(`,
+            f-strings or try blocks ("strict"), or not at all (None). Only
+            enforced for models served by the HF server.
+        code_gen_samples: checker candidates drawn per code model request. A
+            failed attempt moves on to the next candidate instead of asking
+            again, so up to this many attempts cost one round trip.
+        code_gen_parallelism: key type and choice requests in flight at once
+            while building the checkers. Results are merged in key order, so
+            the generated module is the same for any value.
+        concurrent_checkers: also generate up to `code_gen_parallelism`
+            checkers at once. Each prompt then lists only the keys known before
+            the batch rather than those of the programs before it, so checkers
+            may name the same value differently and the module can differ from
+            a sequential run. Key types and choices are merged in program order.
+        code_gen_rate_limit: maximum code model requests per second while
+            building the checkers, or None for no limit.
+        key_inference: infer the type and choices of each key with separate
+            requests ("per_key") or those of up to `key_batch_size` keys with
+            one structured request ("batched"). Invalid entries of a batch are
+            asked again together, then one key at a time.
+        static_key_inference: take key types and yes/no choices from the
+            checker code where its uses are unambiguous, and ask the code
+            model only for the rest. Saved calls are counted per program in
+            `static_calls_saved`.
+        sandbox: worker processes to run generated checkers and their unit
+            tests in, with timeouts and memory limits. None runs them in this
+            process.
+        key_registry: questions, types and choices of checker keys kept
+            across households; known keys skip the model.
+        precompute_questions: phrase the questions for all literal keys of
+            each checker into `key_registry` when it is synthesized.
+        local_answer_extraction: parse numbers, yes/no and choices from user
+            answers locally, and ask the chat model whether the question was
+            answered and for the value in one request only when parsing is
+            ambiguous. Outcomes are counted in `extraction_stats`.
+        vectorize_members: when a checker reads a member key and the
+            household size is known, ask for that key of every member missing
+            it in one question and fill all their slots from the answer.
+        batch_household_keys: when a checker reads a household key, find the
+            other household keys it reads whatever the remaining answers are
+            by symbolic execution, and ask for up to `max_batched_keys` of
+            them in one question.
+        """
         super().__init__(
             chat_model_id=chat_model_id,
             no_of_programs=no_of_programs,
@@ -201,6 +258,33 @@ class CodeBot(ChatBot):
         self.total_questions = 0
         self.total_programs_completed = 0
         self.data_user_index = data_user_index
+        assert code_gen_grammar in (None, "syntax", "strict")
+        self.checker_grammar = (
+            checker_grammar(strict=code_gen_grammar == "strict")
+            if code_gen_grammar
+            else None
+        )
+        assert code_gen_samples >= 1
+        self.code_gen_samples = code_gen_samples
+        assert code_gen_parallelism >= 1
+        self.code_gen_parallelism = code_gen_parallelism
+        self.concurrent_checkers = concurrent_checkers
+        self.rate_limiter = RateLimiter(code_gen_rate_limit)
+        assert key_inference in ("per_key", "batched")
+        assert key_batch_size >= 1
+        self.key_inference = key_inference
+        self.key_batch_size = key_batch_size
+        self.static_key_inference = static_key_inference
+        self.static_calls_saved = Counter()
+        self.sandbox = sandbox
+        self.key_registry = key_registry
+        self.precompute_questions = precompute_questions
+        # program name -> registry hash of its checker
+        self.checker_hashes = {}
+        self.local_answer_extraction = local_answer_extraction
+        self.extraction_stats = Counter()
+        self.vectorize_members = vectorize_members
+        self.batch_household_keys = batch_household_keys
 
     def pre_conversation(
         self,
@@ -226,352 +310,502 @@ class CodeBot(ChatBot):
         # ]
         # Optional code using edge_case_prompt would go here
 
-    def _update_key_types_and_choices(
-        self, input_keys, desc, clean_checker_output, code_model_id, use_cache
-    ):
-        # Identify keys used in the eligibility checker
-        # this_program_used_keys = re.findall(r'hh\["(.*?)"\]', clean_checker_output)
-
-        # drop hh to handle imaginary data not called hh
-        input_keys = input_keys
+    def _infer_key(self, key, desc, clean_checker_output, code_model_id, use_cache):
+        """The type of `key` and, for choice keys, its choices."""
+        args = (desc, clean_checker_output, code_model_id, use_cache)
+        guessed_type = self._infer_key_type(key, *args)
+        if guessed_type != "choice":
+            return guessed_type, None
+        return guessed_type, self._infer_key_choices(key, *args)
 
-        # Infer key types
-        this_program_key_types = {}
-        for key in input_keys:
-            key_type_prompt = [
+    def _infer_key_type(
+        self, key, desc, clean_checker_output, code_model_id, use_cache
+    ):
+        # Infer the key type
+        key_type_prompt = [
+            {
+                "role": "user",
+                "content": self.get_type_prompt.format(
+                    eligibility_requirements=desc,
+                    code=clean_checker_output,
+                    key=key,
+                ),
+            }
+        ]
+        self.rate_limiter.acquire()
+        guessed_type = self.lm_api.forward(
+            key_type_prompt,
+            chat_model_id=code_model_id,
+            use_cache=use_cache,
+            logging_role="type_gen",
+            constraints=["int", "float", "choice"],
+            constraint_type="choice",
+        ).strip()
+        # find the last int/float/choice in case gpt fucks up
+        guessed_type = re.findall(r"int|float|choice", guessed_type)[-1]
+        assert guessed_type in ["int", "float", "choice"]
+        # replace all '$' with '\$` as long as the $ is not already escaped
+        # guessed_type = re.sub(r"[^\\](\$)")
+        return guessed_type
+
+    def _infer_key_choices(
+        self, key, desc, clean_checker_output, code_model_id, use_cache
+    ):
+        # Determine possible choices
+        self.rate_limiter.acquire()
+        response_raw = self.lm_api.forward(
+            [
                 {
                     "role": "user",
-                    "content": self.get_type_prompt.format(
+                    "content": self.get_values_prompt.format(
                         eligibility_requirements=desc,
                         code=clean_checker_output,
                         key=key,
                     ),
                 }
-            ]
-            guessed_type = self.lm_api.forward(
-                key_type_prompt,
-                chat_model_id=code_model_id,
-                use_cache=use_cache,
-                logging_role="type_gen",
-                constraints=["int", "float", "choice"],
-                constraint_type="choice",
-            ).strip()
-            # find the last int/float/choice in case gpt fucks up
-            guessed_type = re.findall(r"int|float|choice", guessed_type)[-1]
-            assert guessed_type in ["int", "float", "choice"]
-            # replace all '$' with '\$` as long as the $ is not already escaped
-            # guessed_type = re.sub(r"[^\\](\$)")
-            this_program_key_types[key] = guessed_type
-
-        # Determine possible choices
-        new_choices = {
-            k: {} for k, v in this_program_key_types.items() if v == "choice"
-        }
-        for c in new_choices:
-            if code_model_id and code_model_id.startswith("gpt"):
-                response_dict_raw = self.lm_api.forward(
-                    [
-                        {
-                            "role": "user",
-                            "content": self.get_values_prompt.format(
-                                eligibility_requirements=desc,
-                                code=clean_checker_output,
-                                key=c,
-                            ),
-                        }
-                    ],
-                    chat_model_id=code_model_id,
-                    use_cache=use_cache,
-                    logging_role="choice_gen",
-                    # openai_response_format=ResponseFormat.options.value,
-                    openai_response_format={"type": "json_object"},
-                )
-                response_dict = json.loads(response_dict_raw)
-                choices = response_dict.get("options", [])
-            elif code_model_id and code_model_id.startswith("claude"):
-
-                def _is_valid(choices):
-                    if choices is None:
-                        return False
-                    if len(choices) == 0:
-                        return False
-                    for c in choices:
-                        if not isinstance(c, str):
-                            return False
-                    return True
+            ],
+            chat_model_id=code_model_id,
+            use_cache=use_cache,
+            logging_role="choice_gen",
+            constraint_type=ConstraintType.json_schema,
+            constraints=options_schema,
+        )
+        choices = json.loads(response_raw)["options"]
+        return clean_choices(choices)
 
-                choices = None
-                z = 0
-                while not _is_valid(choices):
-                    if z > 10:
-                        print("too many attempts")
-                        sys.exit(1)
-                    print(f"attempt no {z}")
-                    response_dict_raw = self.lm_api.forward(
-                        [
-                            {
-                                "role": "user",
-                                "content": f"attempt no {z}\n\n"
-                                + self.get_values_prompt.format(
-                                    eligibility_requirements=desc,
-                                    code=clean_checker_output,
-                                    key=c,
-                                ),
-                            }
-                        ],
-                        chat_model_id=code_model_id,
-                        use_cache=use_cache,
-                        logging_role="choice_gen",
-                        claude_tool_def=[
-                            {
-                                "name": "define_values",
-                                "description": "Define the possible values for a key",
-                                "input_schema": {
-                                    "type": "object",
-                                    "properties": {
-                                        "options": {
-                                            "type": "array",
-                                            "description": "The possible values for the key",
-                                            "items": {
-                                                "type": "string",
-                                            },
-                                        },
-                                    },
-                                    "required": ["options"],
-                                },
-                            }
-                        ],
-                    )
-                    # Handle Claude tool call response more robustly
-                    response_dict = json.loads(response_dict_raw)
-                    choices = response_dict.get("options", [])
-                    z += 1
+    def _ask_key_specs(
+        self, keys, desc, clean_checker_output, code_model_id, use_cache
+    ):
+        """Valid (type, choices) of `keys` from one request, and the invalid keys."""
+        self.rate_limiter.acquire()
+        response_raw = self.lm_api.forward(
+            [
+                {
+                    "role": "user",
+                    "content": self.get_key_specs_prompt.format(
+                        eligibility_requirements=desc,
+                        code=clean_checker_output,
+                        keys="\n".join(keys),
+                    ),
+                }
+            ],
+            chat_model_id=code_model_id,
+            use_cache=use_cache,
+            logging_role="key_spec_gen",
+            constraint_type=ConstraintType.json_schema,
+            constraints=key_specs_schema(keys),
+        )
+        valid, invalid = parse_key_specs(response_raw, keys)
+        for key, (key_type, choices) in valid.items():
+            if choices is not None:
+                valid[key] = (key_type, clean_choices(choices))
+        return valid, invalid
+
+    def _infer_key_batch(
+        self, keys, desc, clean_checker_output, code_model_id, use_cache
+    ):
+        """The (type, choices) of each of `keys`, asked together."""
+        args = (desc, clean_checker_output, code_model_id, use_cache)
+        inferred, invalid = self._ask_key_specs(keys, *args)
+        # Ask again for just the invalid entries; if none were valid the same
+        # request would likely fail the same way
+        if inferred and invalid:
+            more, invalid = self._ask_key_specs(invalid, *args)
+            inferred.update(more)
+        fallback = ordered_map(
+            lambda key: self._infer_key(key, *args),
+            invalid,
+            self.code_gen_parallelism,
+        )
+        inferred.update(zip(invalid, fallback))
+        return [inferred[key] for key in keys]
 
+    def _infer_keys_statically(
+        self, input_keys, desc, clean_checker_output, code_model_id, use_cache
+    ):
+        """
+        Types and choices of the keys the checker code settles, plus choices
+        asked for keys whose type alone is settled. Returns those, the keys
+        left for the code model and the per-key requests saved.
+        """
+        uses = analyze_checker(clean_checker_output)
+        inferred = {}
+        choice_keys = []
+        remaining = []
+        for key in input_keys:
+            key_type, choices = (
+                static_key_spec(uses[key]) if key in uses else (None, None)
+            )
+            if key_type is None:
+                remaining.append(key)
+            elif key_type == "choice" and choices is None:
+                choice_keys.append(key)
             else:
+                inferred[key] = (key_type, choices)
+        # A type request for every settled key, and a choices request for
+        # every settled choice key
+        saved = len(inferred) + len(choice_keys)
+        saved += sum(key_type == "choice" for key_type, _ in inferred.values())
+        asked = ordered_map(
+            lambda key: self._infer_key_choices(
+                key, desc, clean_checker_output, code_model_id, use_cache
+            ),
+            choice_keys,
+            self.code_gen_parallelism,
+        )
+        for key, choices in zip(choice_keys, asked):
+            # The values the checker compares with must be among the choices
+            literals = clean_choices(uses[key].literals)
+            inferred[key] = (
+                "choice",
+                choices + [x for x in literals if x not in choices],
+            )
+        return inferred, remaining, saved
 
-                def _is_valid(choices):
-                    if choices is None:
-                        return False
-                    if len(choices) == 0:
-                        return False
-                    for c in choices:
-                        if not isinstance(c, str):
-                            return False
-                    return True
+    def _update_key_types_and_choices(
+        self,
+        input_keys,
+        desc,
+        clean_checker_output,
+        code_model_id,
+        use_cache,
+        program_name=None,
+        pattern=None,
+    ):
+        # Identify keys used in the eligibility checker
+        # this_program_used_keys = re.findall(r'hh\["(.*?)"\]', clean_checker_output)
 
-                choices = None
-                z = 0
-                while not _is_valid(choices):
-                    if z > 10:
-                        print("too many attempts")
-                        sys.exit(1)
-                    print(f"attempt no {z}")
-                    response_raw = self.lm_api.forward(
-                        [
-                            {
-                                "role": "user",
-                                "content": f"attempt no {z}\n\n"
-                                + self.get_values_prompt.format(
-                                    eligibility_requirements=desc,
-                                    code=clean_checker_output,
-                                    key=c,
-                                ),
-                            }
-                        ],
-                        chat_model_id=code_model_id,
-                        use_cache=use_cache,
-                        logging_role="choice_gen",
-                        constraints=list_regex,
-                        constraint_type="regex",
-                    ).strip()
-                    try:
-                        choices = ast.literal_eval(response_raw)
-                    except (ValueError, SyntaxError):
-                        choices = None
-                    z += 1
-            # for i, c in enumerate(choices):  # escape all '$'
-            #     choices[i] = re.sub(r"(?<!\\)\$", r"\\$", c)
-
-            new_choices[c] = [x.strip("\"'") for x in choices]
-        # do the $ escape substitution for all choices
-        for k, cs in new_choices.items():
-            for i, c in enumerate(cs):
-                new_choices[k][i] = re.sub(r"(?<!\\)\$", r"\\$", c)
+        # drop hh to handle imaginary data not called hh
+        input_keys = list(dict.fromkeys(input_keys))
+
+        # Keys are independent, so infer them concurrently and merge in key order
+        args = (desc, clean_checker_output, code_model_id, use_cache)
+        checker = self.checker_hashes.get(program_name)
+        if self.key_registry is not None and checker is not None:
+            uses = analyze_checker(clean_checker_output)
+            patterns = {
+                key: pattern
+                or member_pattern(0 if key in uses and uses[key].per_member else None)
+                for key in input_keys
+            }
+            entries = {
+                key: self.key_registry.get(checker, key, patterns[key])
+                for key in input_keys
+            }
+            known = {
+                key: (entry["key_type"], entry.get("choices"))
+                for key, entry in entries.items()
+                if "key_type" in entry
+            }
+        else:
+            known = {}
+        static = {}
+        lm_keys = [key for key in input_keys if key not in known]
+        if self.static_key_inference:
+            static, lm_keys, saved = self._infer_keys_statically(lm_keys, *args)
+            self.static_calls_saved[program_name] += saved
+            print(
+                f"[{program_name}] static analysis settled {len(static)} of "
+                f"{len(input_keys)} keys, saving {saved} code model calls"
+            )
+        if self.key_inference == "batched":
+            batches = [
+                lm_keys[i : i + self.key_batch_size]
+                for i in range(0, len(lm_keys), self.key_batch_size)
+            ]
+            inferred = sum(
+                ordered_map(
+                    lambda batch: self._infer_key_batch(batch, *args),
+                    batches,
+                    self.code_gen_parallelism,
+                ),
+                [],
+            )
+        else:
+            inferred = ordered_map(
+                lambda key: self._infer_key(key, *args),
+                lm_keys,
+                self.code_gen_parallelism,
+            )
+        inferred = {**static, **dict(zip(lm_keys, inferred))}
+        if self.key_registry is not None and checker is not None:
+            for key, (key_type, choices) in inferred.items():
+                self.key_registry.update(
+                    checker, key, patterns[key], key_type=key_type, choices=choices
+                )
+            inferred.update(known)
+        this_program_key_types = {}
+        new_choices = {}
+        for key in input_keys:
+            key_type, choices = inferred[key]
+            this_program_key_types[key] = key_type
+            if choices is not None:
+                new_choices[key] = choices
         return this_program_key_types, new_choices
 
-    def make_program(
+    def _synthesize_checker(
         self,
-        code_file_handle,
+        name,
+        desc,
         eligibility_requirements,
         code_model_id,
         use_cache,
+        preexisting_keys,
     ):
-        self.clean_checker_outputs = {}
-        generated_checker_text = {}
-        generated_val_text = {}
-
-        for name, desc in tqdm(eligibility_requirements.items()):
-            failed_test_case = None
-            failed_code = None
-            error_trace = None
-
-            checker_attempt_no = 0
-            code_rewrite_attempt_no = 0
-            rewritten = False
-
-            self.max_code_gen_attempts = self.max_code_gen_attempts
-            while (
-                checker_attempt_no < self.max_code_gen_attempts
-                or code_rewrite_attempt_no < self.max_code_rewrite_attempts
-            ):
-                oai_seed_no = checker_attempt_no + 1000 * self.random_seed
-                print(f"attempting to generate checker, attempt {oai_seed_no}")
-
-                if failed_test_case is None:
-                    prompt_content = self.gen_checker_prompt.format(
-                        attempt_no=oai_seed_no,
-                        eligibility_requirement=desc,
-                        preexisting_keys=self.get_pek_str(),
-                    )
-                    rewritten = False
-                else:
+        """
+        Generate, test and repair the checker of program `name`, then infer its
+        key types and choices. Returns the checker source (None if no attempt
+        compiled), key types and choices; the caller merges the last two.
+        """
+        failed_test_case = None
+        failed_code = None
+        error_trace = None
+        checker_text = None
+        key_types = {}
+        choices = {}
+
+        checker_attempt_no = 0
+        code_rewrite_attempt_no = 0
+        rewritten = False
+        # Sampled checkers not yet tried for this program
+        candidates = []
+
+        self.max_code_gen_attempts = self.max_code_gen_attempts
+        while (
+            checker_attempt_no < self.max_code_gen_attempts
+            or code_rewrite_attempt_no < self.max_code_rewrite_attempts
+        ):
+            oai_seed_no = checker_attempt_no + 1000 * self.random_seed
+            print(f"attempting to generate checker, attempt {oai_seed_no}")
+
+            if failed_test_case is None:
+                prompt_content = self.gen_checker_prompt.format(
+                    attempt_no=oai_seed_no,
+                    eligibility_requirement=desc,
+                    preexisting_keys=preexisting_keys,
+                )
+                rewritten = False
+            else:
 
-                    prompt_content = self.generate_corrected_code_prompt.format(
-                        eligibility_requirements=desc,
-                        code=failed_code,
-                        failed_test_case=failed_test_case,
-                    )
+                prompt_content = self.generate_corrected_code_prompt.format(
+                    eligibility_requirements=desc,
+                    code=failed_code,
+                    failed_test_case=failed_test_case,
+                )
 
-                    if error_trace:
-                        prompt_content += f"\nThrows an error:\n {error_trace}"
-                    else:
-                        prompt_content += "Throws no errors but generates wrong output."
+                if error_trace:
+                    prompt_content += f"\nThrows an error:\n {error_trace}"
+                else:
+                    prompt_content += "Throws no errors but generates wrong output."
 
-                    failed_test_case = None
-                    failed_code = None
-                    error_trace = None
-                    rewritten = True
+                failed_test_case = None
+                failed_code = None
+                error_trace = None
+                rewritten = True
 
+            checker_request = dict(
+                chat_model_id=code_model_id,
+                use_cache=use_cache,
+                logging_role="code_gen",
+                constraint_type=(
+                    ConstraintType.cfg if self.checker_grammar else ConstraintType.none
+                ),
+                constraints=self.checker_grammar,
+            )
+            if rewritten or self.code_gen_samples == 1:
+                self.rate_limiter.acquire()
                 dirty_checker_output = self.lm_api.forward(
                     [{"role": "user", "content": prompt_content}],
-                    chat_model_id=code_model_id,
-                    use_cache=use_cache,
-                    logging_role="code_gen",
-                ).strip("`")
-
-                try:
-                    extracted = extract_function_definitions(dirty_checker_output)
-                    func_def = extracted["check_eligibility"]
-                    func_def = func_def.replace("def check_eligibility", f"def {name}")
-                    func_def = re.sub(
-                        r'hh\.get\(f?(["\'])(.*?)\1\)',
-                        r'hh["\2"]',
-                        func_def,
-                    )
-                    func_def = black.format_str(
-                        remove_raise_statements(func_def),
-                        mode=black.FileMode(),
+                    **checker_request,
+                )
+            else:
+                if not candidates:
+                    self.rate_limiter.acquire()
+                    candidates = self.lm_api.forward_samples(
+                        [{"role": "user", "content": prompt_content}],
+                        n=self.code_gen_samples,
+                        **checker_request,
                     )
+                dirty_checker_output = candidates.pop(0)
+            dirty_checker_output = dirty_checker_output.strip("`")
 
-                    exec(func_def)  # test if it runs
-                    self.clean_checker_outputs[name] = func_def
-                    generated_checker_text[name] = func_def
+            try:
+                extracted = extract_function_definitions(dirty_checker_output)
+                func_def = extracted["check_eligibility"]
+                func_def = func_def.replace("def check_eligibility", f"def {name}")
+                func_def = re.sub(
+                    r'hh\.get\(f?(["\'])(.*?)\1\)',
+                    r'hh["\2"]',
+                    func_def,
+                )
+                func_def = black.format_str(
+                    remove_raise_statements(func_def),
+                    mode=black.FileMode(),
+                )
 
-                    this_program_used_keys = re.findall(
-                        r'\["(.*?)"\]', self.clean_checker_outputs[name]
-                    )
+                # test if it runs
+                if self.sandbox is None:
+                    exec(func_def)
+                else:
+                    self.sandbox.define(func_def)
+                self.clean_checker_outputs[name] = func_def
+                checker_text = func_def
 
-                except Exception as e:
-                    import traceback
+                this_program_used_keys = re.findall(
+                    r'\["(.*?)"\]', self.clean_checker_outputs[name]
+                )
 
-                    traceback.print_exc()
+            except Exception as e:
+                traceback.print_exc()
 
-                    if not rewritten:
-                        checker_attempt_no += 1
+                if not rewritten:
+                    checker_attempt_no += 1
 
-                    # If we exceeded attempts, skip this requirement
-                    if (
-                        not rewritten
-                        and checker_attempt_no > self.max_code_gen_attempts
-                    ):
-                        raise Exception(
-                            f"Failed to generate checker for {name} after {checker_attempt_no} attempts."
-                        )
+                # If we exceeded attempts, skip this requirement
+                if not rewritten and checker_attempt_no > self.max_code_gen_attempts:
+                    raise Exception(
+                        f"Failed to generate checker for {name} after {checker_attempt_no} attempts."
+                    )
 
-                try:
-                    if code_rewrite_attempt_no < self.max_code_rewrite_attempts:
-                        code_rewrite_attempt_no += 1
-                        edge_case_prompt = [
-                            {
-                                "role": "user",
-                                "content": self.make_unit_tests_prompt.format(
-                                    eligibility_requirements=eligibility_requirements,
-                                    code=func_def,
-                                )
-                                + self.example_unit_test,
-                            }
-                        ]
-
-                        edge_case_output = (
-                            self.lm_api.forward(
-                                edge_case_prompt,
-                                chat_model_id=code_model_id,
-                                use_cache=use_cache,
-                                logging_role="code_gen",
+            try:
+                if code_rewrite_attempt_no < self.max_code_rewrite_attempts:
+                    code_rewrite_attempt_no += 1
+                    edge_case_prompt = [
+                        {
+                            "role": "user",
+                            "content": self.make_unit_tests_prompt.format(
+                                eligibility_requirements=eligibility_requirements,
+                                code=func_def,
                             )
-                            .strip("`")
-                            .strip("json\n")
+                            + self.example_unit_test,
+                        }
+                    ]
+
+                    self.rate_limiter.acquire()
+                    edge_case_output = (
+                        self.lm_api.forward(
+                            edge_case_prompt,
+                            chat_model_id=code_model_id,
+                            use_cache=use_cache,
+                            logging_role="code_gen",
                         )
+                        .strip("`")
+                        .strip("json\n")
+                    )
 
-                        edge_case_outputs = json.loads(edge_case_output)
-                        matches = True
-
-                        for case in edge_case_outputs:
-                            hh = convert_keys_to_int(case["hh"])
-                            expected = case["expected"]
-                            try:
-                                result = locals()[name](hh)
-                            except Exception as err:
-                                import traceback
+                    edge_case_outputs = json.loads(edge_case_output)
+                    matches = True
+                    checker = locals()[name] if self.sandbox is None else None
+
+                    def run_case(case):
+                        hh = convert_keys_to_int(case["hh"])
+                        try:
+                            if self.sandbox is None:
+                                return checker(hh), None
+                            return self.sandbox.call(func_def, name, hh), None
+                        except CheckerError as err:
+                            return None, str(err)
+                        except Exception:
+                            return None, "".join(
+                                traceback.format_exception(*sys.exc_info())
+                            )
 
-                                error_trace = "".join(
-                                    traceback.format_exception(*sys.exc_info())
-                                )
+                    # Cases are independent, so the sandbox runs one per
+                    # worker at a time; the first failure in order is
+                    # reported and later rounds are not submitted
+                    parallelism = self.sandbox.workers if self.sandbox else 1
+                    for start in range(0, len(edge_case_outputs), parallelism):
+                        cases = edge_case_outputs[start : start + parallelism]
+                        outcomes = ordered_map(run_case, cases, parallelism)
+                        for case, (result, trace) in zip(cases, outcomes):
+                            if trace is not None:
+                                error_trace = trace
                                 failed_code = func_def
                                 failed_test_case = case
                                 matches = False
-
                                 break
 
-                            if result != expected:
+                            if result != case["expected"]:
                                 matches = False
                                 failed_test_case = case
                                 failed_code = func_def
                                 break
-
                         if not matches:
-                            continue
-
-                    # success: neither code gen nor code rewrite need to run again
-                    (
-                        this_program_key_types,
-                        new_choices,
-                    ) = self._update_key_types_and_choices(
-                        this_program_used_keys,
-                        desc,
-                        self.clean_checker_outputs[name],
-                        code_model_id,
-                        use_cache,
-                    )
-                    self.key_types.update(this_program_key_types)
-                    self.choices.update(new_choices)
-                    break
-                except Exception as e:
-                    import traceback
+                            break
+
+                    if not matches:
+                        continue
+
+                # success: neither code gen nor code rewrite need to run again
+                self.checker_hashes[name] = checker_hash(
+                    self.chat_model_id,
+                    code_model_id,
+                    desc,
+                    self.clean_checker_outputs[name],
+                )
+                key_types, choices = self._update_key_types_and_choices(
+                    this_program_used_keys,
+                    desc,
+                    self.clean_checker_outputs[name],
+                    code_model_id,
+                    use_cache,
+                    program_name=name,
+                )
+                if self.precompute_questions and self.key_registry is not None:
+                    self._precompute_questions(name, desc, key_types)
+                break
+            except Exception as e:
+                traceback.print_exc()
 
-                    traceback.print_exc()
+                continue
 
-                    continue
+        return checker_text, key_types, choices
+
+    def make_program(
+        self,
+        code_file_handle,
+        eligibility_requirements,
+        code_model_id,
+        use_cache,
+    ):
+        self.clean_checker_outputs = {}
+        generated_checker_text = {}
+        generated_val_text = {}
+
+        if self.concurrent_checkers:
+            # Every prompt lists the keys known before this batch
+            preexisting_keys = self.get_pek_str()
+            results = ordered_map(
+                lambda item: self._synthesize_checker(
+                    *item,
+                    eligibility_requirements,
+                    code_model_id,
+                    use_cache,
+                    preexisting_keys,
+                ),
+                eligibility_requirements.items(),
+                self.code_gen_parallelism,
+            )
+        else:
+            # Lazy, so each prompt lists the keys of the programs before it
+            results = (
+                self._synthesize_checker(
+                    name,
+                    desc,
+                    eligibility_requirements,
+                    code_model_id,
+                    use_cache,
+                    self.get_pek_str(),
+                )
+                for name, desc in tqdm(eligibility_requirements.items())
+            )
+        for name, (checker_text, key_types, choices) in zip(
+            eligibility_requirements, results
+        ):
+            if checker_text is not None:
+                generated_checker_text[name] = checker_text
+            self.key_types.update(key_types)
+            self.choices.update(choices)
 
         with open("datamodels/template.py", "r") as template_file:
             template = template_file.read()
@@ -622,6 +856,11 @@ class CodeBot(ChatBot):
             del spo["hh"]
             program_outputs[spo["program_name"]] = spo
             self.total_programs_completed += 1
+        if self.local_answer_extraction:
+            print(
+                f"{self.extraction_stats['local']} of "
+                f"{sum(self.extraction_stats.values())} answers parsed locally"
+            )
         return program_outputs
 
     def run_single_program(
@@ -639,40 +878,77 @@ class CodeBot(ChatBot):
         history = []
         # hh = ImaginaryData()
         attempt_no = 0
-        prev_hh = None
+        # Household version before the last answer was stored
+        prev_version = None
+        # How often each message appears in `history`
+        message_counts = Counter()
         this_program_questions = 0
 
-        while True:
-            if hh == prev_hh:
+        def incomplete():
+            return {
+                "program_name": program_name,
+                "hh": hh,
+                "history": history,
+                "eligibility": np.random.choice([True, False]),
+                "completed": False,
+            }
 
-                print(f"warning: no progress for {program_name}")
-                return {
-                    "program_name": program_name,
-                    "hh": hh,
-                    "history": history,
-                    "eligibility": np.random.choice([True, False]),
-                    "completed": False,
-                }, hh
+        def ask(cq):
+            """The answer to a question covering several keys, or None after
+            too many repeats."""
+            nonlocal this_program_questions
+            if message_counts[cq] > 12:
+                return None
+            this_program_questions += 1
+            self.total_questions += 1
+            print(f"user index: {self.data_user_index}")
+            print(f"{this_program_questions} questions on program {program_name}")
+            print(
+                f"{self.total_questions} total questions on {self.total_programs_completed} programs"
+            )
+            history.append({"role": RoleEnum.CQ_MODEL.value, "content": cq})
+            ca = synthetic_user.answer_cq(cq=cq, history=history)
+            history.append({"role": RoleEnum.SYNTHETIC_USER.value, "content": ca})
+            message_counts[cq] += 1
+            message_counts[ca] += 1
+            return ca
+
+        try:
+            # Suspends the checker at each missing key and resumes it with the
+            # answer, rather than rerunning it from the top
+            if self.sandbox is None:
+                execution = execute_checker(
+                    generated_code.calls[program_name], hh, generated_code.__file__
+                )
+            else:
+                execution = self.sandbox.execute(code_file_path, program_name, hh)
+        except Exception as e:
+            print(e)
+            return incomplete(), hh
+
+        try:
+            while True:
+                if hh.version == prev_version:
+
+                    print(f"warning: no progress for {program_name}")
+                    return incomplete(), hh
+
+                try:
+                    pending = execution.resume()
+                except Exception as e:
+                    print(e)
+                    return incomplete(), hh
+                if pending is None:
+                    eligibility = execution.result
+                    break
 
-            try:
-                p_fn = generated_code.calls[program_name]
-                eligibility = p_fn(hh=hh)
-                break
-            except ImaginaryDataKeyError as e:
-                error_var = e
                 fn_name = program_name
                 assert fn_name in eligibility_requirements
                 relevant_program = eligibility_requirements[fn_name]
 
-                # if isinstance(e, ImaginaryDataKeyError):
-                key = error_var.args[0]
-                member_idx = error_var.args[1]
-                # line = [x for x in traceback.format_exc().split("\n") if key in x][0]
-                line = self.find_line(
-                    traceback.extract_tb(error_var.__traceback__),
-                    key,
-                    generated_code.__file__,
-                )
+                key = pending.key
+                member_idx = pending.member_idx
+                line = pending.line
                 if line is None:
                     # sometimes the key is not a literal string so it's not caught in the first pass
                     new_key_types, new_choices = self._update_key_types_and_choices(
@@ -681,38 +957,84 @@ class CodeBot(ChatBot):
                         self.clean_checker_outputs[program_name],
                         self.code_model_id,
                         self.use_cache,
+                        program_name=program_name,
+                        pattern=member_pattern(member_idx),
                     )
                     self.key_types.update(new_key_types)
                     # self.choices.update(new_choices)
                     self.update_choices(new_choices)
-                    line = "\n".join(
-                        [
-                            x.line
-                            for x in list(traceback.extract_tb(error_var.__traceback__))
-                        ]
-                    )
+                    line = "\n".join(pending.stack)
                     assert line
 
-                cq = self.forward_generic(
-                    prompt=self.key_error_prompt.format(
-                        eligibility_requirements=relevant_program,
-                        line=line,
-                        key=key,
-                    ),
-                    logging_role="key_error",
+                slots = (
+                    self._member_slots(hh, key, member_idx)
+                    if self.vectorize_members and member_idx is not None
+                    else []
+                )
+                if len(slots) > 1:
+                    # One question fills this key for every member missing it
+                    cq = self.forward_generic(
+                        prompt=self.members_key_error_prompt.format(
+                            eligibility_requirements=relevant_program,
+                            line=line,
+                            key=key,
+                            count=len(slots),
+                            members=", ".join(f"member {i}" for i in slots),
+                        ),
+                        logging_role="key_error",
+                    )
+                    ca = ask(cq)
+                    if ca is None:
+                        return incomplete(), hh
+                    values = self._member_values(
+                        key, slots, cq, ca, relevant_program, line
+                    )
+                    if values is not None:
+                        prev_version = hh.version
+                        for slot, value in zip(slots, values):
+                            hh[slot][key] = value
+                        continue
+                    # Otherwise ask about this member alone
+
+                batch = (
+                    self._household_batch(
+                        execution, generated_code.calls[program_name], hh, key
+                    )
+                    if self.batch_household_keys and member_idx is None
+                    else []
+                )
+                if len(batch) > 1:
+                    # One question for keys the checker needs either way
+                    cq = self.forward_generic(
+                        prompt=self.household_keys_error_prompt.format(
+                            eligibility_requirements=relevant_program,
+                            line=line,
+                            keys=", ".join(batch),
+                        ),
+                        logging_role="key_error",
+                    )
+                    ca = ask(cq)
+                    if ca is None:
+                        return incomplete(), hh
+                    values = self._household_values(
+                        batch, cq, ca, relevant_program, line
+                    )
+                    prev_version = hh.version
+                    for batch_key, value in values.items():
+                        hh[batch_key] = value
+                    if key in values:
+                        continue
+                    # Otherwise ask about the pending key alone
+
+                cq = self._key_question(
+                    program_name, relevant_program, key, member_idx, line
                 )
+                new_hh_value = None
                 for clarification_attempt_no in range(3):
                     # check that the cq doesn't appear in the history more than 12 times
-                    past_cqs = np.array([x["content"] for x in history])
-                    if np.sum(past_cqs == cq) > 12:
+                    if message_counts[cq] > 12:
                         # print("too many cq repeats")
-                        return {
-                            "program_name": program_name,
-                            "hh": hh,
-                            "history": history,
-                            "eligibility": np.random.choice([True, False]),
-                            "completed": False,
-                        }, hh
+                        return incomplete(), hh
 
                     this_program_questions += 1
                     self.total_questions += 1
@@ -728,6 +1050,8 @@ class CodeBot(ChatBot):
                     history.append(
                         {"role": RoleEnum.SYNTHETIC_USER.value, "content": ca}
                     )
+                    message_counts[cq] += 1
+                    message_counts[ca] += 1
 
                     key_type = self.key_types.get(key, "any")
                     if key_type == ConstraintType.choice:
@@ -744,17 +1068,22 @@ class CodeBot(ChatBot):
                         raise NotImplementedError
                     # try:
                     # need a loop here to check if answer is solid
-                    mini_history = deepcopy(history)
-                    question_was_answered = self.forward_generic(
-                        prompt=self.did_response_contain_answer_prompt.format(
-                            cq=cq,
-                            answer=ca,
-                        ),
-                        logging_role="did_response_contain_answer",
-                        constraint_type=ConstraintType.choice,
-                        constraints=["yes", "no"],
-                    )
-                    if "yes" in question_was_answered.lower():
+                    if self.local_answer_extraction:
+                        new_hh_value, answered = self._answer_value(
+                            key, key_type, cq, ca, relevant_program, line
+                        )
+                    else:
+                        question_was_answered = self.forward_generic(
+                            prompt=self.did_response_contain_answer_prompt.format(
+                                cq=cq,
+                                answer=ca,
+                            ),
+                            logging_role="did_response_contain_answer",
+                            constraint_type=ConstraintType.choice,
+                            constraints=["yes", "no"],
+                        )
+                        answered = "yes" in question_was_answered.lower()
+                    if answered:
                         break
                     else:
                         cq = self.forward_generic(
@@ -770,42 +1099,38 @@ class CodeBot(ChatBot):
                     # except Exception as e:
                     #     print(f"failed to extract value from answer: {e}")
                     #     new_hh_value = "0"
-                try:
-                    new_hh_value = self.forward_generic(
-                        prompt=self.extract_value_from_ans_prompt.format(
-                            eligibility_requirements=relevant_program,
-                            line=line,
-                            key=key,
-                            cq=cq,
-                            answer=ca,
-                        ),
-                        logging_role="extract_value_from_ans",
-                        constraint_type=constraint_type,
-                        constraints=constraint,
-                    )
-                except Exception as e:
-                    print(
-                        f"failed to extract value from answer: {e}"
-                    )  # not sure whats wrong, fix later, @nikhil?
-                    new_hh_value = "0"
+                if not answered:
+                    # A value read from an answer that missed the question
+                    new_hh_value = None
+                # With local extraction the value is usually known already
+                if new_hh_value is None:
+                    try:
+                        new_hh_value = self.forward_generic(
+                            prompt=self.extract_value_from_ans_prompt.format(
+                                eligibility_requirements=relevant_program,
+                                line=line,
+                                key=key,
+                                cq=cq,
+                                answer=ca,
+                            ),
+                            logging_role="extract_value_from_ans",
+                            constraint_type=constraint_type,
+                            constraints=constraint,
+                        )
+                    except Exception as e:
+                        print(
+                            f"failed to extract value from answer: {e}"
+                        )  # not sure whats wrong, fix later, @nikhil?
+                        new_hh_value = "0"
                 # history.append({"role": "assistant", "content": new_hh_value})
-                prev_hh = deepcopy(hh)
+                prev_version = hh.version
                 if member_idx is None:
                     hh[key] = new_hh_value
                 else:
                     hh[member_idx][key] = new_hh_value
                 continue
-                # else:
-                # except Exception as e:
-            except Exception as e:
-                print(e)
-                return {
-                    "program_name": program_name,
-                    "hh": hh,
-                    "history": history,
-                    "eligibility": np.random.choice([True, False]),
-                    "completed": False,
-                }, hh
+        finally:
+            execution.close()
 
         return {
             "program_name": program_name,
@@ -815,13 +1140,210 @@ class CodeBot(ChatBot):
             "completed": True,
         }, hh
 
+    def _value_schema(self, key, key_type) -> dict:
+        if key_type == "int":
+            return {"type": "integer"}
+        if key_type == "float":
+            return {"type": "number"}
+        if key_type == "choice":
+            return {"type": "string", "enum": self.choices[key]}
+        return {"type": "string"}
+
+    def _member_slots(self, hh, key, member_idx) -> list[int]:
+        """
+        Members of a household of known size still missing `key`, if
+        `member_idx` is one of them.
+        """
+        try:
+            size = int(float(hh.tl_data[HOUSEHOLD_SIZE_KEY]))
+        except (KeyError, TypeError, ValueError):
+            return []
+        slots = [
+            i
+            for i in range(min(size, self.max_vectorized_members))
+            if i not in hh.members or key not in hh.members[i].tl_data
+        ]
+        return slots if member_idx in slots else []
+
+    def _member_values(self, key, slots, cq, ca, relevant_program, line):
+        """The values of `key` for each member in `slots`, or None if unclear."""
+        key_type = self.key_types.get(key, "any")
+        try:
+            response = json.loads(
+                self.forward_generic(
+                    prompt=self.member_values_prompt.format(
+                        eligibility_requirements=relevant_program,
+                        line=line,
+                        key=key,
+                        members=", ".join(f"member {i}" for i in slots),
+                        cq=cq,
+                        answer=ca,
+                    ),
+                    logging_role="extract_member_values",
+                    constraint_type=ConstraintType.json_schema,
+                    constraints={
+                        "type": "object",
+                        "properties": {
+                            "answered": {"type": "boolean"},
+                            "values": {
+                                "type": "array",
+                                "items": self._value_schema(key, key_type),
+                                "minItems": len(slots),
+                                "maxItems": len(slots),
+                            },
+                        },
+                        "required": ["answered", "values"],
+                        "additionalProperties": False,
+                    },
+                )
+            )
+        except Exception as e:
+            print(f"failed to extract member values: {e}")
+            return None
+        values = response["values"]
+        if not response["answered"] or len(values) != len(slots):
+            return None
+        return [str(value) for value in values]
+
+    def _household_batch(self, execution, checker, hh, key) -> list[str]:
+        """
+        `key` and other household keys the checker reads whatever the
+        remaining answers are, or [] if there are no others.
+        """
+        limits = self.batch_enumeration_limits
+        if self.sandbox is None:
+            required = required_household_keys(checker, hh, **limits)
+        else:
+            required = execution.required_household_keys(hh, **limits)
+        others = [k for k in required or [] if isinstance(k, str) and k != key]
+        return [key] + others[: self.max_batched_keys - 1] if others else []
+
+    def _household_values(self, keys, cq, ca, relevant_program, line) -> dict:
+        """The values of `keys` the answer `ca` gives."""
+        try:
+            response = json.loads(
+                self.forward_generic(
+                    prompt=self.household_values_prompt.format(
+                        eligibility_requirements=relevant_program,
+                        line=line,
+                        keys=", ".join(keys),
+                        cq=cq,
+                        answer=ca,
+                    ),
+                    logging_role="extract_household_values",
+                    constraint_type=ConstraintType.json_schema,
+                    constraints={
+                        "type": "object",
+                        "properties": {
+                            key: {
+                                "anyOf": [
+                                    self._value_schema(
+                                        key, self.key_types.get(key, "any")
+                                    ),
+                                    {"type": "null"},
+                                ]
+                            }
+                            for key in keys
+                        },
+                        "required": keys,
+                        "additionalProperties": False,
+                    },
+                )
+            )
+        except Exception as e:
+            print(f"failed to extract household values: {e}")
+            return {}
+        return {
+            key: str(value)
+            for key, value in response.items()
+            if key in keys and value is not None
+        }
+
+    def _answer_value(self, key, key_type, cq, ca, relevant_program, line):
+        """
+        The value of `key` in answer `ca` and whether `cq` was answered at all.
+        Parses the answer locally and asks the chat model only if that fails.
+        A value of None leaves the extraction to the usual request.
+        """
+        choices = self.choices.get(key) if key_type == "choice" else None
+        value = extract_answer(ca, key_type, choices)
+        if value is not None and is_hedged(ca):
+            # The chat model decides whether a hedged answer counts
+            value = None
+        self.extraction_stats["local" if value is not None else "model"] += 1
+        if value is not None:
+            return value, True
+
+        value_schema = self._value_schema(key, key_type)
+        try:
+            response = json.loads(
+                self.forward_generic(
+                    prompt=self.answer_and_value_prompt.format(
+                        eligibility_requirements=relevant_program,
+                        line=line,
+                        key=key,
+                        cq=cq,
+                        answer=ca,
+                    ),
+                    logging_role="answer_and_value",
+                    constraint_type=ConstraintType.json_schema,
+                    constraints={
+                        "type": "object",
+                        "properties": {
+                            "answered": {"type": "boolean"},
+                            "value": value_schema,
+                        },
+                        "required": ["answered", "value"],
+                        "additionalProperties": False,
+                    },
+                )
+            )
+            return str(response["value"]), bool(response["answered"])
+        except Exception as e:
+            print(f"failed to check and extract answer: {e}")
+            return None, True
+
+    def _key_question(self, program_name, relevant_program, key, member_idx, line):
+        """The question that asks for `key`, from the registry if it has one."""
+        checker = self.checker_hashes.get(program_name)
+        use_registry = self.key_registry is not None and checker is not None
+        pattern = member_pattern(member_idx)
+        if use_registry:
+            entry = self.key_registry.get(checker, key, pattern)
+            if "question" in entry:
+                return entry["question"]
+        cq = self.forward_generic(
+            prompt=self.key_error_prompt.format(
+                eligibility_requirements=relevant_program,
+                line=line,
+                key=key,
+            ),
+            logging_role="key_error",
+        )
+        if use_registry:
+            self.key_registry.update(checker, key, pattern, question=cq)
+        return cq
+
+    def _precompute_questions(self, program_name, desc, key_types):
+        """Phrase the question of every literal key of a checker in advance."""
+        checker_code = self.clean_checker_outputs[program_name]
+        uses = analyze_checker(checker_code)
+        lines = checker_code.splitlines()
+        requests = []
+        for key in key_types:
+            lookup = f'["{key}"]'
+            line = next((l.strip() for l in lines if lookup in l), None)
+            if line is not None:
+                member_idx = 0 if key in uses and uses[key].per_member else None
+                requests.append((key, member_idx, line))
+        ordered_map(
+            lambda request: self._key_question(program_name, desc, *request),
+            requests,
+            self.code_gen_parallelism,
+        )
+
     def find_line(self, fe, key, filename):
-        for frame in fe[::-1]:
-            if frame.filename == filename:
-                if key in frame.line:
-                    return frame.line
-        return None
-        # raise Exception(f"Key {key} not found in traceback")
+        return find_line(fe, key, filename)
 
     def forward_generic(
         self,
@@ -0,0 +1,75 @@
+"""The `hh` dictionary generated checkers read. Keys the conversation has not
+covered yet make the checker ask the user, see `datamodels.checker_execution`.
+"""
+
+from datamodels.checker_execution import ImaginaryDataKeyError, current_execution
+
+# The household key `len(hh)` reads
+HOUSEHOLD_SIZE_KEY = "number of household members"
+
+
+class ImaginaryData:
+    """
+    The household as revealed so far. Each member is an ImaginaryData slot of
+    the household with its own values. `version` lives on the household and
+    grows whenever a value or a member is added or changed, so progress is
+    checked by comparing two integers instead of copying the household.
+    """
+
+    __slots__ = ("members", "tl_data", "index", "household", "version")
+
+    def __init__(self, index=None, household=None):
+        super().__init__()
+        self.members = {}
+        self.tl_data = {}  # top level data i.e. household data
+        self.index = index  # index of the current member
+        self.household = self if household is None else household
+        self.version = 0
+
+    def get(self, key, default=None):
+        return self._get(key)
+
+    def _get(self, key):
+        if isinstance(key, int) or (isinstance(key, str) and key.isdigit()):
+            int_key = int(key)
+            if int_key in self.members:
+                return self.members[int_key]
+            else:
+                if len(self.members) > 100:
+                    print("infinite loop caused too many members")
+                    raise NotImplementedError
+                self.members[int_key] = ImaginaryData(
+                    index=int_key, household=self.household
+                )
+                self.household.version += 1
+                return self.members[int_key]
+        elif key in self.tl_data:
+            return self.tl_data[key]
+        else:
+            execution = current_execution()
+            if execution is not None:
+                # Wait for the answer instead of abandoning the checker
+                return execution.suspend(self, key)
+            raise ImaginaryDataKeyError(key, self.index)
+
+    def __setitem__(self, key, value):
+        if key not in self.tl_data or self.tl_data[key] != value:
+            self.household.version += 1
+        self.tl_data[key] = value
+
+    def __getitem__(self, key):
+        return self._get(key)
+
+    def __eq__(self, other):
+        if not isinstance(other, ImaginaryData):
+            return False
+        return self.tl_data == other.tl_data and self.members == other.members
+
+    def __contains__(self, item):
+        return item in self.tl_data or item in self.members
+
+    def __len__(self):
+        return int(self.get(HOUSEHOLD_SIZE_KEY))
+
+    # def __len__(self):
+    # raise KeyError("number of family members")
@@ -0,0 +1,63 @@
+"""What CodeBot learns about each checker key, kept across households.
+
+`KeyRegistry` stores the question, type and choices of each key in a JSON file,
+keyed by a hash of the checker, its requirement text and the models involved,
+so entries are not reused after any of them changes.
+"""
+
+from copy import deepcopy
+from typing import Optional
+import hashlib
+import json
+import os
+import threading
+
+
+def checker_hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def member_pattern(member_idx) -> str:
+    """Questions about hh["key"] and hh[i]["key"] differ; those for each i do not."""
+    return "household" if member_idx is None else "member"
+
+
+class KeyRegistry:
+    """
+    Entries are dicts with any of "question", "key_type" and "choices". With
+    a `path`, the registry is loaded from and saved to that JSON file.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def _key(checker: str, key: str, pattern: str) -> str:
+        return json.dumps([checker, key, pattern])
+
+    def get(self, checker: str, key: str, pattern: str) -> dict:
+        with self.lock:
+            return deepcopy(self.entries.get(self._key(checker, key, pattern), {}))
+
+    def update(self, checker: str, key: str, pattern: str, **fields):
+        with self.lock:
+            self.entries.setdefault(self._key(checker, key, pattern), {}).update(fields)
+            self._save()
+
+    def _save(self):
+        if self.path is None:
+            return
+        # Write a new file and swap it in so a crash never leaves half a file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,316 @@
+"""Generated checkers run in worker processes.
+
+`CheckerSandbox` keeps a few forked workers and runs checker code in them under
+a wall clock timeout and CPU and memory limits. A worker that times out or
+dies is replaced and the request fails with a `CheckerError`.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+import importlib.util
+import multiprocessing
+import queue
+import resource
+import signal
+import traceback
+
+from datamodels.checker_execution import PendingKey, execute_checker
+from datamodels.symbolic import required_household_keys
+
+# Compiled sources a worker keeps; rewrite loops reuse only the latest few
+COMPILED_SOURCES = 16
+
+
+class CheckerError(Exception):
+    """A checker failed in a worker; the message is the worker's traceback."""
+
+    pass
+
+
+class CheckerTimeout(CheckerError):
+    pass
+
+
+class CheckerCrashed(CheckerError):
+    pass
+
+
+def _limit_cpu(seconds: float):
+    # The soft limit counts total CPU time of the process, so move it past
+    # what this warm worker has used so far
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = usage.ru_utime + usage.ru_stime
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(used + seconds) + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _address_space() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[0]) * resource.getpagesize()
+
+
+def _serve(conn, cpu_timeout: float, memory_mb: Optional[int]):
+    """Worker loop: answer requests from the parent until the pipe closes."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_mb:
+        # A forked worker starts with the parent's address space
+        limit = _address_space() + memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    # source -> namespace with the functions it defines, least recent first
+    compiled = OrderedDict()
+    execution = None
+    checker = None
+    hh = None
+
+    def step():
+        try:
+            pending = execution.resume()
+        except Exception:
+            return "error", traceback.format_exc()
+        if pending is None:
+            return "done", execution.result
+        return "pending", pending
+
+    while True:
+        try:
+            kind, *args = conn.recv()
+        except EOFError:
+            return
+        _limit_cpu(cpu_timeout)
+        try:
+            if kind in ("define", "call"):
+                source = args[0]
+                if source not in compiled:
+                    namespace = {}
+                    exec(source, namespace)
+                    compiled[source] = namespace
+                    if len(compiled) > COMPILED_SOURCES:
+                        compiled.popitem(last=False)
+                compiled.move_to_end(source)
+                if kind == "define":
+                    reply = "done", None
+                else:
+                    name, hh_arg = args[1:]
+                    reply = "done", compiled[source][name](hh_arg)
+            elif kind == "start":
+                path, program_name, hh = args
+                spec = importlib.util.spec_from_file_location("generated_code", path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                checker = module.calls[program_name]
+                execution = execute_checker(checker, hh, module.__file__)
+                reply = step()
+            elif kind == "answer":
+                member_idx, key, value = args
+                target = hh if member_idx is None else hh[member_idx]
+                target[key] = value
+                reply = step()
+            elif kind == "required":
+                known, limits = args
+                reply = "done", required_household_keys(checker, known, **limits)
+            elif kind == "close":
+                if execution is not None:
+                    execution.close()
+                execution = checker = hh = None
+                reply = "done", None
+            else:
+                raise ValueError(f"Unknown request {kind}")
+        except Exception:
+            reply = "error", traceback.format_exc()
+        try:
+            conn.send(reply)
+        except Exception:
+            # e.g. a result that does not pickle
+            conn.send(("error", traceback.format_exc()))
+
+
+class _Worker:
+    def __init__(self, sandbox: "CheckerSandbox"):
+        self.sandbox = sandbox
+        self.process = None
+        self.start()
+
+    def start(self):
+        self.conn, child = self.sandbox.ctx.Pipe()
+        self.process = self.sandbox.ctx.Process(
+            target=_serve,
+            args=(child, self.sandbox.cpu_timeout, self.sandbox.memory_mb),
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+
+    def stop(self):
+        self.conn.close()
+        self.process.kill()
+        self.process.join()
+
+    def restart(self):
+        self.stop()
+        self.sandbox.restarts += 1
+        self.start()
+
+    def request(self, *message):
+        """Send `message` and return the reply's value, or raise CheckerError."""
+        try:
+            self.conn.send(message)
+            ready = self.conn.poll(self.sandbox.timeout)
+            reply = self.conn.recv() if ready else None
+        except (EOFError, OSError):
+            ready, reply = True, None
+        if reply is None:
+            self.process.join(timeout=1)
+            exitcode = self.process.exitcode
+            self.restart()
+            if not ready:
+                raise CheckerTimeout(f"Checker exceeded {self.sandbox.timeout}s")
+            if exitcode == -signal.SIGXCPU:
+                raise CheckerTimeout(
+                    f"Checker exceeded {self.sandbox.cpu_timeout}s of CPU time"
+                )
+            raise CheckerCrashed(f"Checker worker died with exit code {exitcode}")
+        kind, value = reply
+        if kind == "error":
+            raise CheckerError(value)
+        return kind, value
+
+
+class SandboxedExecution:
+    """
+    An execution of a checker in a worker process, used like the executions
+    in `datamodels.checker_execution`. The worker keeps its own copy of the
+    household; each `resume` sends it the answer to the last pending key.
+    """
+
+    def __init__(self, sandbox: "CheckerSandbox", code_file_path, program_name, hh):
+        self.sandbox = sandbox
+        self.code_file_path = code_file_path
+        self.program_name = program_name
+        self.hh = hh
+        self.result = None
+        self.pending = None
+        self.worker = None
+
+    def resume(self) -> Optional[PendingKey]:
+        if self.worker is None:
+            self.worker = self.sandbox._acquire()
+            message = ("start", self.code_file_path, self.program_name, self.hh)
+        else:
+            key, member_idx = self.pending.key, self.pending.member_idx
+            target = self.hh if member_idx is None else self.hh[member_idx]
+            message = ("answer", member_idx, key, target[key])
+        try:
+            kind, value = self.worker.request(*message)
+            # Keys the parent already filled, e.g. several members at once
+            while kind == "pending" and self._known(value):
+                target = (
+                    self.hh if value.member_idx is None else self.hh[value.member_idx]
+                )
+                kind, value = self.worker.request(
+                    "answer", value.member_idx, value.key, target[value.key]
+                )
+        except CheckerError:
+            self.close()
+            raise
+        if kind == "pending":
+            self.pending = value
+            return value
+        self.result = value
+        self.close()
+        return None
+
+    def required_household_keys(self, known, **limits) -> Optional[list[str]]:
+        """
+        `datamodels.symbolic.required_household_keys` of the checker, run in
+        this execution's worker. None if the worker failed; the execution
+        then starts over from `hh` on the next `resume`.
+        """
+        if self.worker is None:
+            return None
+        try:
+            return self.worker.request("required", known, limits)[1]
+        except CheckerError as e:
+            print(f"could not enumerate keys: {e}")
+            self.close()
+            return None
+
+    def _known(self, pending: PendingKey) -> bool:
+        if pending.member_idx is None:
+            return pending.key in self.hh.tl_data
+        member = self.hh.members.get(pending.member_idx)
+        return member is not None and pending.key in member.tl_data
+
+    def close(self):
+        if self.worker is not None:
+            worker, self.worker = self.worker, None
+            try:
+                worker.request("close")
+            except CheckerError:
+                pass
+            self.sandbox._release(worker)
+
+
+class CheckerSandbox:
+    """
+    A pool of `workers` warm processes for generated code.
+
+    timeout: wall clock seconds per request
+    cpu_timeout: CPU seconds per request
+    memory_mb: address space each worker may add to what it inherits from
+        the parent, or None for no cap
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        timeout: float = 10.0,
+        cpu_timeout: float = 5.0,
+        memory_mb: Optional[int] = 1024,
+    ):
+        assert workers >= 1
+        self.workers = workers
+        self.timeout = timeout
+        self.cpu_timeout = cpu_timeout
+        self.memory_mb = memory_mb
+        self.restarts = 0
+        self.ctx = multiprocessing.get_context("fork")
+        self.idle = queue.Queue()
+        self.all = [_Worker(self) for _ in range(workers)]
+        for worker in self.all:
+            self.idle.put(worker)
+
+    def _acquire(self) -> _Worker:
+        return self.idle.get()
+
+    def _release(self, worker: _Worker):
+        self.idle.put(worker)
+
+    @contextmanager
+    def _worker(self):
+        worker = self._acquire()
+        try:
+            yield worker
+        finally:
+            self._release(worker)
+
+    def define(self, source: str):
+        """Execute `source`, a function definition, raising if it fails."""
+        with self._worker() as worker:
+            worker.request("define", source)
+
+    def call(self, source: str, name: str, hh):
+        """The result of function `name` defined by `source` on `hh`."""
+        with self._worker() as worker:
+            return worker.request("call", source, name, hh)[1]
+
+    def execute(self, code_file_path: str, program_name: str, hh):
+        """A resumable execution of a checker of a generated module."""
+        return SandboxedExecution(self, code_file_path, program_name, hh)
+
+    def close(self):
+        for worker in self.all:
+            worker.stop()
@@ -0,0 +1,448 @@
+"""Symbolic execution of generated checkers.
+
+The checker runs on `SymbolicData`, whose values are `Symbol`s, and the
+explorer reruns it with every outcome of each branch, up to `max_paths` paths.
+`enumerate_keys` returns the keys it can read, and `required_household_keys`
+those it reads whatever the remaining answers are.
+"""
+
+import argparse
+import importlib.util
+import operator
+import sys
+
+from datamodels.imaginary_data import HOUSEHOLD_SIZE_KEY
+
+
+class PathLimit(Exception):
+    """A run made too many decisions or executed too many lines."""
+
+    pass
+
+
+class Condition:
+    """A symbolic boolean, decided by the explorer when used in a branch."""
+
+    def __init__(self, run: "_Run", text: str):
+        self.run = run
+        self.text = text
+
+    def __bool__(self):
+        return self.run.decide(self.text)
+
+    def __repr__(self):
+        return self.text
+
+
+OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+
+
+def _text(value) -> str:
+    return value.text if isinstance(value, (Symbol, SymbolicNumber)) else repr(value)
+
+
+class _Comparisons:
+    """Comparison operators that return Conditions."""
+
+    def _compare(self, op, other):
+        return Condition(self.run, f"{self.text} {op} {_text(other)}")
+
+    def __eq__(self, other):
+        return self._compare("==", other)
+
+    def __ne__(self, other):
+        return self._compare("!=", other)
+
+    def __lt__(self, other):
+        return self._compare("<", other)
+
+    def __le__(self, other):
+        return self._compare("<=", other)
+
+    def __gt__(self, other):
+        return self._compare(">", other)
+
+    def __ge__(self, other):
+        return self._compare(">=", other)
+
+    def __hash__(self):
+        return hash(self.text)
+
+
+class Symbol(_Comparisons):
+    """The unknown string value of a key."""
+
+    def __init__(self, run: "_Run", text: str):
+        self.run = run
+        self.text = text
+
+    def __int__(self):
+        return self.run.max_members
+
+    def __float__(self):
+        return float(self.run.max_members)
+
+    def __index__(self):
+        return self.run.max_members
+
+    def __bool__(self):
+        return self.run.decide(f"bool({self.text})")
+
+    def __contains__(self, item):
+        return self.run.decide(f"{_text(item)} in {self.text}")
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return self.text
+
+    # String methods that keep the value a string
+    def lower(self):
+        return self
+
+    upper = strip = casefold = title = lower
+
+
+class SymbolicNumber(_Comparisons):
+    """A cast symbol. Arithmetic with plain numbers stays symbolic."""
+
+    def _plain(self):
+        return int(self) if isinstance(self, int) else float(self)
+
+    def _arithmetic(self, op, other, reflected=False):
+        if isinstance(other, SymbolicNumber):
+            plain_other = other._plain()
+        elif isinstance(other, (int, float)) and not isinstance(other, bool):
+            plain_other = other
+        else:
+            return NotImplemented
+        left, right = (plain_other, self._plain())
+        if not reflected:
+            left, right = right, left
+        value = OPERATORS[op](left, right)
+        text = (
+            f"({_text(other)} {op} {self.text})"
+            if reflected
+            else f"({self.text} {op} {_text(other)})"
+        )
+        cls = SymbolicInt if isinstance(value, int) else SymbolicFloat
+        return cls(value, run=self.run, text=text)
+
+    def __add__(self, other):
+        return self._arithmetic("+", other)
+
+    def __radd__(self, other):
+        return self._arithmetic("+", other, reflected=True)
+
+    def __sub__(self, other):
+        return self._arithmetic("-", other)
+
+    def __rsub__(self, other):
+        return self._arithmetic("-", other, reflected=True)
+
+    def __mul__(self, other):
+        return self._arithmetic("*", other)
+
+    def __rmul__(self, other):
+        return self._arithmetic("*", other, reflected=True)
+
+    def __truediv__(self, other):
+        return self._arithmetic("/", other)
+
+    def __rtruediv__(self, other):
+        return self._arithmetic("/", other, reflected=True)
+
+
+class SymbolicInt(SymbolicNumber, int):
+    def __new__(cls, value, run, text):
+        number = super().__new__(cls, value)
+        number.run = run
+        number.text = text
+        return number
+
+    def __hash__(self):
+        return int.__hash__(self)
+
+
+class SymbolicFloat(SymbolicNumber, float):
+    def __new__(cls, value, run, text):
+        number = super().__new__(cls, value)
+        number.run = run
+        number.text = text
+        return number
+
+    def __hash__(self):
+        return float.__hash__(self)
+
+
+def _symbolic_cast(cast):
+    def symbolic(value=0, *args):
+        if isinstance(value, (Symbol, SymbolicNumber)):
+            cls = SymbolicInt if cast is int else SymbolicFloat
+            return cls(
+                cast(value), run=value.run, text=f"{cast.__name__}({_text(value)})"
+            )
+        return cast(value, *args)
+
+    return symbolic
+
+
+SYMBOLIC_INT = _symbolic_cast(int)
+SYMBOLIC_FLOAT = _symbolic_cast(float)
+
+
+def _symbolic_len(value):
+    if isinstance(value, SymbolicData):
+        return SYMBOLIC_INT(value._get(HOUSEHOLD_SIZE_KEY))
+    return len(value)
+
+
+class SymbolicData:
+    """
+    Stands in for `ImaginaryData`; every key has a symbolic value, except
+    those `known`, an `ImaginaryData`, has.
+    """
+
+    def __init__(self, run: "_Run", index=None, known=None):
+        self.run = run
+        self.index = index
+        self.known = known
+        self.members = {}
+        self.values = {}
+
+    def _get(self, key):
+        if isinstance(key, int) or (isinstance(key, str) and key.isdigit()):
+            index = int(key)
+            if index not in self.members:
+                if len(self.members) > 100:
+                    raise PathLimit("too many members")
+                known = None if self.known is None else self.known.members.get(index)
+                self.members[index] = SymbolicData(self.run, index, known)
+            return self.members[index]
+        if isinstance(key, SymbolicNumber):
+            return self._get(int(key))
+        if self.known is not None and key in self.known.tl_data:
+            return self.known.tl_data[key]
+        if key not in self.values:
+            self.run.read(key, self.index)
+            name = (
+                f"hh[{key!r}]" if self.index is None else f"hh[{self.index}][{key!r}]"
+            )
+            self.values[key] = Symbol(self.run, name)
+        return self.values[key]
+
+    def __getitem__(self, key):
+        return self._get(key)
+
+    def get(self, key, default=None):
+        return self._get(key)
+
+    def __contains__(self, key):
+        return self.run.decide(f"{key!r} in hh")
+
+    def __len__(self):
+        return int(self._get(HOUSEHOLD_SIZE_KEY))
+
+
+class _Run:
+    """One execution along a path given by a prefix of decisions."""
+
+    def __init__(
+        self, prefix: list[bool], max_members: int, max_decisions: int, max_steps: int
+    ):
+        self.prefix = prefix
+        self.max_members = max_members
+        self.max_decisions = max_decisions
+        self.max_steps = max_steps
+        self.steps = 0
+        self.decisions = []
+        self.conditions = []
+        # (key, member index, conditions when first read), in order
+        self.reads = []
+
+    def decide(self, text: str) -> bool:
+        if len(self.decisions) >= self.max_decisions:
+            raise PathLimit(f"more than {self.max_decisions} decisions")
+        i = len(self.decisions)
+        outcome = self.prefix[i] if i < len(self.prefix) else False
+        self.decisions.append(outcome)
+        self.conditions.append(text if outcome else f"not ({text})")
+        return outcome
+
+    def read(self, key, member_idx):
+        self.reads.append((key, member_idx, tuple(self.conditions)))
+
+    def trace(self, frame, event, arg):
+        # Ends loops that never branch on a symbol
+        if event == "line":
+            self.steps += 1
+            if self.steps > self.max_steps:
+                raise PathLimit(f"more than {self.max_steps} lines")
+        return self.trace
+
+
+class KeyInfo:
+    """
+    A key a checker can read.
+
+    patterns: "household" and/or "member"
+    members: member indices it is read on
+    guards: the distinct conditions under which it is first read on a path
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.patterns = set()
+        self.members = set()
+        self.guards = []
+
+    def __repr__(self):
+        return f"KeyInfo({self.key!r}, patterns={sorted(self.patterns)})"
+
+
+class Path:
+    """
+    One explored path: its conditions, the (key, member index) reads in
+    order, and the checker's result, or the error that ended the path.
+    """
+
+    def __init__(self, conditions, reads, result=None, error=None):
+        self.conditions = conditions
+        self.reads = reads
+        self.result = result
+        self.error = error
+
+
+class KeyEnumeration:
+    def __init__(self, keys: dict[str, KeyInfo], paths: list[Path], complete: bool):
+        self.keys = keys
+        self.paths = paths
+        # Whether every path was explored to its end
+        self.complete = complete
+
+    @property
+    def max_questions(self) -> int:
+        """The most distinct lookups on one path."""
+        return max((len(set(path.reads)) for path in self.paths), default=0)
+
+
+def enumerate_keys(
+    fn,
+    max_paths: int = 512,
+    max_members: int = 2,
+    max_decisions: int = 64,
+    max_steps: int = 100_000,
+    known=None,
+) -> KeyEnumeration:
+    """
+    Explore the paths of checker `fn` and collect the keys it can read. Keys
+    `known`, an `ImaginaryData`, has are not symbolic.
+    """
+    # Patched in the module itself so its other functions see them too
+    module_globals = fn.__globals__
+    overrides = {"int": SYMBOLIC_INT, "float": SYMBOLIC_FLOAT, "len": _symbolic_len}
+    saved = {name: module_globals[name] for name in overrides if name in module_globals}
+    module_globals.update(overrides)
+    try:
+        return _explore(fn, max_paths, max_members, max_decisions, max_steps, known)
+    finally:
+        for name in overrides:
+            if name in saved:
+                module_globals[name] = saved[name]
+            else:
+                del module_globals[name]
+
+
+def _explore(checker, max_paths, max_members, max_decisions, max_steps, known):
+    keys = {}
+    paths = []
+    pending = [[]]
+    limited = False
+    while pending and len(paths) < max_paths:
+        prefix = pending.pop()
+        run = _Run(prefix, max_members, max_decisions, max_steps)
+        result = error = None
+        previous_trace = sys.gettrace()
+        sys.settrace(run.trace)
+        try:
+            result = checker(hh=SymbolicData(run, known=known))
+            if isinstance(result, Condition):
+                result = bool(result)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            limited = limited or isinstance(e, PathLimit)
+        finally:
+            sys.settrace(previous_trace)
+        # Branches first decided on this run can go the other way next time
+        for i in range(len(prefix), len(run.decisions)):
+            pending.append(run.decisions[:i] + [not run.decisions[i]])
+        paths.append(
+            Path(
+                conditions=run.conditions,
+                reads=[(key, idx) for key, idx, _ in run.reads],
+                result=result,
+                error=error,
+            )
+        )
+        for key, member_idx, guard in run.reads:
+            info = keys.setdefault(key, KeyInfo(key))
+            info.patterns.add("household" if member_idx is None else "member")
+            if member_idx is not None:
+                info.members.add(member_idx)
+            if guard not in info.guards:
+                info.guards.append(guard)
+    return KeyEnumeration(keys, paths, complete=not pending and not limited)
+
+
+def required_household_keys(fn, known=None, max_paths: int = 64, **limits):
+    """
+    Household keys without a `known` value that every path of `fn` reads, in
+    the order the first path reads them, or None if not every path could be
+    explored. A path cut short by an error reads a prefix of its keys, so
+    such paths only make the list shorter.
+    """
+    enumeration = enumerate_keys(fn, max_paths=max_paths, known=known, **limits)
+    if not enumeration.complete or not enumeration.paths:
+        return None
+    household_reads = [
+        [key for key, member_idx in path.reads if member_idx is None]
+        for path in enumeration.paths
+    ]
+    common = set.intersection(*(set(reads) for reads in household_reads))
+    return [key for key in dict.fromkeys(household_reads[0]) if key in common]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="List the keys each checker of a generated code file can ask for"
+    )
+    parser.add_argument("code_file", help="A file written by CodeBot.make_program")
+    parser.add_argument("--max_paths", default=512, type=int)
+    parser.add_argument("--max_members", default=2, type=int)
+    args = parser.parse_args()
+
+    spec = importlib.util.spec_from_file_location("generated_code", args.code_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    for program_name, fn in module.calls.items():
+        enumeration = enumerate_keys(
+            fn, max_paths=args.max_paths, max_members=args.max_members
+        )
+        status = "" if enumeration.complete else " (path limit reached)"
+        print(
+            f"{program_name}: {len(enumeration.keys)} keys, "
+            f"{len(enumeration.paths)} paths, at most "
+            f"{enumeration.max_questions} questions{status}"
+        )
+        for info in enumeration.keys.values():
+            print(f"  {info.key} [{', '.join(sorted(info.patterns))}]")
+
+
+if __name__ == "__main__":
+    main()
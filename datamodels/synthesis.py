@@ -0,0 +1,103 @@
+"""Concurrency for checker synthesis.
+
+Key type and choice inference runs on a thread pool with results collected in
+key order (`ordered_map`), code model calls are spaced by `RateLimiter`, and
+`parse_key_specs` checks batched key specs.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+import json
+import threading
+import time
+
+
+class RateLimiter:
+    """Spaces calls at least 1 / `rate` seconds apart across threads."""
+
+    def __init__(
+        self, rate: Optional[float] = None, clock=time.monotonic, sleep=time.sleep
+    ):
+        assert rate is None or rate > 0
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the next call may start. No-op without a rate."""
+        if self.rate is None:
+            return
+        with self.lock:
+            now = self.clock()
+            start = max(now, self.next_time)
+            self.next_time = start + 1 / self.rate
+        if start > now:
+            self.sleep(start - now)
+
+
+def ordered_map(fn: Callable, items: Iterable, parallelism: int = 1) -> list:
+    """
+    `fn` applied to `items` on up to `parallelism` threads, in the order of
+    `items`. The first exception raised by `fn` is re-raised.
+    """
+    items = list(items)
+    if parallelism <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(items))) as pool:
+        return list(pool.map(fn, items))
+
+
+KEY_TYPES = ["int", "float", "choice"]
+
+
+def key_specs_schema(keys: list[str]) -> dict:
+    """Schema of a batched answer: the type and options of every key."""
+    spec = {
+        "type": "object",
+        "properties": {
+            "type": {"type": "string", "enum": KEY_TYPES},
+            "options": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["type", "options"],
+        "additionalProperties": False,
+    }
+    return {
+        "type": "object",
+        "properties": {key: spec for key in keys},
+        "required": list(keys),
+        "additionalProperties": False,
+    }
+
+
+def parse_key_specs(response_raw: str, keys: list[str]) -> tuple[dict, list[str]]:
+    """
+    Split a batched answer into valid entries, as key -> (type, options or
+    None), and the keys whose entries are missing or invalid. A choice key
+    needs at least one non-empty option.
+    """
+    try:
+        response = json.loads(response_raw)
+    except json.JSONDecodeError:
+        return {}, list(keys)
+    if not isinstance(response, dict):
+        return {}, list(keys)
+    valid = {}
+    invalid = []
+    for key in keys:
+        spec = response.get(key)
+        key_type = spec.get("type") if isinstance(spec, dict) else None
+        options = spec.get("options") if isinstance(spec, dict) else None
+        if key_type in ("int", "float"):
+            valid[key] = (key_type, None)
+        elif (
+            key_type == "choice"
+            and isinstance(options, list)
+            and options
+            and all(isinstance(x, str) and x.strip("\"' ") for x in options)
+        ):
+            valid[key] = (key_type, options)
+        else:
+            invalid.append(key)
+    return valid, invalid
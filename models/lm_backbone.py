@@ -4,7 +4,7 @@ from tqdm import tqdm
 import os
 from models.lm_logging import LmLogger
 from inspect import currentframe
-from server.model_client import ModelAPIClient, ForwardRequest
+from server.model_client import ModelAPIClient
 
 tqdm.pandas()
 INPUT_TOKEN_LIMIT = 4096
@@ -18,13 +18,16 @@ class LmBackboneModel:
         use_cache: bool,
         # mode: PromptMode = PromptMode.DEFAULT,
         lm_logger: Optional[LmLogger] = None,
+        random_seed: int = 0,
     ):
         # self.lm_wrapper = lm_wrapper
         # self.mode = mode
         self.id_of_model = id_of_model
         self.lm_logger = lm_logger
         self.use_cache = use_cache
-        self.client = ModelAPIClient("http://localhost:8000", self.lm_logger)
+        self.client = ModelAPIClient(
+            "http://localhost:8000", random_seed=random_seed, lm_logger=self.lm_logger
+        )
 
     def forward(
         self,
@@ -32,23 +35,26 @@ class LmBackboneModel:
         num_completions: Optional[int] = None,
         logging_role: str = "No_Role",
     ) -> str | List[str]:
-        self.lm_logger.current_input = history
-
-        forward_request = ForwardRequest(
-            name_of_model=self.id_of_model,
-            history=history,
-            use_cache=self.use_cache,
-            constraints=None,
-            random_seed=self.client.random_seed,
-        )
-        output = self.client.forward(forward_request)
-
+        """
+        One completion, or a list of `num_completions` sampled in a single
+        request. The client logs every completion.
+        """
         if self.lm_logger:
-            first_output = output[-1] if isinstance(output, list) else output
-            self.lm_logger.log_io(
-                lm_input=history, lm_output=first_output, role=logging_role
+            self.lm_logger.current_input = history
+        if num_completions is None:
+            return self.client.forward(
+                history,
+                chat_model_id=self.id_of_model,
+                use_cache=self.use_cache,
+                logging_role=logging_role,
             )
-        return output
+        return self.client.forward_samples(
+            history,
+            chat_model_id=self.id_of_model,
+            use_cache=self.use_cache,
+            logging_role=logging_role,
+            n=num_completions,
+        )
 
 
 # if __name__ == "__main__":
@@ -0,0 +1,258 @@
+"""Inference backends for the model servers.
+
+A backend loads a model as {"model", "raw_model", "tokenizer"}: 4-bit CUDA,
+dynamic int8 on CPU, or llama.cpp. Backends are chosen per model with
+MODEL_BACKENDS (see `parse_backend_config`), or DEFAULT_BACKEND otherwise.
+"""
+
+from typing import Optional
+import importlib.util
+import json
+import os
+
+AUTO = "auto"
+
+
+def _numa_cpus(node: int) -> set[int]:
+    """CPUs belonging to a NUMA node, read from sysfs."""
+    with open(f"/sys/devices/system/node/node{node}/cpulist") as f:
+        cpus = set()
+        for part in f.read().strip().split(","):
+            if "-" in part:
+                lo, hi = part.split("-")
+                cpus.update(range(int(lo), int(hi) + 1))
+            elif part:
+                cpus.add(int(part))
+        return cpus
+
+
+def llama_cpp_available() -> bool:
+    return importlib.util.find_spec("llama_cpp") is not None
+
+
+class ModelBackend:
+    """
+    Loads models and prepares the worker thread that runs them.
+    """
+
+    name = None
+    # Whether models occupy accelerator memory and are placed by the residency manager
+    uses_device = True
+    # Whether outlines can decode a list of prompts as one batch
+    supports_batch = True
+
+    def __init__(self, options: Optional[dict] = None):
+        self.options = options or {}
+
+    def load(self, model_name: str, device: int) -> dict:
+        raise NotImplementedError
+
+    def activate(self):
+        """Called on the worker thread before each generation."""
+        pass
+
+
+class CudaBnb4bitBackend(ModelBackend):
+    """
+    HuggingFace weights quantized to 4 bits with bitsandbytes on a CUDA device.
+    """
+
+    name = "cuda-4bit"
+
+    def load(self, model_name: str, device: int) -> dict:
+        import torch
+        import outlines
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=False)
+        raw_model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            torch_dtype=torch.bfloat16,
+            load_in_4bit=True,
+            device_map={"": f"cuda:{device}"},
+        )
+        model_obj = outlines.models.Transformers(raw_model, tokenizer)
+        return {"model": model_obj, "raw_model": raw_model, "tokenizer": tokenizer}
+
+
+class _CpuBackend(ModelBackend):
+    """
+    Shared thread and NUMA handling for CPU backends.
+
+    Options:
+        threads (int): intra-op threads; defaults to the NUMA node's CPU count
+        numa_node (int): pin the model's worker thread to this node's CPUs
+    """
+
+    uses_device = False
+
+    def cpus(self) -> Optional[set[int]]:
+        if self.options.get("numa_node") is None:
+            return None
+        return _numa_cpus(int(self.options["numa_node"]))
+
+    def threads(self) -> Optional[int]:
+        if self.options.get("threads"):
+            return int(self.options["threads"])
+        cpus = self.cpus()
+        return len(cpus) if cpus else None
+
+    def activate(self):
+        cpus = self.cpus()
+        if cpus:
+            # Pins the calling (worker) thread; threads it spawns inherit the mask
+            os.sched_setaffinity(0, cpus)
+
+
+# torch's intra-op thread count is per process; the first cpu-int8 backend sets it
+_torch_threads = None
+
+
+class CpuInt8Backend(_CpuBackend):
+    """
+    HuggingFace weights on CPU with dynamic int8 quantization of the linear layers.
+
+    torch has one intra-op thread count per process. The first cpu-int8 model
+    activated sets it and later ones with a different "threads" share it; use
+    "replicas" to give a model its own processes and thread count.
+
+    Options (besides threads / numa_node):
+        quantize (bool): apply dynamic int8 quantization (default True)
+    """
+
+    name = "cpu-int8"
+
+    def activate(self):
+        import torch
+
+        global _torch_threads
+        super().activate()
+        threads = self.threads()
+        if threads and _torch_threads is None:
+            torch.set_num_threads(threads)
+            _torch_threads = threads
+
+    def load(self, model_name: str, device: int) -> dict:
+        import torch
+        import outlines
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        self.activate()
+        if self.threads() and self.threads() != _torch_threads:
+            print(
+                f"[{model_name}] torch already uses {_torch_threads} threads in"
+                f" this process; ignoring threads={self.threads()}"
+            )
+        tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=False)
+        raw_model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            torch_dtype=torch.float32,
+            device_map={"": "cpu"},
+            low_cpu_mem_usage=True,
+        )
+        raw_model.eval()
+        if self.options.get("quantize", True):
+            raw_model = torch.ao.quantization.quantize_dynamic(
+                raw_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        model_obj = outlines.models.Transformers(raw_model, tokenizer)
+        return {"model": model_obj, "raw_model": raw_model, "tokenizer": tokenizer}
+
+
+class LlamaCppBackend(_CpuBackend):
+    """
+    GGUF weights run with llama.cpp (requires `llama-cpp-python`).
+
+    Options (besides threads / numa_node):
+        model_path (str): local GGUF file, or
+        repo_id, filename (str): GGUF file on the HuggingFace Hub
+        tokenizer (str): HF tokenizer used for the chat template (default: model name)
+        n_ctx (int): context window (default 8192)
+    """
+
+    name = "llama-cpp"
+    supports_batch = False
+
+    def load(self, model_name: str, device: int) -> dict:
+        import outlines
+        from llama_cpp import Llama
+        from transformers import AutoTokenizer
+
+        self.activate()
+        tokenizer = AutoTokenizer.from_pretrained(
+            self.options.get("tokenizer", model_name), use_fast=False
+        )
+        kwargs = {
+            "n_ctx": int(self.options.get("n_ctx", 8192)),
+            "n_threads": self.threads(),
+            "verbose": False,
+        }
+        if self.options.get("numa_node") is not None:
+            kwargs["numa"] = True
+        if "model_path" in self.options:
+            llm = Llama(model_path=self.options["model_path"], **kwargs)
+        else:
+            llm = Llama.from_pretrained(
+                repo_id=self.options["repo_id"],
+                filename=self.options["filename"],
+                **kwargs,
+            )
+        model_obj = outlines.models.LlamaCpp(llm)
+        return {"model": model_obj, "raw_model": None, "tokenizer": tokenizer}
+
+
+BACKENDS = {b.name: b for b in (CudaBnb4bitBackend, CpuInt8Backend, LlamaCppBackend)}
+
+
+def parse_backend_config(value: Optional[str]) -> dict:
+    """
+    Parse MODEL_BACKENDS, a JSON object of model name -> options, e.g.
+
+        MODEL_BACKENDS='{
+            "meta-llama/Llama-3.2-1B-Instruct": {"backend": "cpu-int8", "threads": 8, "numa_node": 0},
+            "meta-llama/Llama-3.1-8B-Instruct": {"backend": "llama-cpp",
+                "repo_id": "bartowski/Meta-Llama-3.1-8B-Instruct-GGUF",
+                "filename": "*Q4_K_M.gguf", "threads": 16}
+        }'
+
+    CPU models may also set "replicas": N to be served by N worker processes on
+    the concurrent server, spread over "numa_nodes": [0, 1] if given. llama.cpp
+    replicas share the memory-mapped weights; cpu-int8 replicas each hold a copy.
+    """
+    if not value:
+        return {}
+    config = json.loads(value)
+    assert isinstance(config, dict), "MODEL_BACKENDS must be a JSON object."
+    return config
+
+
+def get_backend(
+    model_name: str, config: dict, has_gpu: bool, default: str = AUTO
+) -> ModelBackend:
+    """
+    Pick the backend for `model_name` from its MODEL_BACKENDS options.
+
+    "auto" uses 4-bit CUDA when a GPU is available. Without one it uses
+    llama.cpp if it is installed and the model has a GGUF file configured,
+    and dynamic int8 otherwise.
+    """
+    options = dict(config.get(model_name, {}))
+    name = options.pop("backend", default)
+    if name == AUTO:
+        if has_gpu:
+            name = CudaBnb4bitBackend.name
+        elif llama_cpp_available() and (
+            "model_path" in options or "repo_id" in options
+        ):
+            name = LlamaCppBackend.name
+        else:
+            name = CpuInt8Backend.name
+    if name == LlamaCppBackend.name and not llama_cpp_available():
+        print(f"[{model_name}] llama-cpp-python is not installed, using cpu-int8.")
+        name = CpuInt8Backend.name
+    if name == CudaBnb4bitBackend.name and not has_gpu:
+        print(f"[{model_name}] No GPU available, using cpu-int8.")
+        name = CpuInt8Backend.name
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name}, expected one of {list(BACKENDS)}")
+    return BACKENDS[name](options)
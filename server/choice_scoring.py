@@ -0,0 +1,111 @@
+"""Likelihood scoring for `choice` constraints.
+
+Instead of decoding a choice token by token, the prompt is prefilled once and
+every option is scored as a continuation of the shared prompt KV cache in a
+single batched forward pass.
+"""
+
+import torch
+
+
+def _expand_past_key_values(past_key_values, n: int):
+    """
+    Repeat a batch-size-1 KV cache `n` times along the batch dimension.
+    """
+    if hasattr(past_key_values, "batch_repeat_interleave"):
+        # transformers.DynamicCache
+        past_key_values.batch_repeat_interleave(n)
+        return past_key_values
+    return tuple(
+        tuple(t.expand(n, *t.shape[1:]).contiguous() for t in layer)
+        for layer in past_key_values
+    )
+
+
+@torch.inference_mode()
+def score_choices(model, tokenizer, prompt: str, choices: list[str]) -> dict:
+    """
+    Score each option in `choices` as a continuation of `prompt`.
+
+    Parameters:
+        model: a HuggingFace causal LM
+        tokenizer: the matching HuggingFace tokenizer
+        prompt (str): the fully templated prompt
+        choices (list[str]): the candidate continuations
+
+    Returns:
+        dict: {"choice": <argmax option>, "probs": {option: probability}}
+
+    An option's score is its mean log-probability per token, so long options
+    are not penalized for their length.
+    """
+    assert len(choices) > 0, "At least one choice is required."
+    device = model.device
+
+    prompt_ids = tokenizer(
+        prompt, return_tensors="pt", add_special_tokens=False
+    ).input_ids.to(device)
+    option_ids = [tokenizer(c, add_special_tokens=False).input_ids for c in choices]
+    assert all(len(ids) > 0 for ids in option_ids), "Choices must not be empty."
+
+    # 1) Prefill the shared prompt once
+    prefill = model(input_ids=prompt_ids, use_cache=True)
+    first_logprobs = torch.log_softmax(prefill.logits[0, -1].float(), dim=-1)
+    scores = torch.stack([first_logprobs[ids[0]] for ids in option_ids])
+
+    # 2) Score the remaining option tokens in one batched pass over the cache
+    n = len(choices)
+    max_len = max(len(ids) for ids in option_ids)
+    if max_len > 1:
+        pad_id = tokenizer.pad_token_id
+        if pad_id is None:
+            pad_id = tokenizer.eos_token_id or 0
+        # feed every option token except the last; right padding is safe
+        # because real tokens never attend to the padding after them
+        cont_ids = torch.full((n, max_len - 1), pad_id, dtype=torch.long)
+        cont_mask = torch.zeros((n, max_len - 1), dtype=torch.long)
+        for i, ids in enumerate(option_ids):
+            cont_ids[i, : len(ids) - 1] = torch.tensor(ids[:-1])
+            cont_mask[i, : len(ids) - 1] = 1
+        attention_mask = torch.cat(
+            [torch.ones((n, prompt_ids.shape[1]), dtype=torch.long), cont_mask], dim=1
+        )
+        past_key_values = _expand_past_key_values(prefill.past_key_values, n)
+        cont = model(
+            input_ids=cont_ids.to(device),
+            attention_mask=attention_mask.to(device),
+            past_key_values=past_key_values,
+            use_cache=False,
+        )
+        cont_logprobs = torch.log_softmax(cont.logits.float(), dim=-1)
+        for i, ids in enumerate(option_ids):
+            for j in range(1, len(ids)):
+                scores[i] += cont_logprobs[i, j - 1, ids[j]]
+
+    # 3) Normalize per-token log-likelihoods over the option set
+    scores = scores / torch.tensor([float(len(ids)) for ids in option_ids]).to(device)
+    probs = torch.softmax(scores, dim=0).tolist()
+    best = int(torch.argmax(scores).item())
+    return {
+        "choice": choices[best],
+        "probs": {c: p for c, p in zip(choices, probs)},
+    }
+
+
+def sample_choices(
+    probs: dict, num_samples: int, temperature: float, seed: int = None
+) -> list[str]:
+    """
+    Draw `num_samples` options from `probs` at `temperature`, as the
+    multinomial sampler draws tokens, using a generator seeded with `seed`.
+    """
+    choices = list(probs)
+    logits = torch.tensor([probs[c] for c in choices], dtype=torch.float).log()
+    weights = torch.softmax(logits / temperature, dim=0)
+    generator = torch.Generator()
+    if seed is not None:
+        generator.manual_seed(seed)
+    picks = torch.multinomial(
+        weights, num_samples, replacement=True, generator=generator
+    )
+    return [choices[i] for i in picks.tolist()]
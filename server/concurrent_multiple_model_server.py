@@ -1,6 +1,5 @@
 from pydantic import BaseModel
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
 import openai
 import os
 from fastapi import FastAPI, HTTPException
@@ -12,8 +11,35 @@ import uvicorn
 from dotenv import load_dotenv
 import time
 import threading
-import queue  # <--- For the per-model queues
+import math
 import gc
+import json
+import asyncio
+import queue
+from collections import OrderedDict
+from functools import partial
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from server.choice_scoring import sample_choices, score_choices
+from server.json_schema import canonical_schema, schema_to_regex
+from server.prompt_cache import PromptTokenCache, pretokenized, pretokenized_encode
+from server.request_cache import ResponseLRU, SingleFlight, request_key
+from server.transport import MsgpackRoute
+from server.scheduling import (
+    FairPriorityQueue,
+    QueueFullError,
+    PRIORITIES,
+    DEFAULT_PRIORITY,
+)
+from server.metrics import MetricsRegistry, SIZE_BUCKETS, RATE_BUCKETS, CONTENT_TYPE
+from server.backends import get_backend, parse_backend_config
+from server.replicas import ReplicaPool, ReplicaError, ReplicaCrashedError
+from server.residency import (
+    ResidencyManager,
+    TorchDeviceInventory,
+    InsufficientMemoryError,
+    parse_budget_gb,
+    GB,
+)
 
 load_dotenv(override=False)
 
@@ -23,9 +49,12 @@ Run with:
 """
 memory = Memory(".joblib_cache", verbose=0)
 app = FastAPI()
+# Accept msgpack request bodies as well as JSON
+app.router.route_class = MsgpackRoute
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-sampler = outlines.samplers.multinomial(temperature=0.7)
+SAMPLING_TEMPERATURE = 0.7
+sampler = outlines.samplers.multinomial(temperature=SAMPLING_TEMPERATURE)
 
 # ---------------------------
 # Global storages
@@ -36,25 +65,173 @@ MODEL_STORE = {}
 MODEL_STORE structure:
 {
     "<model_name>": {
-        "model": <outlines.models.Transformers(...)>,
+        "model": <outlines model>,
+        "raw_model": <AutoModelForCausalLM, or None for llama.cpp>,
         "tokenizer": <AutoTokenizer>,
-        "device": 0,        # e.g. 0 means "cuda:0"
+        "backend": <ModelBackend>,
+        "device": 0,        # e.g. 0 means "cuda:0", -1 means host RAM / CPU
+        "on_host": False,   # True while the weights sit in host standby
         "last_used": time.time(),
     },
     ...
 }
 """
 
-GPU_OCCUPANCY = {gpu_id: set() for gpu_id in range(torch.cuda.device_count())}
-
+# Models idle for this long are moved to host standby (not deleted)
 INACTIVITY_TIMEOUT = 6 * 60 * 60  # 6 hours
 # INACTIVITY_TIMEOUT = 10  # 10 seconds
+# Per-device budget in GB, e.g. "40" for every GPU or "40,20" per GPU. Defaults to all memory.
+GPU_MEMORY_BUDGET = parse_budget_gb(os.getenv("GPU_MEMORY_BUDGET_GB"))
+# Host RAM reserved for evicted models kept warm in pinned memory
+HOST_STANDBY_BUDGET = int(float(os.getenv("HOST_STANDBY_BUDGET_GB", "64")) * GB)
+# Size assumed for a model whose footprint cannot be estimated before loading
+DEFAULT_MODEL_BYTES = int(float(os.getenv("DEFAULT_MODEL_GB", "8")) * GB)
+# Per-model backend options (JSON), see server/backends.py
+MODEL_BACKENDS = parse_backend_config(os.getenv("MODEL_BACKENDS"))
+# Backend for models without options: auto, cuda-4bit, cpu-int8 or llama-cpp
+DEFAULT_BACKEND = os.getenv("DEFAULT_BACKEND", "auto")
 # One lock to protect the actual model_store loading/unloading
-model_store_lock = threading.Lock()
+model_store_lock = threading.RLock()
 
 # Create a queue per model name when needed
-MODEL_QUEUES = {}  # model_name -> queue.Queue
-MODEL_WORKERS = {}  # model_name -> threading.Thread
+MODEL_QUEUES = {}  # model_name -> FairPriorityQueue
+MODEL_WORKERS = {}  # model_name -> [threading.Thread], one per replica
+REPLICA_POOLS = {}  # model_name -> ReplicaPool, for models served by replica processes
+worker_start_lock = threading.Lock()
+# Seconds a replica may spend on one call before it is considered hung
+REPLICA_CALL_TIMEOUT = float(os.getenv("REPLICA_CALL_TIMEOUT", "600"))
+# Jobs admitted per model before answering 429; 0 disables the bound
+MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", "64"))
+# Extra queue slots only interactive (human dialog) requests may use
+INTERACTIVE_QUEUE_RESERVE = int(os.getenv("INTERACTIVE_QUEUE_RESERVE", "8"))
+
+# Compiled outlines generators, so repeated constraints skip FSM compilation
+# (model_name, constraint_type, constraints) -> generator
+GENERATOR_CACHE = OrderedDict()
+GENERATOR_CACHE_SIZE = int(os.getenv("GENERATOR_CACHE_SIZE", "256"))
+generator_cache_lock = threading.Lock()
+
+# In-memory responses in front of the joblib cache, and coalescing of identical
+# requests that arrive while the first one is still generating
+RESPONSE_LRU = ResponseLRU(int(os.getenv("RESPONSE_CACHE_SIZE", "4096")))
+SINGLE_FLIGHT = SingleFlight()
+# Token ids of rendered histories, so growing dialogs only tokenize new messages
+PROMPT_CACHE = PromptTokenCache(int(os.getenv("PROMPT_CACHE_SIZE", "512")))
+
+# Startup preloading, e.g. PRELOAD_MODELS="meta-llama/Llama-3.1-8B-Instruct,..."
+PRELOAD_MODELS = [m for m in os.getenv("PRELOAD_MODELS", "").split(",") if m]
+# JSON list of {"constraint_type": ..., "constraints": ...} to compile and warm up per model
+PRELOAD_CONSTRAINTS = json.loads(
+    os.getenv(
+        "PRELOAD_CONSTRAINTS",
+        json.dumps(
+            [
+                {"constraint_type": "none"},
+                {"constraint_type": "types", "constraints": ["int"]},
+                {"constraint_type": "types", "constraints": ["float"]},
+                {"constraint_type": "choice", "constraints": ["yes", "no"]},
+            ]
+        ),
+    )
+)
+WARMUP_GENERATIONS = int(os.getenv("WARMUP_GENERATIONS", "1"))
+WARMUP_MAX_TOKENS = 8
+WARMUP_HISTORY = [{"role": "user", "content": "Say hello."}]
+# model_name -> "pending" | "loading" | "warming" | "ready" | "failed: ..."
+MODEL_READINESS = {}
+
+# Per-thread flags set while a worker runs a job
+_generation_state = threading.local()
+
+# ---------------------------
+# Metrics (served on /metrics)
+# ---------------------------
+
+METRICS = MetricsRegistry()
+REQUESTS = METRICS.counter(
+    "lm_requests_total", "Forward requests by outcome.", ("model", "status")
+)
+QUEUE_DEPTH = METRICS.gauge(
+    "lm_queue_depth", "Jobs waiting in the model's queue.", ("model", "priority")
+)
+QUEUE_WAIT = METRICS.histogram(
+    "lm_queue_wait_seconds",
+    "Time a job waited before its worker started it.",
+    ("model", "priority"),
+)
+REJECTED_REQUESTS = METRICS.counter(
+    "lm_rejected_requests_total",
+    "Requests rejected with 429 because the model's queue was full.",
+    ("model", "priority"),
+)
+REQUEST_LATENCY = METRICS.histogram(
+    "lm_request_seconds", "Time a job spent running on its worker.", ("model",)
+)
+BATCH_SIZE = METRICS.histogram(
+    "lm_batch_size",
+    "Sequences per generation call (choice options are scored as one batch).",
+    ("model",),
+    buckets=SIZE_BUCKETS,
+)
+FORWARD_LATENCY = METRICS.histogram(
+    "lm_forward_seconds",
+    "Model forward pass latency; prefill passes feed more than one token per sequence.",
+    ("model", "phase"),
+)
+FORWARD_TOKENS = METRICS.counter(
+    "lm_forward_tokens_total", "Tokens fed through forward passes.", ("model", "phase")
+)
+GENERATED_TOKENS = METRICS.counter(
+    "lm_generated_tokens_total", "Tokens in generated outputs.", ("model",)
+)
+TOKENS_PER_SECOND = METRICS.histogram(
+    "lm_tokens_per_second",
+    "Generated tokens per second of generation time, per request.",
+    ("model",),
+    buckets=RATE_BUCKETS,
+)
+PROMPT_TOKENS = METRICS.counter(
+    "lm_prompt_tokens_total",
+    "Prompt tokens by source (reused from the prompt token cache or the client, tokenized).",
+    ("model", "source"),
+)
+CACHE_LOOKUPS = METRICS.counter(
+    "lm_cache_lookups_total",
+    "Cache lookups by cache (memory, response, fsm, prefix) and result (hit, miss).",
+    ("cache", "model", "result"),
+)
+COALESCED_REQUESTS = METRICS.counter(
+    "lm_coalesced_requests_total",
+    "Requests answered by an identical request already in flight.",
+    ("model",),
+)
+STREAM_CANCELLATIONS = METRICS.counter(
+    "lm_stream_cancellations_total",
+    "Streamed generations stopped because the client went away.",
+    ("model",),
+)
+TRUNCATIONS = METRICS.counter(
+    "lm_truncated_generations_total",
+    "Generations cut off by the request's max_new_tokens.",
+    ("model",),
+)
+REPLICA_CRASHES = METRICS.counter(
+    "lm_replica_crashes_total", "Replica processes that died mid-call.", ("model",)
+)
+LOADED_MODELS = METRICS.gauge(
+    "lm_model_loaded",
+    "Models in the model store and where they live.",
+    ("model", "state", "device"),
+)
+DEVICE_MEMORY = METRICS.gauge(
+    "lm_device_memory_bytes",
+    "Device memory: total, free, budget, and bytes held by models; host standby bytes.",
+    ("device", "kind"),
+)
+
+
+def record_cache_lookup(cache: str, model_name: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, model=model_name, result="hit" if hit else "miss")
 
 
 class ForwardRequest(BaseModel):
@@ -65,6 +242,44 @@ class ForwardRequest(BaseModel):
     constraint_type: Optional[str]
     response_format: Any
     random_seed: int
+    # Generation budget in tokens and stop strings; None means unlimited
+    max_new_tokens: Optional[int] = None
+    stop: Optional[list[str]] = None
+    # Number of samples; see `sample_requests`
+    n: int = 1
+    # Token ids of the first `prefix_messages` messages, sent by clients that
+    # hold the tokenizer. Only saves tokenization; not part of the cached request
+    prefix_token_ids: Optional[list[int]] = None
+    prefix_messages: int = 0
+    # Scheduling only; not part of the cached request
+    priority: str = DEFAULT_PRIORITY
+    client_id: Optional[str] = None
+
+
+SCHEDULING_FIELDS = {"priority", "client_id"}
+UNCACHED_FIELDS = SCHEDULING_FIELDS | {"prefix_token_ids", "prefix_messages"}
+
+
+def _cache_identity(request: ForwardRequest) -> ForwardRequest:
+    """Reset the fields that do not change the output, so identical requests
+    share cache entries."""
+    return request.model_copy(
+        update={
+            "priority": DEFAULT_PRIORITY,
+            "client_id": None,
+            "prefix_token_ids": None,
+            "prefix_messages": 0,
+        }
+    )
+
+
+def _forward_cached(request: ForwardRequest):
+    """`forward_hf` on the cache identity of `request`, keeping its prefix ids."""
+    _generation_state.prefix = (request.prefix_token_ids, request.prefix_messages)
+    try:
+        return forward_hf(_cache_identity(request))
+    finally:
+        _generation_state.prefix = None
 
 
 def _str_to_type(s):
@@ -76,31 +291,169 @@ def _str_to_type(s):
         raise NotImplementedError(f"Type {s} not supported.")
 
 
+def _parse_constraints(request: ForwardRequest):
+    if request.constraint_type == "types":
+        return [_str_to_type(x) for x in request.constraints]
+    elif request.constraint_type == "choice":
+        return request.constraints
+    elif request.constraint_type == "regex":
+        return request.constraints
+    elif request.constraint_type == "json_schema":
+        return canonical_schema(request.constraints)
+    elif request.constraint_type == "cfg":
+        return request.constraints
+    elif request.constraint_type == "none":
+        return None
+    else:
+        raise NotImplementedError(f"Unknown constraint type: {request.constraint_type}")
+
+
+def _build_generator(model_obj, constraint_type, constraints):
+    if not constraints or constraint_type == "none":
+        return outlines.generate.text(model_obj, sampler=sampler)
+    elif constraint_type == "choice":
+        return outlines.generate.choice(model_obj, constraints, sampler=sampler)
+    elif constraint_type == "types":
+        # Typically expect single type
+        assert (
+            len(constraints) == 1
+        ), "For 'types' constraint, provide exactly one type."
+        return outlines.generate.format(model_obj, constraints[0], sampler=sampler)
+    elif constraint_type == "regex":
+        return outlines.generate.regex(model_obj, constraints, sampler=sampler)
+    elif constraint_type == "json_schema":
+        return outlines.generate.regex(
+            model_obj, schema_to_regex(constraints), sampler=sampler
+        )
+    elif constraint_type == "cfg":
+        # A Lark grammar; see datamodels/checker_grammar.py
+        return outlines.generate.cfg(model_obj, constraints, sampler=sampler)
+    else:
+        raise NotImplementedError(f"Constraint type {constraint_type} not supported.")
+
+
+def _generation_kwargs(request: ForwardRequest, constraints) -> dict:
+    """Budget and stop strings for a call to an outlines generator."""
+    kwargs = {"max_tokens": request.max_new_tokens}
+    # Stop strings would cut structured output short of a full match
+    if request.stop and (not constraints or request.constraint_type == "none"):
+        kwargs["stop_at"] = request.stop
+    return kwargs
+
+
+def record_truncation(request: ForwardRequest, n_tokens: int):
+    if request.max_new_tokens and n_tokens >= request.max_new_tokens:
+        print(
+            f"[{request.name_of_model}] Generation truncated at {request.max_new_tokens} tokens."
+        )
+        TRUNCATIONS.inc(model=request.name_of_model)
+
+
+def get_generator(model_name: str, model_obj, constraint_type, constraints):
+    """
+    Return an outlines generator for the constraint, reusing the compiled FSM
+    when the same constraint was seen before for this model.
+    """
+    key = (
+        model_name,
+        constraint_type,
+        json.dumps(constraints, sort_keys=True, default=str),
+    )
+    with generator_cache_lock:
+        if key in GENERATOR_CACHE:
+            GENERATOR_CACHE.move_to_end(key)
+            record_cache_lookup("fsm", model_name, hit=True)
+            return GENERATOR_CACHE[key]
+    record_cache_lookup("fsm", model_name, hit=False)
+
+    generator = _build_generator(model_obj, constraint_type, constraints)
+
+    with generator_cache_lock:
+        GENERATOR_CACHE[key] = generator
+        while len(GENERATOR_CACHE) > GENERATOR_CACHE_SIZE:
+            GENERATOR_CACHE.popitem(last=False)
+    return generator
+
+
+def _drop_generators(model_name: str):
+    with generator_cache_lock:
+        for key in [k for k in GENERATOR_CACHE if k[0] == model_name]:
+            del GENERATOR_CACHE[key]
+
+
 @memory.cache
 def forward_hf(request: ForwardRequest):
     """
     The main text-generation function using Outlines & HuggingFace models.
     """
+    # A streamed generation stores its finished result through this call
+    precomputed = getattr(_generation_state, "precomputed", None)
+    if precomputed is not None:
+        return precomputed
+
+    # Lets the caller tell a generation from a response cache hit
+    _generation_state.generated = True
+    prefix_token_ids, prefix_messages = getattr(_generation_state, "prefix", None) or (
+        None,
+        0,
+    )
+    return generate_hf(request, 1, prefix_token_ids, prefix_messages)[0]
+
+
+def _prompt_token_ids(
+    request: ForwardRequest,
+    tokenizer,
+    prompt: str,
+    prefix_token_ids: Optional[list[int]],
+    prefix_messages: int,
+) -> Optional[list[int]]:
+    """Ids of `prompt` from PROMPT_CACHE, or None if outlines should tokenize it."""
+    name_of_model = request.name_of_model
+    if MODEL_STORE[name_of_model]["raw_model"] is None:
+        # llama.cpp models tokenize prompts themselves
+        return None
+    ids, reused = PROMPT_CACHE.encode(
+        name_of_model,
+        tokenizer,
+        request.history,
+        prompt,
+        prefix_token_ids,
+        prefix_messages,
+    )
+    record_cache_lookup("prefix", name_of_model, hit=reused > 0)
+    PROMPT_TOKENS.inc(reused, model=name_of_model, source="reused")
+    PROMPT_TOKENS.inc(len(ids) - reused, model=name_of_model, source="tokenized")
+    return ids
+
+
+def generate_hf(
+    request: ForwardRequest,
+    num_samples: int,
+    prefix_token_ids: Optional[list[int]] = None,
+    prefix_messages: int = 0,
+    seeds: Optional[list[int]] = None,
+) -> list[dict]:
+    """
+    Generate `num_samples` independent results for `request`, decoding them as
+    one batch where the backend supports it. Uncached; see `forward_hf`.
+
+    `seeds` holds the seed of each sample and defaults to `random_seed + i`.
+    Backends that decode one sample at a time use each seed; a batch shares one
+    generator seeded with the first, so its samples are reproducible as a batch.
+    """
     name_of_model = request.name_of_model
+    if seeds is None:
+        seeds = [request.random_seed + i for i in range(num_samples)]
     history = request.history
 
     # Handle constraints
-    if request.constraint_type == "types":
-        constraints = [_str_to_type(x) for x in request.constraints]
-    elif request.constraint_type == "choice":
-        constraints = request.constraints
-    elif request.constraint_type == "regex":
-        constraints = request.constraints
-    elif request.constraint_type == "none":
-        constraints = None
-    else:
-        raise NotImplementedError(f"Unknown constraint type: {request.constraint_type}")
+    constraints = _parse_constraints(request)
 
     print(f"[{name_of_model}] History: {history}")
     print(
         f"[{name_of_model}] Constraints: {constraints} (type={request.constraint_type})"
     )
-    print(f"GPU Occupancy: {GPU_OCCUPANCY}")
+    print(f"Residency: {RESIDENCY.summary()}")
 
     model_obj, tokenizer = load_model_if_needed(name_of_model)
 
@@ -112,101 +465,529 @@ def forward_hf(request: ForwardRequest):
             add_generation_prompt=True,
         )
 
-        if not constraints or request.constraint_type == "none":
-            generator = outlines.generate.text(model_obj, sampler=sampler)
-        elif request.constraint_type == "choice":
-            generator = outlines.generate.choice(
-                model_obj, constraints, sampler=sampler
+        if (
+            request.constraint_type == "choice"
+            and constraints
+            and can_score_choices(name_of_model)
+        ):
+            # Fast path: score all options in one batched pass instead of
+            # decoding, then sample from the scores as the sampler would
+            BATCH_SIZE.observe(len(constraints), model=name_of_model)
+            scored = score_choices(
+                MODEL_STORE[name_of_model]["raw_model"], tokenizer, prompt, constraints
             )
-        elif request.constraint_type == "types":
-            # Typically expect single type
-            assert (
-                len(constraints) == 1
-            ), "For 'types' constraint, provide exactly one type."
-            generator = outlines.generate.format(
-                model_obj, constraints[0], sampler=sampler
-            )
-        elif request.constraint_type == "regex":
-            generator = outlines.generate.regex(model_obj, constraints, sampler=sampler)
-        else:
-            raise NotImplementedError(
-                f"Constraint type {request.constraint_type} not supported."
+            print(f"[{name_of_model}] Choice probabilities: {scored['probs']}")
+            with model_store_lock:
+                MODEL_STORE[name_of_model]["last_used"] = time.time()
+            picks = sample_choices(
+                scored["probs"], num_samples, SAMPLING_TEMPERATURE, seeds[0]
             )
+            return [
+                {"generated_text": choice, "choice_probs": scored["probs"]}
+                for choice in picks
+            ]
 
-        generated_text = str(generator(prompt)).strip()
-        print(f"[{name_of_model}] Generated text: {generated_text}")
+        generator = get_generator(
+            name_of_model, model_obj, request.constraint_type, constraints
+        )
+        kwargs = _generation_kwargs(request, constraints)
+        prompt_ids = _prompt_token_ids(
+            request, tokenizer, prompt, prefix_token_ids, prefix_messages
+        )
+        start = time.perf_counter()
+        with pretokenized(prompt, prompt_ids):
+            if num_samples == 1:
+                BATCH_SIZE.observe(1, model=name_of_model)
+                outputs = [generator(prompt, seed=seeds[0], **kwargs)]
+            elif MODEL_STORE[name_of_model]["backend"].supports_batch:
+                BATCH_SIZE.observe(num_samples, model=name_of_model)
+                # Each row is prefilled separately; the prompt is shared only
+                # through the prompt token cache
+                outputs = generator([prompt] * num_samples, seed=seeds[0], **kwargs)
+            else:
+                outputs = []
+                for seed in seeds:
+                    BATCH_SIZE.observe(1, model=name_of_model)
+                    outputs.append(generator(prompt, seed=seed, **kwargs))
+        elapsed = time.perf_counter() - start
+
+        results = []
+        total_tokens = 0
+        for output in outputs:
+            generated_text = str(output).strip()
+            print(f"[{name_of_model}] Generated text: {generated_text}")
+            n_tokens = len(
+                tokenizer(generated_text, add_special_tokens=False).input_ids
+            )
+            total_tokens += n_tokens
+            record_truncation(request, n_tokens)
+            results.append({"generated_text": generated_text})
+        GENERATED_TOKENS.inc(total_tokens, model=name_of_model)
+        if elapsed > 0:
+            TOKENS_PER_SECOND.observe(total_tokens / elapsed, model=name_of_model)
 
         # Update last_used
         with model_store_lock:
             MODEL_STORE[name_of_model]["last_used"] = time.time()
 
-        return {"generated_text": generated_text}
+        return results
 
     except Exception as e:
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error generating text: {e}")
+    finally:
+        RESIDENCY.release(name_of_model)
+
+
+def sample_requests(request: ForwardRequest) -> list[ForwardRequest]:
+    """
+    Sample i of an `n`-sample request is the single-sample request seeded with
+    `random_seed + i`, so each sample has its own cache entry and sample 0 is
+    the plain request. The seed is passed on to the sampler; see `generate_hf`.
+    """
+    return [
+        request.model_copy(update={"n": 1, "random_seed": request.random_seed + i})
+        for i in range(request.n)
+    ]
+
+
+def run_forward(request: ForwardRequest):
+    """
+    Default worker handler: the cached `forward_hf`, recording whether the
+    response came from the cache. Runs on this worker's replica process if the
+    model is served by replicas.
+    """
+    replica = getattr(_generation_state, "replica", None)
+    if replica is not None:
+        output, _generation_state.generated = call_replica(
+            replica, "forward", request.model_dump(mode="json")
+        )
+    else:
+        _generation_state.generated = False
+        output = _forward_cached(request)
+    record_cache_lookup(
+        "response", request.name_of_model, hit=not _generation_state.generated
+    )
+    return output
+
+
+def cache_result(request: ForwardRequest, result: dict):
+    """
+    Store a result produced outside `forward_hf` (e.g. streamed) in the
+    response caches, as if `forward_hf(request)` had generated it.
+    """
+    _generation_state.precomputed = result
+    try:
+        forward_hf(_cache_identity(request))
+    finally:
+        _generation_state.precomputed = None
+    key = request_key(request.model_dump(mode="json", exclude=UNCACHED_FIELDS))
+    RESPONSE_LRU.put(key, result)
+
+
+def run_forward_samples(request: ForwardRequest):
+    """
+    Worker handler for requests with `n > 1`. Samples already in the response
+    cache are reused and the missing ones are generated in a single batch, then
+    cached one by one.
+    """
+    samples = sample_requests(request)
+    replica = getattr(_generation_state, "replica", None)
+    if replica is not None:
+        outputs = [run_forward(sample) for sample in samples]
+    else:
+        outputs = [None] * len(samples)
+        missing = []
+        for i, sample in enumerate(samples):
+            sample = _cache_identity(sample)
+            hit = forward_hf.check_call_in_cache(sample)
+            record_cache_lookup("response", request.name_of_model, hit=hit)
+            if hit:
+                outputs[i] = forward_hf(sample)
+            else:
+                missing.append(i)
+        if missing:
+            generated = generate_hf(
+                samples[missing[0]],
+                len(missing),
+                request.prefix_token_ids,
+                request.prefix_messages,
+                seeds=[samples[i].random_seed for i in missing],
+            )
+            for i, result in zip(missing, generated):
+                cache_result(samples[i], result)
+                outputs[i] = result
+    return {
+        "generated_text": outputs[0]["generated_text"],
+        "samples": [output["generated_text"] for output in outputs],
+    }
+
+
+def stream_hf(request: ForwardRequest, channel: queue.Queue, cancel: threading.Event):
+    """
+    Worker handler for streaming: put ("token", text) messages on `channel` as
+    they are decoded, then ("done", result). Stops early, freeing the worker,
+    once `cancel` is set. Completed results are added to the response caches.
+    """
+    name_of_model = request.name_of_model
+    if cancel.is_set():
+        return
+    try:
+        replica = getattr(_generation_state, "replica", None)
+        if replica is not None:
+            # Replica processes return whole responses, sent as one chunk
+            result, _ = call_replica(
+                replica, "forward", request.model_dump(mode="json")
+            )
+            channel.put(("token", result["generated_text"]))
+            channel.put(("done", result))
+            return
+
+        constraints = _parse_constraints(request)
+        model_obj, tokenizer = load_model_if_needed(name_of_model)
+        try:
+            prompt = tokenizer.apply_chat_template(
+                request.history,
+                tokenize=False,
+                add_generation_prompt=True,
+            )
+            if (
+                request.constraint_type == "choice"
+                and constraints
+                and can_score_choices(name_of_model)
+            ):
+                scored = score_choices(
+                    MODEL_STORE[name_of_model]["raw_model"],
+                    tokenizer,
+                    prompt,
+                    constraints,
+                )
+                (choice,) = sample_choices(
+                    scored["probs"], 1, SAMPLING_TEMPERATURE, request.random_seed
+                )
+                channel.put(("token", choice))
+                result = {"generated_text": choice, "choice_probs": scored["probs"]}
+            else:
+                generator = get_generator(
+                    name_of_model, model_obj, request.constraint_type, constraints
+                )
+                prompt_ids = _prompt_token_ids(
+                    request,
+                    tokenizer,
+                    prompt,
+                    request.prefix_token_ids,
+                    request.prefix_messages,
+                )
+                pieces = []
+                with pretokenized(prompt, prompt_ids):
+                    for token in generator.stream(
+                        prompt,
+                        seed=request.random_seed,
+                        **_generation_kwargs(request, constraints),
+                    ):
+                        if cancel.is_set():
+                            print(f"[{name_of_model}] Stream cancelled by client.")
+                            STREAM_CANCELLATIONS.inc(model=name_of_model)
+                            return
+                        pieces.append(token)
+                        channel.put(("token", token))
+                record_truncation(request, len(pieces))
+                result = {"generated_text": "".join(pieces).strip()}
+            with model_store_lock:
+                MODEL_STORE[name_of_model]["last_used"] = time.time()
+        finally:
+            RESIDENCY.release(name_of_model)
+
+        cache_result(request, result)
+        channel.put(("done", result))
+    except Exception as e:
+        print(traceback.format_exc())
+        channel.put(("error", str(getattr(e, "detail", e))))
+        raise
+
+
+def warmup_hf(request: ForwardRequest, generations: int):
+    """
+    Load the model, compile the request's constraint and run a few short
+    uncached generations so later requests find everything hot.
+    """
+    name_of_model = request.name_of_model
+    if name_of_model in REPLICA_POOLS and not _in_replica():
+        # Warm every replica, not just the one this worker owns
+        MODEL_READINESS[name_of_model] = "warming"
+        for replica in REPLICA_POOLS[name_of_model].replicas:
+            call_replica(
+                replica, "warmup", request.model_dump(mode="json"), generations
+            )
+        return
+
+    constraints = _parse_constraints(request)
+    model_obj, tokenizer = load_model_if_needed(name_of_model)
+    try:
+        MODEL_READINESS[name_of_model] = "warming"
+        prompt = tokenizer.apply_chat_template(
+            request.history,
+            tokenize=False,
+            add_generation_prompt=True,
+        )
+        if (
+            request.constraint_type == "choice"
+            and constraints
+            and can_score_choices(name_of_model)
+        ):
+            for _ in range(generations):
+                score_choices(
+                    MODEL_STORE[name_of_model]["raw_model"],
+                    tokenizer,
+                    prompt,
+                    constraints,
+                )
+        else:
+            generator = get_generator(
+                name_of_model, model_obj, request.constraint_type, constraints
+            )
+            for _ in range(generations):
+                generator(prompt, max_tokens=WARMUP_MAX_TOKENS)
+        print(f"[{name_of_model}] Warmed up constraint_type={request.constraint_type}")
+    finally:
+        RESIDENCY.release(name_of_model)
+
+
+def estimate_model_bytes(model_name: str) -> int:
+    """
+    Estimate the 4-bit footprint of a model from its safetensors metadata.
+    """
+    try:
+        from huggingface_hub import get_safetensors_metadata
+
+        metadata = get_safetensors_metadata(model_name)
+        n_params = sum(metadata.parameter_count.values())
+        # 4-bit weights plus unquantized embeddings/norms and activation headroom
+        return int(n_params * 0.5 * 1.3)
+    except Exception as e:
+        print(f"[{model_name}] Could not estimate size ({e}), assuming default.")
+        return DEFAULT_MODEL_BYTES
+
+
+def _instrument_forward_latency(model_name: str, raw_model):
+    """
+    Time every forward pass of `raw_model`, split into prefill (more than one
+    new token per sequence) and decode (one new token per sequence).
+
+    On GPU the pass is bracketed by CUDA events and read back once the end
+    event has completed, so timing never blocks the stream.
+    """
+    # (start event, end event, phase) of GPU passes not yet observed
+    pending = []
+    pending_lock = threading.Lock()
+
+    def observe_finished():
+        with pending_lock:
+            while pending and pending[0][1].query():
+                start, end, phase = pending.pop(0)
+                FORWARD_LATENCY.observe(
+                    start.elapsed_time(end) / 1000, model=model_name, phase=phase
+                )
+
+    def pre_hook(module, args, kwargs):
+        input_ids = kwargs.get("input_ids", args[0] if args else None)
+        if input_ids is not None and input_ids.is_cuda:
+            start = torch.cuda.Event(enable_timing=True)
+            start.record(torch.cuda.current_stream(input_ids.device))
+            _generation_state.forward_start = start
+        else:
+            _generation_state.forward_start = time.perf_counter()
+
+    def post_hook(module, args, kwargs, output):
+        input_ids = kwargs.get("input_ids", args[0] if args else None)
+        if input_ids is None:
+            return
+        phase = "prefill" if input_ids.shape[-1] > 1 else "decode"
+        start = _generation_state.forward_start
+        if isinstance(start, float):
+            elapsed = time.perf_counter() - start
+            FORWARD_LATENCY.observe(elapsed, model=model_name, phase=phase)
+        else:
+            end = torch.cuda.Event(enable_timing=True)
+            end.record(torch.cuda.current_stream(input_ids.device))
+            with pending_lock:
+                pending.append((start, end, phase))
+            observe_finished()
+        FORWARD_TOKENS.inc(input_ids.numel(), model=model_name, phase=phase)
+
+    raw_model.register_forward_pre_hook(pre_hook, with_kwargs=True)
+    raw_model.register_forward_hook(post_hook, with_kwargs=True)
+
+
+# Earlier bitsandbytes releases cannot move 4-bit weights off the device
+MIN_BNB_OFFLOAD_VERSION = "0.43.0"
+
+
+def _can_offload_4bit() -> bool:
+    try:
+        from importlib.metadata import version as installed_version
+        from packaging.version import Version
+
+        return Version(installed_version("bitsandbytes")) >= Version(
+            MIN_BNB_OFFLOAD_VERSION
+        )
+    except Exception:
+        return False
+
+
+def _quantized_params(raw_model) -> list:
+    return [p for p in raw_model.parameters() if type(p).__name__ == "Params4bit"]
+
+
+def _offload_to_host(model_name: str):
+    """
+    Move a model's weights to pinned host memory so it can be restored quickly.
+    4-bit models are dropped instead when bitsandbytes is too old to move them
+    or the move loses their quant_state. Returns False if the model was dropped.
+    Called by RESIDENCY with model_store_lock held.
+    """
+    info = MODEL_STORE[model_name]
+    quantized = getattr(info["raw_model"], "is_loaded_in_4bit", False)
+    if quantized and not _can_offload_4bit():
+        print(f"[{model_name}] bitsandbytes cannot offload 4-bit weights; dropping.")
+        _drop_model(model_name)
+        return False
+    try:
+        raw_model = info["raw_model"].to("cpu")
+    except Exception as e:
+        print(f"[{model_name}] Could not move to host: {e}; dropping.")
+        _drop_model(model_name)
+        return False
+    if quantized and any(
+        getattr(p, "quant_state", None) is None for p in _quantized_params(raw_model)
+    ):
+        print(f"[{model_name}] Lost quant_state moving to host; dropping.")
+        _drop_model(model_name)
+        return False
+    try:
+        for param in raw_model.parameters():
+            # Replacing .data on Params4bit would detach it from its quant_state
+            if type(param).__name__ != "Params4bit":
+                param.data = param.data.pin_memory()
+    except Exception as e:
+        print(f"[{model_name}] Could not pin host memory: {e}")
+    info["device"] = -1
+    info["on_host"] = True
+    gc.collect()
+    torch.cuda.empty_cache()
+    return True
+
+
+def _restore_to_device(model_name: str, device: int):
+    info = MODEL_STORE[model_name]
+    print(f"[{model_name}] Restoring from host standby to cuda:{device} ...")
+    info["raw_model"].to(f"cuda:{device}")
+    info["device"] = device
+    info["on_host"] = False
+
+
+def _drop_model(model_name: str):
+    """
+    Free a model entirely. Called by RESIDENCY with model_store_lock held.
+    """
+    del MODEL_STORE[model_name]["model"]
+    del MODEL_STORE[model_name]["raw_model"]
+    del MODEL_STORE[model_name]["tokenizer"]
+    del MODEL_STORE[model_name]
+    _drop_generators(model_name)
+    gc.collect()
+    torch.cuda.empty_cache()
+
+
+RESIDENCY = ResidencyManager(
+    TorchDeviceInventory(),
+    on_offload=_offload_to_host,
+    on_drop=_drop_model,
+    device_budget=GPU_MEMORY_BUDGET,
+    host_budget=HOST_STANDBY_BUDGET,
+)
 
 
 def load_model_if_needed(model_name: str):
     """
-    Ensure the model is loaded into MODEL_STORE. Return (model_obj, tokenizer).
+    Ensure the model is loaded and, for device backends, resident on a device.
+    Return (model_obj, tokenizer) with the model's backend activated on the
+    calling worker thread. Device models stay pinned by RESIDENCY until the
+    caller releases them.
     This function is concurrency-safe by using `model_store_lock`.
     """
     with model_store_lock:
-        if model_name in MODEL_STORE:
-            # Already loaded
-            model_info = MODEL_STORE[model_name]
-            return model_info["model"], model_info["tokenizer"]
+        info = MODEL_STORE.get(model_name)
+        if info is not None and not info["backend"].uses_device:
+            # CPU backends are not managed by RESIDENCY
+            info["backend"].activate()
+            return info["model"], info["tokenizer"]
+
+        backend = (
+            info["backend"]
+            if info is not None
+            else get_backend(
+                model_name,
+                MODEL_BACKENDS,
+                has_gpu=bool(RESIDENCY.inventory.devices()),
+                default=DEFAULT_BACKEND,
+            )
+        )
+        if backend.uses_device:
+            nbytes = None if info else estimate_model_bytes(model_name)
+            try:
+                chosen_device, state = RESIDENCY.acquire(model_name, nbytes)
+            except InsufficientMemoryError as e:
+                raise HTTPException(status_code=503, detail=str(e))
         else:
-            # Load the model
-            if torch.cuda.device_count() == 0:
-                # If no GPU, fallback to CPU
-                chosen_gpu = None
-                device_map = {"": "cpu"}
-            else:
-                # Find free GPU (0 models). If none, pick GPU with fewest models.
-                free_gpus = [
-                    g for g, occupant in GPU_OCCUPANCY.items() if len(occupant) == 0
-                ]
-                if free_gpus:
-                    chosen_gpu = free_gpus[0]
-                    print(f"[{model_name}] Found free GPU {chosen_gpu} (no models).")
-                else:
-                    chosen_gpu = min(
-                        GPU_OCCUPANCY.keys(), key=lambda g: len(GPU_OCCUPANCY[g])
-                    )
-                    print(f"[{model_name}] All GPUs occupied. Using GPU {chosen_gpu}.")
+            chosen_device, state = -1, "new"
 
-                device_map = {"": f"cuda:{chosen_gpu}"}
+        if state == "resident":
+            return info["model"], info["tokenizer"]
+        if state == "standby":
+            _restore_to_device(model_name, chosen_device)
+            info["last_used"] = time.time()
+            return info["model"], info["tokenizer"]
 
-            try:
-                print(f"[{model_name}] Loading model onto device_map={device_map} ...")
-                tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=False)
-                raw_model = AutoModelForCausalLM.from_pretrained(
-                    model_name,
-                    torch_dtype=torch.bfloat16,
-                    load_in_4bit=True,
-                    device_map=device_map,
-                )
-                model_obj = outlines.models.Transformers(raw_model, tokenizer)
+        # Load the model
+        if backend.uses_device:
+            print(
+                f"[{model_name}] Placing on GPU {chosen_device}: {RESIDENCY.summary()}"
+            )
 
-                # Update global structures
-                MODEL_STORE[model_name] = {
-                    "model": model_obj,
-                    "tokenizer": tokenizer,
-                    "device": chosen_gpu if chosen_gpu is not None else -1,
-                    "last_used": time.time(),
-                }
-                if chosen_gpu is not None:
-                    GPU_OCCUPANCY[chosen_gpu].add(model_name)
+        try:
+            print(f"[{model_name}] Loading with backend={backend.name} ...")
+            loaded = backend.load(model_name, chosen_device)
+            raw_model = loaded["raw_model"]
+            if raw_model is not None:
+                _instrument_forward_latency(model_name, raw_model)
+                pretokenized_encode(loaded["model"].tokenizer)
 
-                return model_obj, tokenizer
+            # Update global structures
+            MODEL_STORE[model_name] = {
+                **loaded,
+                "backend": backend,
+                "device": chosen_device,
+                "on_host": False,
+                "last_used": time.time(),
+            }
+            if backend.uses_device:
+                RESIDENCY.update_size(model_name, raw_model.get_memory_footprint())
+            backend.activate()
 
-            except Exception as e:
-                print(traceback.format_exc())
-                raise HTTPException(
-                    status_code=500, detail=f"Error loading model '{model_name}': {e}"
-                )
+            return loaded["model"], loaded["tokenizer"]
+
+        except Exception as e:
+            RESIDENCY.forget(model_name)
+            print(traceback.format_exc())
+            raise HTTPException(
+                status_code=500, detail=f"Error loading model '{model_name}': {e}"
+            )
+
+
+def can_score_choices(model_name: str) -> bool:
+    """Choice scoring needs direct access to a HuggingFace model."""
+    return MODEL_STORE[model_name]["raw_model"] is not None
 
 
 #
@@ -214,44 +995,244 @@ def load_model_if_needed(model_name: str):
 #
 
 
-def model_worker(model_name: str):
+def model_worker(model_name: str, replica=None):
     """
     A dedicated worker that processes requests from the queue for `model_name`.
-    Only one request is processed at a time per model.
+    Only one request is processed at a time per worker, taken in priority
+    order and fairly across clients. With replicas, each worker owns one
+    replica process and forwards its jobs there, so jobs go to whichever
+    replica is idle.
     """
     q = MODEL_QUEUES[model_name]
+    _generation_state.replica = replica
     while True:
         job = q.get()
         if job is None:
             # If we receive `None`, it’s a signal to shut down
-            q.task_done()
             break
 
-        (request_obj, done_event, result_dict) = job
+        (handler, request_obj, done_event, result_dict, enqueued_at) = job
 
+        started_at = time.time()
+        priority = getattr(request_obj, "priority", DEFAULT_PRIORITY)
+        QUEUE_WAIT.observe(
+            started_at - enqueued_at, model=model_name, priority=priority
+        )
         try:
-            output = forward_hf(request_obj)
+            output = handler(request_obj)
             result_dict["result"] = output
         except Exception as ex:
             # Store the exception text so the main thread can raise it
             result_dict["exception"] = ex
+        REQUEST_LATENCY.observe(time.time() - started_at, model=model_name)
 
         # Signal that we’re done
         done_event.set()
-        q.task_done()
+
+
+def replica_count(model_name: str) -> int:
+    """Replica processes configured for a CPU model ("replicas" in MODEL_BACKENDS)."""
+    replicas = int(MODEL_BACKENDS.get(model_name, {}).get("replicas", 1))
+    if replicas <= 1:
+        return 1
+    backend = get_backend(
+        model_name,
+        MODEL_BACKENDS,
+        has_gpu=bool(RESIDENCY.inventory.devices()),
+        default=DEFAULT_BACKEND,
+    )
+    if backend.uses_device:
+        print(f"[{model_name}] Replicas are only supported for CPU backends.")
+        return 1
+    return replicas
 
 
 def start_model_worker(model_name: str):
     """
-    If there's no worker thread for this model yet, create one.
+    If there's no worker thread for this model yet, create one, or one per
+    replica process if the model is served by replicas.
+    """
+    with worker_start_lock:
+        if model_name not in MODEL_QUEUES:
+            MODEL_QUEUES[model_name] = FairPriorityQueue(
+                MAX_QUEUE_DEPTH, INTERACTIVE_QUEUE_RESERVE
+            )
+
+        if model_name not in MODEL_WORKERS:
+            n_replicas = replica_count(model_name)
+            if n_replicas > 1:
+                pool = ReplicaPool(
+                    model_name,
+                    n_replicas,
+                    "server.concurrent_multiple_model_server:replica_handler",
+                )
+                REPLICA_POOLS[model_name] = pool
+                replicas = pool.replicas
+            else:
+                replicas = [None]
+            MODEL_WORKERS[model_name] = []
+            for replica in replicas:
+                th = threading.Thread(
+                    target=model_worker, args=(model_name, replica), daemon=True
+                )
+                MODEL_WORKERS[model_name].append(th)
+                th.start()
+
+
+def _in_replica() -> bool:
+    return getattr(_generation_state, "in_replica", False)
+
+
+def call_replica(replica, method: str, *args):
+    """
+    Run `method` on a replica process, retrying once on a fresh replica if the
+    process crashed, and map handler errors back to HTTP errors.
+    """
+    for attempt in range(2):
+        try:
+            return replica.call(method, *args, timeout=REPLICA_CALL_TIMEOUT)
+        except ReplicaError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        except ReplicaCrashedError as e:
+            REPLICA_CRASHES.inc(model=replica.model_name)
+            print(f"[{replica.model_name}] {e}")
+            if attempt == 1:
+                raise HTTPException(status_code=500, detail=str(e))
+
+
+def replica_handler(model_name: str, index: int, method: str, *args):
+    """
+    Entry point inside a replica process (see server/replicas.py).
+    """
+    _generation_state.in_replica = True
+    if method == "init":
+        options = MODEL_BACKENDS.setdefault(model_name, {})
+        if options.get("numa_nodes"):
+            # Spread replicas round-robin over the given NUMA nodes
+            options["numa_node"] = options["numa_nodes"][
+                index % len(options["numa_nodes"])
+            ]
+        load_model_if_needed(model_name)
+    elif method == "forward":
+        request = ForwardRequest(**args[0])
+        _generation_state.generated = False
+        output = _forward_cached(request)
+        return output, _generation_state.generated
+    elif method == "warmup":
+        request, generations = args
+        warmup_hf(ForwardRequest(**request), generations)
+    else:
+        raise NotImplementedError(f"Unknown replica method {method}")
+
+
+def enqueue_job(model_name: str, request_obj, handler=run_forward):
+    """
+    Queue `handler(request_obj)` on the model's worker without waiting.
+    Returns (done_event, result_holder). Raises QueueFullError if the model's
+    queue is full.
+    """
+    # 1) Ensure we have a worker thread and a queue for this model
+    start_model_worker(model_name)
+
+    # 2) Create a job with an Event to wait for completion
+    done_event = threading.Event()
+    result_holder = {}
+    job = (handler, request_obj, done_event, result_holder, time.time())
+
+    # 3) Put the job in the model's queue
+    MODEL_QUEUES[model_name].put(
+        job,
+        priority=getattr(request_obj, "priority", DEFAULT_PRIORITY),
+        client_id=getattr(request_obj, "client_id", None),
+    )
+    return done_event, result_holder
+
+
+def submit_job(model_name: str, request_obj, handler=run_forward):
+    """
+    Run `handler(request_obj)` on the model's worker and block until it finishes.
+    Raises QueueFullError if the model's queue is full, or the worker's
+    exception, if any.
+    """
+    done_event, result_holder = enqueue_job(model_name, request_obj, handler)
+
+    # 4) Block until job is done
+    done_event.wait()
+
+    # 5) Check for exceptions
+    if "exception" in result_holder:
+        raise result_holder["exception"]
+    return result_holder["result"]
+
+
+#
+# Startup preloading and warmup
+#
+
+
+def preload_models():
+    """
+    Load every model in PRELOAD_MODELS, compile PRELOAD_CONSTRAINTS and run
+    warmup generations through the model's worker queue.
+    """
+    for model_name in PRELOAD_MODELS:
+        MODEL_READINESS[model_name] = "loading"
+        specs = PRELOAD_CONSTRAINTS or [{"constraint_type": "none"}]
+        try:
+            for spec in specs:
+                request = ForwardRequest(
+                    name_of_model=model_name,
+                    history=WARMUP_HISTORY,
+                    use_cache=False,
+                    constraints=spec.get("constraints"),
+                    constraint_type=spec["constraint_type"],
+                    response_format=None,
+                    random_seed=0,
+                )
+                submit_job(
+                    model_name,
+                    request,
+                    handler=partial(warmup_hf, generations=WARMUP_GENERATIONS),
+                )
+            MODEL_READINESS[model_name] = "ready"
+            print(f"[{model_name}] Ready.")
+        except Exception as e:
+            print(traceback.format_exc())
+            MODEL_READINESS[model_name] = f"failed: {e}"
+
+
+def retry_after_seconds(model_name: str) -> int:
+    """
+    Estimate when a rejected request should retry: the time to drain the
+    model's queue at its average service time.
     """
-    if model_name not in MODEL_QUEUES:
-        MODEL_QUEUES[model_name] = queue.Queue()
+    count = REQUEST_LATENCY.get_count(model=model_name)
+    mean = REQUEST_LATENCY.get_sum(model=model_name) / count if count else 1.0
+    depth = MODEL_QUEUES[model_name].qsize() if model_name in MODEL_QUEUES else 0
+    return min(300, max(1, math.ceil(depth * mean)))
+
+
+def model_status(model_name: str) -> str:
+    status = MODEL_READINESS.get(model_name)
+    if status is not None and status != "ready":
+        return status
+    # No model_store_lock: it is held for whole model loads and probes must not block
+    info = MODEL_STORE.get(model_name)
+    if info is not None:
+        return "standby" if info["on_host"] else "ready"
+    if model_name in MODEL_QUEUES:
+        # Has a worker, so the model is being loaded or just failed to load
+        return "loading"
+    return "not_loaded" if status is None else status
 
-    if model_name not in MODEL_WORKERS:
-        th = threading.Thread(target=model_worker, args=(model_name,), daemon=True)
-        MODEL_WORKERS[model_name] = th
-        th.start()
+
+@app.on_event("startup")
+def start_preloading():
+    for model_name in PRELOAD_MODELS:
+        MODEL_READINESS[model_name] = "pending"
+    if PRELOAD_MODELS:
+        print(f"[Preload] Preloading {PRELOAD_MODELS} ...")
+        threading.Thread(target=preload_models, daemon=True).start()
 
 
 #
@@ -260,37 +1241,21 @@ def start_model_worker(model_name: str):
 
 
 def watch_inactivity():
-    global MODEL_STORE, GPU_OCCUPANCY
     while True:
         print(f"[Inactivity Watcher] Checking for inactive models...")
         time.sleep(INACTIVITY_TIMEOUT // 4)
-        now = time.time()
 
-        # Attempt to unload inactive models
+        # Move inactive models to host standby; RESIDENCY drops them once the
+        # host budget runs out
         with model_store_lock:
-            to_remove = []
-            for model_name, info in MODEL_STORE.items():
-                print(f"now: {now}, last_used: {info['last_used']}")
-                if (now - info["last_used"]) > INACTIVITY_TIMEOUT:
-                    to_remove.append(model_name)
-
-            for model_name in to_remove:
-                print(f"[Inactivity Watcher] Unloading model {model_name} (inactive).")
-                try:
-                    device_id = MODEL_STORE[model_name]["device"]
-                    # Remove from GPU occupancy
-                    if device_id >= 0 and model_name in GPU_OCCUPANCY[device_id]:
-                        GPU_OCCUPANCY[device_id].remove(model_name)
-
-                    # Free memory
-                    del MODEL_STORE[model_name]["model"]
-                    del MODEL_STORE[model_name]["tokenizer"]
-                    del MODEL_STORE[model_name]
-                    
-                    gc.collect()
-                    torch.cuda.empty_cache()
-                except Exception as e:
-                    print(f"Error unloading {model_name}: {e}")
+            try:
+                offloaded = RESIDENCY.offload_idle(INACTIVITY_TIMEOUT)
+                for model_name in offloaded:
+                    print(
+                        f"[Inactivity Watcher] Offloaded model {model_name} (inactive)."
+                    )
+            except Exception as e:
+                print(f"Error offloading inactive models: {e}")
 
         print("[Inactivity Watcher] Cycle complete.")
 
@@ -313,28 +1278,217 @@ def forward(request: ForwardRequest):
         raise HTTPException(status_code=400, detail="GPT models are client side only.")
 
     model_name = request.name_of_model
+    if request.priority not in PRIORITIES:
+        raise HTTPException(
+            status_code=422, detail=f"priority must be one of {PRIORITIES}"
+        )
+    if request.n < 1:
+        raise HTTPException(status_code=422, detail="n must be at least 1")
+    handler = run_forward_samples if request.n > 1 else run_forward
+    key = request_key(request.model_dump(mode="json", exclude=UNCACHED_FIELDS))
+    result = RESPONSE_LRU.get(key)
+    record_cache_lookup("memory", model_name, hit=result is not None)
+    if result is not None:
+        REQUESTS.inc(model=model_name, status="200")
+        return result
 
-    # 1) Ensure we have a worker thread and a queue for this model
-    start_model_worker(model_name)
+    try:
+        # Coalesce per priority, so an interactive request never waits behind
+        # an identical offline one still queued at the lower priority
+        result, shared = SINGLE_FLIGHT.do(
+            (request.priority, key), lambda: submit_job(model_name, request, handler)
+        )
+    except QueueFullError as ex:
+        REQUESTS.inc(model=model_name, status="429")
+        REJECTED_REQUESTS.inc(model=model_name, priority=request.priority)
+        raise HTTPException(
+            status_code=429,
+            detail=str(ex),
+            headers={"Retry-After": str(retry_after_seconds(model_name))},
+        )
+    except HTTPException as ex:
+        REQUESTS.inc(model=model_name, status=str(ex.status_code))
+        raise
+    except Exception as ex:
+        REQUESTS.inc(model=request.name_of_model, status="500")
+        raise HTTPException(status_code=500, detail=f"Error during generation: {ex}")
+    if shared:
+        COALESCED_REQUESTS.inc(model=model_name)
+    else:
+        RESPONSE_LRU.put(key, result)
+    REQUESTS.inc(model=model_name, status="200")
+    return result
 
-    # 2) Create a job with an Event to wait for completion
-    done_event = threading.Event()
-    result_holder = {}
-    job = (request, done_event, result_holder)
 
-    # 3) Put the job in the model's queue
-    MODEL_QUEUES[model_name].put(job)
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
-    # 4) Block until job is done
-    done_event.wait()
 
-    # 5) Check for exceptions
-    if "exception" in result_holder:
-        ex = result_holder["exception"]
-        raise HTTPException(status_code=500, detail=f"Error during generation: {ex}")
+@app.post("/forward_stream")
+def forward_stream(request: ForwardRequest):
+    """
+    Streaming variant of /forward using server-sent events:
 
-    # 6) Return result
-    return result_holder["result"]
+        data: {"token": "..."}                         (repeated)
+        event: done / data: {"generated_text": ...}    (the full response)
+        event: error / data: {"detail": ...}
+
+    Closing the connection cancels the generation and frees the model's worker.
+    Cached responses are sent as a single token.
+    """
+    if request.name_of_model.startswith("gpt"):
+        raise HTTPException(status_code=400, detail="GPT models are client side only.")
+    if request.n != 1:
+        raise HTTPException(status_code=400, detail="Streaming supports n=1 only.")
+    if request.priority not in PRIORITIES:
+        raise HTTPException(
+            status_code=422, detail=f"priority must be one of {PRIORITIES}"
+        )
+    model_name = request.name_of_model
+    key = request_key(request.model_dump(mode="json", exclude=UNCACHED_FIELDS))
+    cached = RESPONSE_LRU.get(key)
+    record_cache_lookup("memory", model_name, hit=cached is not None)
+    if cached is None and forward_hf.check_call_in_cache(_cache_identity(request)):
+        cached = forward_hf(_cache_identity(request))
+        RESPONSE_LRU.put(key, cached)
+
+    channel = queue.Queue()
+    cancel = threading.Event()
+    if cached is not None:
+        channel.put(("token", cached["generated_text"]))
+        channel.put(("done", cached))
+    else:
+        try:
+            enqueue_job(
+                model_name, request, partial(stream_hf, channel=channel, cancel=cancel)
+            )
+        except QueueFullError as ex:
+            REQUESTS.inc(model=model_name, status="429")
+            REJECTED_REQUESTS.inc(model=model_name, priority=request.priority)
+            raise HTTPException(
+                status_code=429,
+                detail=str(ex),
+                headers={"Retry-After": str(retry_after_seconds(model_name))},
+            )
+
+    async def events():
+        finished = False
+        try:
+            while True:
+                try:
+                    kind, value = await asyncio.to_thread(channel.get, True, 1.0)
+                except queue.Empty:
+                    continue
+                if kind == "token":
+                    yield _sse({"token": value})
+                elif kind == "done":
+                    finished = True
+                    REQUESTS.inc(model=model_name, status="200")
+                    yield _sse(value, event="done")
+                    return
+                else:
+                    finished = True
+                    REQUESTS.inc(model=model_name, status="500")
+                    yield _sse({"detail": value}, event="error")
+                    return
+        finally:
+            # Runs when the client disconnects mid-stream, too
+            if not finished:
+                cancel.set()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/health")
+def health():
+    """
+    Liveness probe: the server process is up and accepting requests.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/models")
+def models():
+    """
+    Status of every model this server knows about, used by the gateway to
+    route requests to servers that already have the model.
+    """
+    names = set(MODEL_STORE) | set(MODEL_QUEUES) | set(MODEL_READINESS)
+    return {"models": {m: model_status(m) for m in sorted(names)}}
+
+
+@app.get("/ready")
+def ready(model: Optional[str] = None):
+    """
+    Readiness probe. With `?model=<name>`, report whether that model is loaded
+    and warm; without it, whether every model in PRELOAD_MODELS is.
+    Returns 503 until ready.
+    """
+    model_names = [model] if model is not None else PRELOAD_MODELS
+    statuses = {m: model_status(m) for m in model_names}
+    is_ready = all(s == "ready" for s in statuses.values())
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "models": statuses},
+    )
+
+
+def _queue_depths():
+    return {
+        (m, p): depth
+        for m, q in list(MODEL_QUEUES.items())
+        for p, depth in q.depth_by_priority().items()
+    }
+
+
+def _loaded_models():
+    # Snapshot without model_store_lock, which is held for whole model loads
+    return {
+        (m, "standby" if info["on_host"] else "resident", info["device"]): 1
+        for m, info in list(MODEL_STORE.items())
+    }
+
+
+def _device_memory():
+    inventory = RESIDENCY.inventory
+    out = {}
+    for d in inventory.devices():
+        out[(d, "total")] = inventory.total_memory(d)
+        out[(d, "free")] = inventory.free_memory(d)
+        out[(d, "budget")] = RESIDENCY.budget(d)
+        out[(d, "models")] = RESIDENCY.used(d)
+    out[("host", "standby")] = RESIDENCY.host_used()
+    return out
+
+
+def _replicas_alive():
+    return {
+        (m, r["index"]): int(r["alive"])
+        for m, pool in list(REPLICA_POOLS.items())
+        for r in pool.summary()
+    }
+
+
+QUEUE_DEPTH.set_function(_queue_depths)
+METRICS.gauge(
+    "lm_replica_alive",
+    "Replica processes per model that are running.",
+    ("model", "replica"),
+).set_function(_replicas_alive)
+METRICS.gauge(
+    "lm_response_cache_entries", "Responses held in the in-memory LRU."
+).set_function(lambda: {(): len(RESPONSE_LRU)})
+LOADED_MODELS.set_function(_loaded_models)
+DEVICE_MEMORY.set_function(_device_memory)
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus scrape endpoint.
+    """
+    return Response(content=METRICS.render(), media_type=CONTENT_TYPE)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,409 @@
+"""Gateway in front of several model servers, speaking the same `/forward` and
+`/forward_stream` protocol so `ModelAPIClient` can point at it unchanged.
+Requests go to the least loaded healthy server that has the model, with
+failover and optional hedging. Run locally against mock servers with:
+
+    MOCK_MODELS=a uvicorn server.mock_model_server:app --port 9001 &
+    MOCK_MODELS=b uvicorn server.mock_model_server:app --port 9002 &
+    GATEWAY_UPSTREAMS=http://127.0.0.1:9001,http://127.0.0.1:9002 \\
+        uvicorn server.gateway:app --port 55221
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterator, Optional, Union
+from fastapi import FastAPI, Body
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from dotenv import load_dotenv
+import threading
+import time
+import os
+import httpx
+import uvicorn
+from server.metrics import MetricsRegistry, CONTENT_TYPE
+from server.transport import MsgpackRoute
+
+
+class UpstreamError(Exception):
+    """The upstream server could not be reached."""
+
+    pass
+
+
+def http_send(url: str, payload: dict, timeout: float) -> tuple[int, dict, dict]:
+    try:
+        response = httpx.post(f"{url}/forward", json=payload, timeout=timeout)
+    except httpx.TransportError as e:
+        raise UpstreamError(f"{url}: {e}")
+    headers = {}
+    if "Retry-After" in response.headers:
+        headers["Retry-After"] = response.headers["Retry-After"]
+    try:
+        body = response.json()
+    except ValueError as e:
+        # e.g. a proxy's HTML error page
+        raise UpstreamError(
+            f"{url}: invalid JSON response ({response.status_code}): {e}"
+        )
+    return response.status_code, body, headers
+
+
+def http_stream(
+    url: str, payload: dict, timeout: float
+) -> tuple[int, Union[dict, Iterator[bytes]], dict]:
+    """
+    POST to `/forward_stream`. On 200 the body is an iterator over the raw
+    event stream, which closes the connection once exhausted or closed.
+    """
+    client = httpx.Client(timeout=timeout)
+    try:
+        response = client.send(
+            client.build_request("POST", f"{url}/forward_stream", json=payload),
+            stream=True,
+        )
+    except httpx.TransportError as e:
+        client.close()
+        raise UpstreamError(f"{url}: {e}")
+    headers = {}
+    if "Retry-After" in response.headers:
+        headers["Retry-After"] = response.headers["Retry-After"]
+    if response.status_code != 200:
+        try:
+            response.read()
+            body = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            body = {"detail": f"{url}: unreadable error response: {e}"}
+        finally:
+            response.close()
+            client.close()
+        return response.status_code, body, headers
+
+    def chunks():
+        try:
+            yield from response.iter_raw()
+        finally:
+            response.close()
+            client.close()
+
+    return 200, chunks(), headers
+
+
+def http_get_json(url: str, path: str, timeout: float) -> dict:
+    try:
+        response = httpx.get(f"{url}{path}", timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        raise UpstreamError(f"{url}{path}: {e}")
+
+
+class Upstream:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.outstanding = 0
+        self.models = {}  # model_name -> status reported by the server, or "routed"
+
+
+class Gateway:
+    """
+    Routing, health checking and hedging over a fixed set of upstream servers.
+    The transport functions are injectable so the logic can run without a network.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        send: Callable[[str, dict, float], tuple[int, dict, dict]] = http_send,
+        get_json: Callable[[str, str, float], dict] = http_get_json,
+        stream: Callable[[str, dict, float], tuple] = http_stream,
+        hedge_after: Optional[float] = None,
+        spill_outstanding: int = 8,
+        timeout: float = 600.0,
+        health_timeout: float = 2.0,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        assert urls, "At least one upstream is required."
+        self.upstreams = [Upstream(u) for u in urls]
+        self.send = send
+        self.get_json = get_json
+        self.stream = stream
+        self.hedge_after = hedge_after
+        self.spill_outstanding = spill_outstanding
+        self.timeout = timeout
+        self.health_timeout = health_timeout
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=64)
+
+        self.metrics = metrics or MetricsRegistry()
+        self.routed = self.metrics.counter(
+            "gateway_requests_total",
+            "Requests sent to each upstream by result status.",
+            ("upstream", "status"),
+        )
+        self.hedges = self.metrics.counter(
+            "gateway_hedged_requests_total", "Requests also sent to a second upstream."
+        )
+        self.metrics.gauge(
+            "gateway_upstream_outstanding",
+            "Requests in flight per upstream.",
+            ("upstream",),
+        ).set_function(lambda: {(u.url,): u.outstanding for u in self.upstreams})
+        self.metrics.gauge(
+            "gateway_upstream_healthy",
+            "1 if the upstream passed its last health check.",
+            ("upstream",),
+        ).set_function(lambda: {(u.url,): int(u.healthy) for u in self.upstreams})
+
+    # ---------------------------
+    # Health checks
+    # ---------------------------
+
+    def check_health(self):
+        """Probe every upstream once and refresh its model list."""
+        for upstream in self.upstreams:
+            try:
+                self.get_json(upstream.url, "/health", self.health_timeout)
+                reported = self.get_json(upstream.url, "/models", self.health_timeout)
+                models = {
+                    m: status
+                    for m, status in reported.get("models", {}).items()
+                    if status != "not_loaded" and not status.startswith("failed")
+                }
+                with self.lock:
+                    upstream.healthy = True
+                    upstream.models = models
+            except UpstreamError as e:
+                with self.lock:
+                    was_healthy = upstream.healthy
+                    upstream.healthy = False
+                if was_healthy:
+                    print(f"[Gateway] {upstream.url} is unhealthy: {e}")
+
+    def watch_health(self, interval: float):
+        while True:
+            self.check_health()
+            time.sleep(interval)
+
+    # ---------------------------
+    # Routing
+    # ---------------------------
+
+    def pick(self, model_name: str, exclude=()) -> Optional[Upstream]:
+        """
+        The least loaded healthy upstream that has the model, unless it is
+        `spill_outstanding` requests busier than the least loaded one overall.
+        """
+        with self.lock:
+            candidates = [u for u in self.upstreams if u.healthy and u not in exclude]
+            if not candidates:
+                return None
+            least = min(candidates, key=lambda u: u.outstanding)
+            warm = [u for u in candidates if model_name in u.models]
+            if warm:
+                best = min(warm, key=lambda u: u.outstanding)
+                if best.outstanding - least.outstanding < self.spill_outstanding:
+                    return best
+            return least
+
+    def _send(self, upstream: Upstream, payload: dict) -> tuple[int, dict, dict]:
+        model_name = payload.get("name_of_model")
+        with self.lock:
+            upstream.outstanding += 1
+            # Route followers here too while the server loads the model
+            upstream.models.setdefault(model_name, "routed")
+        try:
+            result = self.send(upstream.url, payload, self.timeout)
+        except UpstreamError:
+            with self.lock:
+                upstream.healthy = False
+            self.routed.inc(upstream=upstream.url, status="unreachable")
+            raise
+        finally:
+            with self.lock:
+                upstream.outstanding -= 1
+        self.routed.inc(upstream=upstream.url, status=str(result[0]))
+        return result
+
+    def _send_hedged(
+        self, primary: Upstream, payload: dict, tried: list
+    ) -> tuple[int, dict, dict]:
+        if self.hedge_after is None:
+            return self._send(primary, payload)
+
+        first = self.executor.submit(self._send, primary, payload)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+        secondary = self.pick(payload.get("name_of_model"), exclude=tried)
+        if secondary is None:
+            return first.result()
+
+        tried.append(secondary)
+        self.hedges.inc()
+        second = self.executor.submit(self._send, secondary, payload)
+        pending = {first, second}
+        result = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except UpstreamError:
+                    continue
+                if result[0] == 200:
+                    # The slower request keeps running; its result is ignored
+                    return result
+        if result is None:
+            raise UpstreamError("Both hedged requests failed.")
+        return result
+
+    def forward(self, payload: dict) -> tuple[int, dict, dict]:
+        """
+        Send a `/forward` payload to the best upstream, failing over to the
+        others if it is unreachable or its queue is full (429).
+        """
+        model_name = payload.get("name_of_model")
+        tried = []
+        last = (503, {"detail": "No healthy model server available."}, {})
+        while True:
+            upstream = self.pick(model_name, exclude=tried)
+            if upstream is None:
+                return last
+            tried.append(upstream)
+            try:
+                last = self._send_hedged(upstream, payload, tried)
+            except UpstreamError as e:
+                print(f"[Gateway] {e}")
+                last = (502, {"detail": str(e)}, {})
+                continue
+            if last[0] != 429:
+                return last
+
+    def _open_stream(self, upstream: Upstream, payload: dict) -> tuple:
+        model_name = payload.get("name_of_model")
+        with self.lock:
+            upstream.outstanding += 1
+            upstream.models.setdefault(model_name, "routed")
+        try:
+            status, body, headers = self.stream(upstream.url, payload, self.timeout)
+        except UpstreamError:
+            with self.lock:
+                upstream.healthy = False
+                upstream.outstanding -= 1
+            self.routed.inc(upstream=upstream.url, status="unreachable")
+            raise
+        self.routed.inc(upstream=upstream.url, status=str(status))
+        if status != 200:
+            with self.lock:
+                upstream.outstanding -= 1
+            return status, body, headers
+
+        def relay():
+            # The request stays outstanding until the stream ends or is closed
+            try:
+                yield from body
+            finally:
+                body.close()
+                with self.lock:
+                    upstream.outstanding -= 1
+
+        return status, relay(), headers
+
+    def forward_stream(self, payload: dict) -> tuple:
+        """
+        Open a `/forward_stream` on the best upstream, failing over like
+        `forward`. On 200 the body is an iterator over the upstream's event
+        stream. Streams are not hedged.
+        """
+        model_name = payload.get("name_of_model")
+        tried = []
+        last = (503, {"detail": "No healthy model server available."}, {})
+        while True:
+            upstream = self.pick(model_name, exclude=tried)
+            if upstream is None:
+                return last
+            tried.append(upstream)
+            try:
+                last = self._open_stream(upstream, payload)
+            except UpstreamError as e:
+                print(f"[Gateway] {e}")
+                last = (502, {"detail": str(e)}, {})
+                continue
+            if last[0] != 429:
+                return last
+
+
+#
+# FastAPI app
+#
+
+load_dotenv(override=False)
+app = FastAPI()
+app.router.route_class = MsgpackRoute
+
+
+def _hedge_after() -> Optional[float]:
+    value = os.getenv("GATEWAY_HEDGE_AFTER")
+    return float(value) if value else None
+
+
+GATEWAY = Gateway(
+    [
+        u
+        for u in os.getenv("GATEWAY_UPSTREAMS", "http://127.0.0.1:8000").split(",")
+        if u
+    ],
+    hedge_after=_hedge_after(),
+    spill_outstanding=int(os.getenv("GATEWAY_SPILL_OUTSTANDING", "8")),
+    timeout=float(os.getenv("GATEWAY_TIMEOUT", "600")),
+)
+
+
+@app.on_event("startup")
+def start_health_checks():
+    interval = float(os.getenv("GATEWAY_HEALTH_INTERVAL", "5"))
+    threading.Thread(target=GATEWAY.watch_health, args=(interval,), daemon=True).start()
+
+
+@app.post("/forward")
+def forward(payload: dict = Body(...)):
+    status, body, headers = GATEWAY.forward(payload)
+    return JSONResponse(status_code=status, content=body, headers=headers)
+
+
+@app.post("/forward_stream")
+def forward_stream(payload: dict = Body(...)):
+    status, body, headers = GATEWAY.forward_stream(payload)
+    if status != 200:
+        return JSONResponse(status_code=status, content=body, headers=headers)
+    return StreamingResponse(body, media_type="text/event-stream")
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready():
+    upstreams = {u.url: u.healthy for u in GATEWAY.upstreams}
+    is_ready = any(upstreams.values())
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "upstreams": upstreams},
+    )
+
+
+@app.get("/models")
+def models():
+    return {"upstreams": {u.url: u.models for u in GATEWAY.upstreams}}
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(content=GATEWAY.metrics.render(), media_type=CONTENT_TYPE)
+
+
+if __name__ == "__main__":
+    port = int(os.getenv("LM_PORT_NO", "8000"))
+    uvicorn.run(app, host="0.0.0.0", port=port)
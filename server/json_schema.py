@@ -0,0 +1,96 @@
+"""JSON-schema constraints for the `json_schema` constraint type.
+
+Schemas travel as canonical JSON strings so identical schemas share cache
+entries. The HF servers compile them to regexes; API models get them as native
+structured output.
+"""
+
+from functools import lru_cache
+from typing import Union
+from pydantic import BaseModel
+import json
+
+# One optional space between tokens keeps output compact and stops the model
+# from padding with unbounded whitespace, which the default pattern allows.
+WHITESPACE_PATTERN = r"[ ]?"
+# Name of the tool Anthropic models are forced to call
+CLAUDE_TOOL_NAME = "respond"
+
+
+def canonical_schema(schema: Union[dict, str, type[BaseModel]]) -> str:
+    """A schema given as a dict, JSON string or pydantic model, as sorted JSON."""
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        schema = schema.model_json_schema()
+    elif isinstance(schema, str):
+        schema = json.loads(schema)
+    if not isinstance(schema, dict):
+        raise ValueError(f"A JSON schema must be an object, got {schema!r}")
+    return json.dumps(schema, sort_keys=True)
+
+
+@lru_cache(maxsize=256)
+def schema_to_regex(schema: str) -> str:
+    """Compile a canonical schema to the regex outlines decodes against."""
+    from outlines.fsm.json_schema import build_regex_from_schema
+
+    return build_regex_from_schema(schema, whitespace_pattern=WHITESPACE_PATTERN)
+
+
+def openai_response_format(schema: str) -> dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "response",
+            "schema": json.loads(schema),
+            "strict": True,
+        },
+    }
+
+
+def claude_tool_def(schema: str) -> list[dict]:
+    """A single tool whose input is the response; the client forces its use."""
+    return [
+        {
+            "name": CLAUDE_TOOL_NAME,
+            "description": "Respond with a value matching the input schema.",
+            "input_schema": json.loads(schema),
+        }
+    ]
+
+
+def example_instance(schema: Union[dict, str], defs: dict = None):
+    """
+    A minimal value matching `schema`: the first enum value, 0, false, "", and
+    objects and arrays holding as little as the schema requires.
+    """
+    if isinstance(schema, str):
+        schema = json.loads(schema)
+    defs = {**(defs or {}), **schema.get("$defs", {})}
+    if "$ref" in schema:
+        return example_instance(defs[schema["$ref"].split("/")[-1]], defs)
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return schema["enum"][0]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            return example_instance(schema[key][0], defs)
+    kind = schema.get("type", "object")
+    if isinstance(kind, list):
+        kind = kind[0]
+    if kind == "object":
+        properties = schema.get("properties", {})
+        return {
+            name: example_instance(properties.get(name, {}), defs)
+            for name in schema.get("required", properties)
+        }
+    if kind == "array":
+        item = example_instance(schema.get("items", {}), defs)
+        return [item] * schema.get("minItems", 0)
+    if kind in ("integer", "number"):
+        return max(0, schema.get("minimum", 0))
+    if kind == "boolean":
+        return False
+    if kind == "null":
+        return None
+    return "x" * schema.get("minLength", 0)
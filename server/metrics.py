@@ -0,0 +1,234 @@
+"""Minimal Prometheus-style metrics for the model servers.
+
+Counters, gauges and histograms are registered on a `MetricsRegistry` and
+rendered in the Prometheus text exposition format by `render()`. Gauges can
+also be backed by a function that is evaluated at scrape time.
+"""
+
+from typing import Callable, Optional
+import bisect
+import threading
+
+# Seconds, from a cached single-token decode step up to a long generation
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320, 640)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra: Optional[tuple] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        assert set(labels) == set(
+            self.labelnames
+        ), f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        """Return (suffix, formatted labels, value) for every series."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        assert amount >= 0, "Counters can only increase."
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self.lock:
+            return [
+                ("", _format_labels(self.labelnames, k), v)
+                for k, v in sorted(self.values.items())
+            ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values = {}
+        self.function = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def set_function(self, function: Callable[[], dict[tuple, float]]):
+        """
+        Compute the gauge at scrape time. `function` returns a dict mapping a
+        tuple of label values (in `labelnames` order) to the current value.
+        """
+        self.function = function
+
+    def samples(self):
+        if self.function is not None:
+            values = {
+                tuple(str(v) for v in k): val for k, val in self.function().items()
+            }
+        else:
+            with self.lock:
+                values = dict(self.values)
+        return [
+            ("", _format_labels(self.labelnames, k), v)
+            for k, v in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> {"counts": [...], "sum": float, "count": int}
+        self.series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.setdefault(
+                key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            )
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def get_count(self, **labels) -> int:
+        series = self.series.get(self._key(labels))
+        return series["count"] if series else 0
+
+    def get_sum(self, **labels) -> float:
+        series = self.series.get(self._key(labels))
+        return series["sum"] if series else 0.0
+
+    def samples(self):
+        out = []
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, series["counts"]):
+                    cumulative += n
+                    labels = _format_labels(self.labelnames, key, ("le", bound))
+                    out.append(("_bucket", labels, cumulative))
+                labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+                out.append(("_bucket", labels, series["count"]))
+                labels = _format_labels(self.labelnames, key)
+                out.append(("_sum", labels, series["sum"]))
+                out.append(("_count", labels, series["count"]))
+        return out
+
+
+class MetricsRegistry:
+    """
+    A named collection of metrics rendered together on `/metrics`.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self.lock:
+            assert metric.name not in self.metrics, f"Duplicate metric {metric.name}"
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(
+            Histogram(name, documentation, labelnames, buckets=buckets)
+        )
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
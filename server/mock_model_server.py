@@ -0,0 +1,100 @@
+"""A stand-in model server for exercising the gateway and client without a GPU.
+It speaks the protocol of `concurrent_multiple_model_server` and answers with
+canned text after a simulated latency. Run with:
+
+    MOCK_MODELS=meta-llama/Llama-3.1-8B-Instruct MOCK_LATENCY=0.2 \\
+        uvicorn server.mock_model_server:app --port 9001
+"""
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Union, Optional, Any
+import json
+import random
+import time
+import os
+import uvicorn
+from server.json_schema import example_instance
+from server.transport import MsgpackRoute
+
+app = FastAPI()
+app.router.route_class = MsgpackRoute
+
+# Models reported as already loaded
+LOADED = {m for m in os.getenv("MOCK_MODELS", "").split(",") if m}
+# Seconds per request, plus up to MOCK_JITTER of random delay
+LATENCY = float(os.getenv("MOCK_LATENCY", "0.1"))
+JITTER = float(os.getenv("MOCK_JITTER", "0"))
+# Extra delay the first time an unloaded model is requested
+LOAD_LATENCY = float(os.getenv("MOCK_LOAD_LATENCY", "1"))
+
+
+class ForwardRequest(BaseModel):
+    name_of_model: str
+    history: list[dict]
+    use_cache: bool
+    constraints: Optional[Union[list[str], str]]
+    constraint_type: Optional[str]
+    response_format: Any
+    random_seed: int
+    max_new_tokens: Optional[int] = None
+    stop: Optional[list[str]] = None
+    n: int = 1
+
+
+@app.post("/forward")
+def forward(request: ForwardRequest):
+    if request.n > 1:
+        # All samples in one simulated batch
+        text = forward(request.model_copy(update={"n": 1}))["generated_text"]
+        return {"generated_text": text, "samples": [text] * request.n}
+    if request.name_of_model not in LOADED:
+        time.sleep(LOAD_LATENCY)
+        LOADED.add(request.name_of_model)
+    time.sleep(LATENCY + random.random() * JITTER)
+
+    if request.constraint_type == "choice" and request.constraints:
+        return {"generated_text": request.constraints[0]}
+    if request.constraint_type == "types":
+        return {"generated_text": "0"}
+    if request.constraint_type == "json_schema":
+        return {"generated_text": json.dumps(example_instance(request.constraints))}
+    last = request.history[-1]["content"] if request.history else ""
+    text = f"[{request.name_of_model} on {os.getpid()}] {last[:80]}"
+    if request.max_new_tokens:
+        # One word per token
+        text = " ".join(text.split(" ")[: request.max_new_tokens])
+    return {"generated_text": text}
+
+
+@app.post("/forward_stream")
+def forward_stream(request: ForwardRequest):
+    text = forward(request)["generated_text"]
+
+    def events():
+        for word in text.split(" "):
+            yield f"data: {json.dumps({'token': word + ' '})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'generated_text': text})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
+@app.get("/models")
+def models():
+    return {"models": {m: "ready" for m in sorted(LOADED)}}
+
+
+@app.get("/ready")
+def ready(model: Optional[str] = None):
+    return {"ready": True, "models": {m: "ready" for m in sorted(LOADED)}}
+
+
+if __name__ == "__main__":
+    port = int(os.getenv("LM_PORT_NO", "9001"))
+    uvicorn.run(app, host="0.0.0.0", port=port)
@@ -1,7 +1,9 @@
 from server.model_server import ForwardRequest
+from server import json_schema, transport
+from server.metrics import MetricsRegistry
 import requests
 from enum import Enum
-from typing import Union, Optional
+from typing import Union, Optional, Iterator
 from openai import OpenAI, NotGiven
 from anthropic import Anthropic
 import anthropic
@@ -11,6 +13,10 @@ from pydantic import BaseModel
 from dotenv import load_dotenv
 import os
 import json
+import socket
+import threading
+import time
+import warnings
 
 
 class Options(BaseModel):
@@ -28,16 +34,93 @@ memory = Memory(".joblib_cache", verbose=0)
 port = os.getenv("LM_PORT_NO")  # Read 'PORT' environment variable
 url = os.getenv("LM_SERVER_URL")
 
+# Roles that generate code ahead of the dialog and can wait behind other traffic
+OFFLINE_ROLES = {"code_gen", "type_gen", "choice_gen", "key_spec_gen"}
+# Request body encoding: json, or msgpack for smaller, faster bodies
+TRANSPORT = os.getenv("LM_TRANSPORT", "json")
+# How often to retry when the server answers 429 (queue full)
+MAX_QUEUE_FULL_RETRIES = 20
+# Only HF models enforce regex, types and cfg; API models see the prompt alone
+CONSTRAINT_TYPES = ["types", "choice", "regex", "json_schema", "cfg", "none"]
+# Default (max_new_tokens, stop) per logging role. Budgets leave room for the
+# longest sensible output of the prompt; calls that ask the model to reason
+# out loud pass their own.
+ROLE_GENERATION_DEFAULTS = {
+    "predict_cq": (128, ["\n\n"]),
+    "key_error": (128, ["\n\n"]),
+    "response_not_found": (128, ["\n\n"]),
+    "answer_cq": (256, None),
+    "did_response_contain_answer": (16, None),
+    "extract_value_from_ans": (64, None),
+    # {"answered": ..., "value": ...}
+    "answer_and_value": (96, None),
+    # One value per household member
+    "extract_member_values": (512, None),
+    "extract_household_values": (256, None),
+    "predict_benefits_ready": (32, None),
+    "predict_benefits_eligibility": (512, None),
+    "type_gen": (64, None),
+    "choice_gen": (1024, None),
+    # Types and choices of a batch of keys in one JSON object
+    "key_spec_gen": (4096, None),
+    "code_gen": (4096, None),
+}
+# Anthropic's hard output limit used before budgets existed
+CLAUDE_MAX_TOKENS = 8192
+
+
+def generation_budget(
+    logging_role: str, max_new_tokens: Optional[int], stop: Optional[list[str]]
+) -> tuple[Optional[int], Optional[list[str]]]:
+    """
+    The role's default budget and stop strings, overridden by explicit values.
+    Pass `stop=[]` to disable the default stop strings.
+    """
+    default_tokens, default_stop = ROLE_GENERATION_DEFAULTS.get(
+        logging_role, (None, None)
+    )
+    if max_new_tokens is None:
+        max_new_tokens = default_tokens
+    if stop is None:
+        stop = default_stop
+    return max_new_tokens, stop or None
+
+
+# API model truncations, counted like the server's
+METRICS = MetricsRegistry()
+TRUNCATIONS = METRICS.counter(
+    "lm_truncated_generations_total",
+    "Generations cut off by the request's max_new_tokens.",
+    ("model",),
+)
+
+
+def record_truncation(name_of_model: str, max_new_tokens: Optional[int]):
+    warnings.warn(f"{name_of_model} output truncated at {max_new_tokens} tokens")
+    TRUNCATIONS.inc(model=name_of_model)
 
-@memory.cache
-def gpt_forward_cached(name_of_model, history, response_format):
 
+# Samples fetched together, handed one by one to the cached functions below
+_presampled = threading.local()
+
+
+def _gpt_complete(name_of_model, history, response_format, max_new_tokens, stop, n):
     client = OpenAI()
 
     temperature = 0.7
+    limits = {}
     if name_of_model.startswith("o1") or name_of_model.startswith("o3"):
         response_format = None
         temperature = 1
+        # Hidden reasoning tokens count against the limit, so leave it unset
+    else:
+        if max_new_tokens:
+            limits["max_tokens"] = max_new_tokens
+        if stop:
+            # The API accepts at most 4 stop sequences
+            limits["stop"] = stop[:4]
+    if n > 1:
+        limits["n"] = n
     # if response_format is None:
     # completion = client.beta.chat.completions.parse(
     completion = client.chat.completions.create(
@@ -45,14 +128,92 @@ def gpt_forward_cached(name_of_model, history, response_format):
         messages=history,
         temperature=temperature,
         response_format=response_format,
+        **limits,
     )
 
-    generated_text = completion.choices[0].message.content.strip()
-    return generated_text
+    texts = []
+    for choice in completion.choices:
+        if choice.finish_reason == "length":
+            record_truncation(name_of_model, max_new_tokens)
+        texts.append(choice.message.content.strip())
+    return texts
+
+
+@memory.cache
+def gpt_forward_cached(
+    name_of_model, history, response_format, max_new_tokens=None, stop=None, seed=None
+):
+    """
+    `seed` is not sent to the API; it tells samples of the same request apart
+    in the cache (see `gpt_forward_samples`).
+    """
+    presampled = getattr(_presampled, "text", None)
+    if presampled is not None:
+        return presampled
+    return _gpt_complete(
+        name_of_model, history, response_format, max_new_tokens, stop, n=1
+    )[0]
+
+
+def _sample_seed(seed, i):
+    """Cache seed of sample `i`; the first is cached like a single request."""
+    return None if i == 0 else seed + i
+
+
+def gpt_forward_samples(
+    name_of_model, history, response_format, max_new_tokens, stop, seed, n
+) -> list[str]:
+    """
+    `n` samples, cached one by one under seeds `seed + 1` .. `seed + n - 1`
+    after the first, which shares the entry of the single-sample call. The
+    samples missing from the cache are drawn with a single API call.
+    """
+    calls = [
+        (
+            name_of_model,
+            history,
+            response_format,
+            max_new_tokens,
+            stop,
+            _sample_seed(seed, i),
+        )
+        for i in range(n)
+    ]
+    missing = [
+        i
+        for i, args in enumerate(calls)
+        if not gpt_forward_cached.check_call_in_cache(*args)
+    ]
+    fresh = (
+        _gpt_complete(
+            name_of_model, history, response_format, max_new_tokens, stop, len(missing)
+        )
+        if missing
+        else []
+    )
+    for i, text in zip(missing, fresh):
+        _presampled.text = text
+        try:
+            gpt_forward_cached(*calls[i])
+        finally:
+            _presampled.text = None
+    return [gpt_forward_cached(*args) for args in calls]
 
 
 @memory.cache
-def claude_forward_cached(name_of_model, history, response_format, claude_tool_def):
+def claude_forward_cached(
+    name_of_model,
+    history,
+    response_format,
+    claude_tool_def,
+    max_new_tokens=None,
+    stop=None,
+    seed=None,
+):
+    """
+    Anthropic has no `n`, so samples are separate calls told apart in the
+    cache by `seed`, which is not sent to the API.
+    """
     claude_tool_def = [] if claude_tool_def is None else claude_tool_def
     client = Anthropic()
 
@@ -70,13 +231,24 @@ def claude_forward_cached(name_of_model, history, response_format, claude_tool_d
         elif msg["role"] == "assistant":
             messages.append({"role": "assistant", "content": msg["content"]})
 
+    # The API rejects stop sequences made only of whitespace
+    stop_sequences = [x for x in stop or [] if x.strip()]
     completion = client.messages.create(
         model=name_of_model,
         messages=messages,
         temperature=temperature,
         tools=claude_tool_def,
-        max_tokens=8192,
+        # Structured output: make the model answer through the tool
+        tool_choice=(
+            {"type": "tool", "name": claude_tool_def[0]["name"]}
+            if claude_tool_def
+            else anthropic.NOT_GIVEN
+        ),
+        max_tokens=min(max_new_tokens or CLAUDE_MAX_TOKENS, CLAUDE_MAX_TOKENS),
+        stop_sequences=stop_sequences or anthropic.NOT_GIVEN,
     )
+    if completion.stop_reason == "max_tokens":
+        record_truncation(name_of_model, max_new_tokens)
     if claude_tool_def:
         first_tool_use_block = [
             x
@@ -90,11 +262,42 @@ def claude_forward_cached(name_of_model, history, response_format, claude_tool_d
     return generated_text
 
 
+def _match_choice(text: str, choices: list[str]) -> str:
+    """Return the choice mentioned last in `text`, or `text` itself if none is."""
+    lowered = text.lower()
+    positions = {c: lowered.rfind(c.lower()) for c in choices}
+    found = {c: pos for c, pos in positions.items() if pos >= 0}
+    if not found:
+        return text
+    return max(found, key=lambda c: (found[c], len(c)))
+
+
 class ModelAPIClient:
     def __init__(self, api_url, random_seed, lm_logger=None):
         self.api_url = url
         self.lm_logger = lm_logger
         self.random_seed = random_seed
+        # Scheduling class on the server: interactive, batch or offline
+        self.priority = os.getenv("LM_PRIORITY", "batch")
+        # Requests are scheduled fairly across client ids
+        self.client_id = os.getenv(
+            "LM_CLIENT_ID", f"{socket.gethostname()}-{os.getpid()}"
+        )
+
+    def _post(self, path: str, fr: ForwardRequest, **kwargs) -> requests.Response:
+        if TRANSPORT == "msgpack":
+            return requests.post(
+                f"{self.api_url}:{port}{path}",
+                data=transport.packb(vars(fr)),
+                headers={"Content-Type": transport.MSGPACK_CONTENT_TYPE},
+                **kwargs,
+            )
+        return requests.post(f"{self.api_url}:{port}{path}", json=vars(fr), **kwargs)
+
+    def _priority(self, logging_role: str) -> str:
+        if self.priority == "batch" and logging_role in OFFLINE_ROLES:
+            return "offline"
+        return self.priority
 
     def forward(
         self,
@@ -106,8 +309,107 @@ class ModelAPIClient:
         constraints: Optional[Union[list[str], list[type], BaseModel]] = [],
         openai_response_format=None,
         claude_tool_def=None,
+        max_new_tokens: Optional[int] = None,
+        stop: Optional[list[str]] = None,
     ):
-        assert constraint_type in ["types", "choice", "regex", "none"]
+        response = self._forward_response(
+            history=history,
+            chat_model_id=chat_model_id,
+            use_cache=use_cache,
+            logging_role=logging_role,
+            constraint_type=constraint_type,
+            constraints=constraints,
+            openai_response_format=openai_response_format,
+            claude_tool_def=claude_tool_def,
+            max_new_tokens=max_new_tokens,
+            stop=stop,
+        )
+        return response["generated_text"]
+
+    def forward_samples(
+        self,
+        history: str,
+        chat_model_id: str,
+        use_cache: bool,
+        logging_role: str,
+        n: int,
+        constraint_type: str = "none",
+        constraints: Optional[Union[list[str], list[type], BaseModel]] = [],
+        openai_response_format=None,
+        claude_tool_def=None,
+        max_new_tokens: Optional[int] = None,
+        stop: Optional[list[str]] = None,
+    ) -> list[str]:
+        """
+        `n` independent completions of the same prompt in one round trip. Each
+        sample is cached on its own under seed `random_seed + i`, so asking
+        again with a larger `n` only generates the new samples. The first
+        sample is the one a single-sample call returns. HF models
+        decode the samples as one batch and OpenAI models use the native `n`;
+        Anthropic models are called once per sample.
+        """
+        response = self._forward_response(
+            history=history,
+            chat_model_id=chat_model_id,
+            use_cache=use_cache,
+            logging_role=logging_role,
+            constraint_type=constraint_type,
+            constraints=constraints,
+            openai_response_format=openai_response_format,
+            claude_tool_def=claude_tool_def,
+            max_new_tokens=max_new_tokens,
+            stop=stop,
+            n=n,
+        )
+        return response.get("samples", [response["generated_text"]])
+
+    def forward_choice(
+        self,
+        history: str,
+        chat_model_id: str,
+        use_cache: bool,
+        logging_role: str,
+        choices: list[str],
+    ):
+        """
+        Pick one of `choices` and return it together with a probability per choice.
+
+        HF models score every choice on the server in a single forward pass. API
+        models only return the generated text, so the matched choice gets all
+        the probability mass.
+        """
+        response = self._forward_response(
+            history=history,
+            chat_model_id=chat_model_id,
+            use_cache=use_cache,
+            logging_role=logging_role,
+            constraint_type="choice",
+            constraints=choices,
+        )
+        generated_text = response["generated_text"]
+        probs = response.get("choice_probs")
+        if probs is None:
+            matched = _match_choice(generated_text, choices)
+            probs = {c: float(c == matched) for c in choices}
+            generated_text = matched
+        return generated_text, probs
+
+    def _forward_response(
+        self,
+        history: str,
+        chat_model_id: str,
+        use_cache: bool,
+        logging_role: str,
+        constraint_type: str = "none",
+        constraints: Optional[Union[list[str], list[type], BaseModel]] = [],
+        openai_response_format=None,
+        claude_tool_def=None,
+        max_new_tokens: Optional[int] = None,
+        stop: Optional[list[str]] = None,
+        n: int = 1,
+    ) -> dict:
+        assert constraint_type in CONSTRAINT_TYPES
+        assert n >= 1
         assert not (constraint_type == "none" and constraints)
         # if constraints:
         #     assert "int" not in constraints  # probably an error
@@ -116,6 +418,14 @@ class ModelAPIClient:
 
         if constraint_type == "types":
             constraints = [(x).__name__ for x in constraints]
+        if constraint_type == "json_schema":
+            constraints = json_schema.canonical_schema(constraints)
+            # API models get the schema as native structured output
+            if openai_response_format is None:
+                openai_response_format = json_schema.openai_response_format(constraints)
+            if claude_tool_def is None:
+                claude_tool_def = json_schema.claude_tool_def(constraints)
+        max_new_tokens, stop = generation_budget(logging_role, max_new_tokens, stop)
 
         fr = ForwardRequest(
             name_of_model=chat_model_id,
@@ -126,6 +436,11 @@ class ModelAPIClient:
             response_format=openai_response_format,
             random_seed=self.random_seed,
             claude_tool_def=claude_tool_def,
+            max_new_tokens=max_new_tokens,
+            stop=stop,
+            n=n,
+            priority=self._priority(logging_role),
+            client_id=self.client_id,
         )
         if (
             fr.name_of_model.startswith("gpt")
@@ -141,10 +456,15 @@ class ModelAPIClient:
             response = self.forward_claude(fr)
         else:
 
-            response_package = requests.post(
-                f"{self.api_url}:{port}/forward", json=vars(fr)
-            )
-            status_code = response_package.status_code
+            for _ in range(MAX_QUEUE_FULL_RETRIES):
+                response_package = self._post("/forward", fr)
+                status_code = response_package.status_code
+                if status_code != 429:
+                    break
+                # The server's queue for this model is full; back off as asked
+                retry_after = int(response_package.headers.get("Retry-After", "1"))
+                print(f"Server busy, retrying in {retry_after}s")
+                time.sleep(retry_after)
             response = response_package.json()
             if status_code != 200:
                 print(f"Prediction error: {response['detail']}")
@@ -152,28 +472,151 @@ class ModelAPIClient:
 
         generated_text = response["generated_text"]
         if self.lm_logger:
-            self.lm_logger.log_io(
-                lm_input=history, lm_output=generated_text, role=logging_role
-            )
+            for sample in response.get("samples", [generated_text]):
+                self.lm_logger.log_io(
+                    lm_input=history, lm_output=sample, role=logging_role
+                )
         # print(f"prompt: {history[-1]['content']}")
         print(f"response: {generated_text}")
         print("==================================")
-        return generated_text
+        return response
+
+    def stream(
+        self,
+        history: str,
+        chat_model_id: str,
+        use_cache: bool,
+        logging_role: str,
+        constraint_type: str = "none",
+        constraints: Optional[Union[list[str], list[type], BaseModel]] = [],
+        max_new_tokens: Optional[int] = None,
+        stop: Optional[list[str]] = None,
+    ) -> Iterator[str]:
+        """
+        Yield generated text incrementally. HF models stream tokens from the
+        server as they are decoded; API models yield their whole response once.
+
+        Stop iterating (or call `.close()` on the iterator) to cancel: the
+        connection is closed and the server stops generating.
+        """
+        assert constraint_type in CONSTRAINT_TYPES
+        if chat_model_id.startswith(("gpt", "o1", "o3", "claude")):
+            yield self.forward(
+                history=history,
+                chat_model_id=chat_model_id,
+                use_cache=use_cache,
+                logging_role=logging_role,
+                constraint_type=constraint_type,
+                constraints=constraints,
+                max_new_tokens=max_new_tokens,
+                stop=stop,
+            )
+            return
+
+        if constraint_type == "types":
+            constraints = [(x).__name__ for x in constraints]
+        if constraint_type == "json_schema":
+            constraints = json_schema.canonical_schema(constraints)
+        max_new_tokens, stop = generation_budget(logging_role, max_new_tokens, stop)
+        fr = ForwardRequest(
+            name_of_model=chat_model_id,
+            history=history,
+            use_cache=use_cache,
+            constraints=constraints,
+            constraint_type=constraint_type,
+            response_format=None,
+            random_seed=self.random_seed,
+            claude_tool_def=None,
+            max_new_tokens=max_new_tokens,
+            stop=stop,
+            priority=self._priority(logging_role),
+            client_id=self.client_id,
+        )
+        for attempt in range(MAX_QUEUE_FULL_RETRIES):
+            response_package = self._post("/forward_stream", fr, stream=True)
+            if (
+                response_package.status_code != 429
+                or attempt == MAX_QUEUE_FULL_RETRIES - 1
+            ):
+                break
+            retry_after = int(response_package.headers.get("Retry-After", "1"))
+            # Return the pooled connection before waiting
+            response_package.close()
+            print(f"Server busy, retrying in {retry_after}s")
+            time.sleep(retry_after)
+        if response_package.status_code != 200:
+            with response_package:
+                print(f"Prediction error: {response_package.json()['detail']}")
+            raise Exception("Prediction error")
+
+        with response_package:
+            event = None
+            for line in response_package.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: ") :]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: ") :])
+                    if event == "done":
+                        if self.lm_logger:
+                            self.lm_logger.log_io(
+                                lm_input=history,
+                                lm_output=data["generated_text"],
+                                role=logging_role,
+                            )
+                        return
+                    if event == "error":
+                        print(f"Prediction error: {data['detail']}")
+                        raise Exception("Prediction error")
+                    yield data["token"]
+                else:
+                    event = None
 
     def forward_gpt(self, request: ForwardRequest):
+        if request.n > 1:
+            samples = gpt_forward_samples(
+                request.name_of_model,
+                request.history,
+                request.response_format,
+                request.max_new_tokens,
+                request.stop,
+                request.random_seed,
+                request.n,
+            )
+            return {"generated_text": samples[0], "samples": samples}
 
         completion = gpt_forward_cached(
-            request.name_of_model, request.history, request.response_format
+            request.name_of_model,
+            request.history,
+            request.response_format,
+            request.max_new_tokens,
+            request.stop,
         )
         generated_text = completion
         return {"generated_text": generated_text}
 
     def forward_claude(self, request: ForwardRequest):
+        if request.n > 1:
+            samples = [
+                claude_forward_cached(
+                    request.name_of_model,
+                    request.history,
+                    request.response_format,
+                    request.claude_tool_def,
+                    request.max_new_tokens,
+                    request.stop,
+                    _sample_seed(request.random_seed, i),
+                )
+                for i in range(request.n)
+            ]
+            return {"generated_text": samples[0], "samples": samples}
+
         completion = claude_forward_cached(
             request.name_of_model,
             request.history,
             request.response_format,
             request.claude_tool_def,
+            request.max_new_tokens,
+            request.stop,
         )
         generated_text = completion
         return {"generated_text": generated_text}
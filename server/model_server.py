@@ -13,6 +13,8 @@ from dotenv import load_dotenv
 import time
 import threading
 import gc
+from server.json_schema import canonical_schema, schema_to_regex
+from server.transport import MsgpackRoute
 
 load_dotenv(override=False)
 
@@ -24,6 +26,7 @@ uvicorn server.model_server:app --reload
 memory = Memory(".joblib_cache", verbose=0)
 
 app = FastAPI()
+app.router.route_class = MsgpackRoute
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
@@ -79,6 +82,19 @@ class ForwardRequest(BaseModel):
     random_seed: int
     # prefix: Optional[list[dict]]
     claude_tool_def: Optional[list[dict]]
+    # Generation budget in tokens and stop strings; None means unlimited
+    max_new_tokens: Optional[int] = None
+    stop: Optional[list[str]] = None
+    # Number of samples; sample i is generated and cached as the single-sample
+    # request seeded with random_seed + i
+    n: int = 1
+    # Token ids of the first `prefix_messages` messages, for clients that hold
+    # the tokenizer (concurrent server only)
+    prefix_token_ids: Optional[list[int]] = None
+    prefix_messages: int = 0
+    # Scheduling hints for the concurrent server
+    priority: str = "batch"
+    client_id: Optional[str] = None
 
 
 def _str_to_type(s):
@@ -90,6 +106,19 @@ def _str_to_type(s):
         raise NotImplementedError
 
 
+def _cache_identity(request: ForwardRequest) -> ForwardRequest:
+    """Reset the fields that do not change the output, so identical requests
+    share cache entries."""
+    return request.model_copy(
+        update={
+            "priority": "batch",
+            "client_id": None,
+            "prefix_token_ids": None,
+            "prefix_messages": 0,
+        }
+    )
+
+
 @memory.cache
 def forward_hf(request: ForwardRequest):
     global current_name_of_model, model, tk, raw_model
@@ -103,6 +132,10 @@ def forward_hf(request: ForwardRequest):
         constraints = request.constraints
     elif request.constraint_type == "regex":
         constraints = request.constraints
+    elif request.constraint_type == "json_schema":
+        constraints = canonical_schema(request.constraints)
+    elif request.constraint_type == "cfg":
+        constraints = request.constraints
     elif request.constraint_type == "none":
         constraints = None
     else:
@@ -159,10 +192,24 @@ def forward_hf(request: ForwardRequest):
             generator = outlines.generate.regex(
                 model, request.constraints, sampler=sampler
             )
+        elif request.constraint_type == "json_schema":
+            generator = outlines.generate.regex(
+                model, schema_to_regex(constraints), sampler=sampler
+            )
+        elif request.constraint_type == "cfg":
+            generator = outlines.generate.cfg(model, constraints, sampler=sampler)
         else:
             print(f"Unknown constraints: {request.constraints}")
             raise NotImplementedError
-        generated_text = str(generator(prompt)).strip()
+        stop_at = request.stop if request.constraint_type == "none" else None
+        generated_text = str(
+            generator(
+                prompt,
+                max_tokens=request.max_new_tokens,
+                stop_at=stop_at,
+                seed=request.random_seed,
+            )
+        ).strip()
         print(f"hf Generated: {generated_text}")
         return {"generated_text": generated_text}
     except Exception as e:
@@ -181,6 +228,17 @@ def forward(request: ForwardRequest):
     last_request_time = time.time()  # update on every request
     try:
         assert not request.name_of_model.startswith("gpt"), "gpt moved to client side"
+        request = _cache_identity(request)
+        if request.n > 1:
+            samples = [
+                forward_hf(
+                    request.model_copy(
+                        update={"n": 1, "random_seed": request.random_seed + i}
+                    )
+                )["generated_text"]
+                for i in range(request.n)
+            ]
+            return {"generated_text": samples[0], "samples": samples}
         output = forward_hf(request)
         return output
     except Exception as e:
@@ -13,6 +13,9 @@ from dotenv import load_dotenv
 import time
 import threading
 import os
+from server.json_schema import canonical_schema, schema_to_regex
+from server.backends import get_backend, parse_backend_config
+from server.transport import MsgpackRoute
 
 load_dotenv(override=False)
 
@@ -23,6 +26,7 @@ uvicorn server.model_server:app --reload
 
 memory = Memory(".joblib_cache", verbose=0)
 app = FastAPI()
+app.router.route_class = MsgpackRoute
 openai.api_key = os.getenv("OPENAI_API_KEY")
 sampler = outlines.samplers.multinomial(temperature=0.7)
 
@@ -104,6 +108,11 @@ class ForwardRequest(BaseModel):
     constraint_type: Optional[str]
     response_format: Any
     random_seed: int
+    # Generation budget in tokens and stop strings; None means unlimited
+    max_new_tokens: Optional[int] = None
+    stop: Optional[list[str]] = None
+    # Number of samples; sample i is the single-sample request seeded with random_seed + i
+    n: int = 1
 
 def _str_to_type(s):
     if s == "int":
@@ -129,6 +138,10 @@ def forward_hf(request: ForwardRequest):
         constraints = request.constraints
     elif request.constraint_type == "regex":
         constraints = request.constraints
+    elif request.constraint_type == "json_schema":
+        constraints = canonical_schema(request.constraints)
+    elif request.constraint_type == "cfg":
+        constraints = request.constraints
     elif request.constraint_type == "none":
         constraints = None
     else:
@@ -151,8 +164,14 @@ def forward_hf(request: ForwardRequest):
             # Model not yet loaded -> choose a GPU according to the logic:
             # "If there is an available GPU with no model loaded, then load
             #  current model on that GPU, else load model on any available GPU."
-            if torch.cuda.device_count() == 0:
-                # If no GPU, fallback to CPU
+            backend = get_backend(
+                name_of_model,
+                parse_backend_config(os.getenv("MODEL_BACKENDS")),
+                has_gpu=torch.cuda.device_count() > 0,
+                default=os.getenv("DEFAULT_BACKEND", "auto"),
+            )
+            if not backend.uses_device:
+                # No GPU, or a CPU backend was configured for this model
                 chosen_gpu = None
                 device_map = {"": "cpu"}
             else:
@@ -171,15 +190,10 @@ def forward_hf(request: ForwardRequest):
                 device_map = {"": f"cuda:{chosen_gpu}"}
 
             try:
-                print(f"[{name_of_model}] Loading model onto device_map={device_map} ...")
-                tokenizer = AutoTokenizer.from_pretrained(name_of_model, use_fast=False)
-                raw_model = AutoModelForCausalLM.from_pretrained(
-                    name_of_model,
-                    torch_dtype=torch.bfloat16,
-                    load_in_4bit=True,
-                    device_map=device_map
-                )
-                model_obj = outlines.models.Transformers(raw_model, tokenizer)
+                print(f"[{name_of_model}] Loading model onto device_map={device_map} with backend={backend.name} ...")
+                loaded = backend.load(name_of_model, chosen_gpu)
+                model_obj = loaded["model"]
+                tokenizer = loaded["tokenizer"]
 
                 # Update global structures
                 MODEL_STORE[name_of_model] = {
@@ -217,10 +231,23 @@ def forward_hf(request: ForwardRequest):
             generator = outlines.generate.format(model_obj, constraints[0], sampler=sampler)
         elif request.constraint_type == "regex":
             generator = outlines.generate.regex(model_obj, constraints, sampler=sampler)
+        elif request.constraint_type == "json_schema":
+            generator = outlines.generate.regex(
+                model_obj, schema_to_regex(constraints), sampler=sampler
+            )
+        elif request.constraint_type == "cfg":
+            generator = outlines.generate.cfg(model_obj, constraints, sampler=sampler)
         else:
             raise NotImplementedError(f"Constraint type {request.constraint_type} not supported.")
 
-        generated_text = str(generator(prompt)).strip()
+        is_text = not constraints or request.constraint_type == "none"
+        generated_text = str(
+            generator(
+                prompt,
+                max_tokens=request.max_new_tokens,
+                stop_at=request.stop if is_text else None,
+            )
+        ).strip()
         print(f"[{name_of_model}] Generated text: {generated_text}")
 
         return {"generated_text": generated_text}
@@ -244,6 +271,12 @@ def forward(request: ForwardRequest):
         # (Remove if not needed)
         assert not request.name_of_model.startswith("gpt"), "GPT models are client side only."
 
+        if request.n > 1:
+            samples = [
+                forward_hf(request.model_copy(update={"n": 1, "random_seed": request.random_seed + i}))["generated_text"]
+                for i in range(request.n)
+            ]
+            return {"generated_text": samples[0], "samples": samples}
         return forward_hf(request)
     except Exception as e:
         raise HTTPException(
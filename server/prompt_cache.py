@@ -0,0 +1,162 @@
+"""Token ids of chat prompts, reused as a dialog grows.
+
+`PromptTokenCache` keeps the ids of each rendered history, so the next turn
+only tokenizes its new messages. Prefixes are reused only at special-token
+boundaries, and `pretokenized_encode` makes outlines use the ids.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+import hashlib
+import json
+import threading
+
+
+def history_digests(history: list[dict]) -> list[str]:
+    """Digest of `history[:k]` for k = 0 .. len(history), computed in one pass."""
+    digest = hashlib.sha256()
+    digests = [digest.hexdigest()]
+    for message in history:
+        digest.update(json.dumps(message, sort_keys=True).encode())
+        digests.append(digest.hexdigest())
+    return digests
+
+
+def boundary_tokens(tokenizer) -> set[str]:
+    """Special tokens after which text is tokenized independently."""
+    tokens = set(getattr(tokenizer, "all_special_tokens", []))
+    for token in getattr(tokenizer, "added_tokens_decoder", {}).values():
+        if getattr(token, "special", False):
+            tokens.add(str(token))
+    return {t for t in tokens if t}
+
+
+class PromptTokenCache:
+    def __init__(self, max_entries: int = 512, verify_first: int = 3):
+        # (model, history digest) -> (rendered text, token ids)
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.verify_first = verify_first
+        self.verified = {}
+        self.disabled = set()
+        self.boundaries = {}
+        self.lock = threading.Lock()
+
+    def _get(self, key) -> Optional[tuple[str, list[int]]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, text: str, ids: list[int]):
+        with self.lock:
+            self.entries[key] = (text, ids)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _at_boundary(self, model_name: str, tokenizer, text: str) -> bool:
+        if model_name not in self.boundaries:
+            self.boundaries[model_name] = tuple(boundary_tokens(tokenizer))
+        return text.endswith(self.boundaries[model_name])
+
+    def _tokenize(self, tokenizer, text: str, first: bool) -> list[int]:
+        return list(tokenizer(text, add_special_tokens=first).input_ids)
+
+    def encode(
+        self,
+        model_name: str,
+        tokenizer,
+        history: list[dict],
+        prompt: str,
+        prefix_token_ids: Optional[list[int]] = None,
+        prefix_messages: int = 0,
+    ) -> tuple[list[int], int]:
+        """
+        Ids of `prompt`, the rendering of `history` with the generation prompt,
+        as `tokenizer(prompt).input_ids` would give them, and how many of them
+        were reused rather than tokenized. `prefix_token_ids` are the client's
+        ids for the first `prefix_messages` messages.
+        """
+        if model_name in self.disabled:
+            return self._tokenize(tokenizer, prompt, True), 0
+        digests = history_digests(history)
+        body = tokenizer.apply_chat_template(
+            history, tokenize=False, add_generation_prompt=False
+        )
+        if not prompt.startswith(body) or not self._at_boundary(
+            model_name, tokenizer, body
+        ):
+            return self._tokenize(tokenizer, prompt, True), 0
+
+        start = None
+        if prefix_token_ids and 0 < prefix_messages <= len(history):
+            text = tokenizer.apply_chat_template(
+                history[:prefix_messages], tokenize=False, add_generation_prompt=False
+            )
+            if body.startswith(text) and self._at_boundary(model_name, tokenizer, text):
+                start = (text, list(prefix_token_ids))
+                self._put((model_name, digests[prefix_messages]), *start)
+        if start is None:
+            for k in range(len(history), 0, -1):
+                entry = self._get((model_name, digests[k]))
+                if entry is not None and body.startswith(entry[0]):
+                    start = entry
+                    break
+
+        reused = 0
+        if start is None:
+            body_ids = self._tokenize(tokenizer, body, True)
+        else:
+            text, ids = start
+            reused = len(ids)
+            body_ids = ids + self._tokenize(tokenizer, body[len(text) :], not text)
+        self._put((model_name, digests[len(history)]), body, body_ids)
+        prompt_ids = body_ids + self._tokenize(tokenizer, prompt[len(body) :], not body)
+
+        if self.verified.get(model_name, 0) < self.verify_first:
+            expected = list(tokenizer(prompt).input_ids)
+            if expected != prompt_ids:
+                print(f"[{model_name}] Prompt token cache disabled: ids differ")
+                self.disabled.add(model_name)
+                return expected, 0
+            self.verified[model_name] = self.verified.get(model_name, 0) + 1
+        return prompt_ids, reused
+
+
+# Ids to use for prompts on the current thread, see `pretokenized`
+_pending = threading.local()
+
+
+@contextmanager
+def pretokenized(prompt: str, ids: Optional[list[int]]):
+    """Let patched tokenizers encode `prompt` as `ids` within this block."""
+    _pending.ids = {prompt: ids} if ids is not None else {}
+    try:
+        yield
+    finally:
+        _pending.ids = {}
+
+
+def pretokenized_encode(outlines_tokenizer):
+    """
+    Patch an outlines `TransformerTokenizer` so `encode` returns the ids given
+    to `pretokenized` instead of tokenizing those prompts again.
+    """
+    original = outlines_tokenizer.encode
+
+    def encode(prompt, **kwargs):
+        import torch
+
+        pending = getattr(_pending, "ids", {})
+        prompts = [prompt] if isinstance(prompt, str) else list(prompt)
+        ids = [pending.get(p) for p in prompts]
+        if kwargs or any(x is None for x in ids) or len({len(x) for x in ids}) != 1:
+            return original(prompt, **kwargs)
+        input_ids = torch.tensor(ids, dtype=torch.long)
+        return input_ids, torch.ones_like(input_ids)
+
+    outlines_tokenizer.encode = encode
+    return outlines_tokenizer
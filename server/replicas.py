@@ -0,0 +1,180 @@
+"""Replica worker processes for CPU models.
+
+A model can be served by N processes, each with its own copy of the model and
+a dispatcher thread pulling from the model's queue. Replicas that crash are
+restarted. The replica side is a "module:function" handler.
+"""
+
+from typing import Any, Optional
+import importlib
+import multiprocessing
+import threading
+import time
+
+POLL_INTERVAL = 1.0
+
+
+class ReplicaError(Exception):
+    """The replica's handler raised; carries its status code and message."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ReplicaCrashedError(Exception):
+    """The replica process died while handling a call."""
+
+    pass
+
+
+def _replica_main(conn, handler_path: str, model_name: str, index: int):
+    module_name, function_name = handler_path.split(":")
+    handler = getattr(importlib.import_module(module_name), function_name)
+    try:
+        handler(model_name, index, "init")
+        init_error = None
+    except Exception as e:
+        # Report the failure on every call rather than crash-looping
+        init_error = ("error", (500, f"Replica failed to start: {e}"))
+    while True:
+        try:
+            method, args = conn.recv()
+        except EOFError:
+            break
+        if init_error is not None:
+            conn.send(init_error)
+            continue
+        try:
+            conn.send(("ok", handler(model_name, index, method, *args)))
+        except Exception as e:
+            status_code = getattr(e, "status_code", 500)
+            detail = str(getattr(e, "detail", e))
+            conn.send(("error", (status_code, detail)))
+
+
+class ReplicaProcess:
+    """
+    One replica process and the pipe to it. Calls are serialized per replica.
+    """
+
+    def __init__(self, model_name: str, index: int, handler_path: str, context):
+        self.model_name = model_name
+        self.index = index
+        self.handler_path = handler_path
+        self.context = context
+        self.lock = threading.Lock()
+        self.restarts = 0
+        self.process = None
+        self.conn = None
+        self.start()
+
+    def start(self):
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_replica_main,
+            args=(child_conn, self.handler_path, self.model_name, self.index),
+            name=f"replica-{self.model_name}-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        print(
+            f"[{self.model_name}] Started replica {self.index} (pid {self.process.pid})"
+        )
+
+    def restart(self):
+        print(f"[{self.model_name}] Restarting replica {self.index}")
+        self.restarts += 1
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+        self.start()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def _recv(self, timeout: Optional[float]):
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.conn.poll(POLL_INTERVAL):
+            if not self.process.is_alive():
+                raise EOFError
+            if deadline is not None and time.time() > deadline:
+                # A hung replica would block this slot forever
+                self.process.kill()
+                raise EOFError
+        return self.conn.recv()
+
+    def call(self, method: str, *args, timeout: Optional[float] = None) -> Any:
+        """
+        Run `method` on the replica and return its result. Raises ReplicaError
+        if the handler failed and ReplicaCrashedError if the process died (it
+        is restarted before raising).
+        """
+        with self.lock:
+            if not self.process.is_alive():
+                self.restart()
+            try:
+                self.conn.send((method, args))
+                status, value = self._recv(timeout)
+            except (EOFError, BrokenPipeError, ConnectionResetError):
+                self.restart()
+                raise ReplicaCrashedError(
+                    f"Replica {self.index} of {self.model_name} crashed during {method}."
+                )
+        if status == "error":
+            raise ReplicaError(*value)
+        return value
+
+
+class ReplicaPool:
+    """
+    N replica processes for one model, with a monitor thread that restarts
+    replicas found dead while idle.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        n_replicas: int,
+        handler_path: str,
+        start_method: str = "spawn",
+        monitor_interval: float = 10.0,
+    ):
+        # spawn, not fork: the parent holds threads and possibly CUDA state
+        context = multiprocessing.get_context(start_method)
+        self.model_name = model_name
+        self.replicas = [
+            ReplicaProcess(model_name, i, handler_path, context)
+            for i in range(n_replicas)
+        ]
+        self.monitor_interval = monitor_interval
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+    def _monitor(self):
+        while True:
+            time.sleep(self.monitor_interval)
+            for replica in self.replicas:
+                if not replica.is_alive() and replica.lock.acquire(blocking=False):
+                    try:
+                        replica.restart()
+                    finally:
+                        replica.lock.release()
+
+    def broadcast(self, method: str, *args, timeout: Optional[float] = None) -> list:
+        """Run `method` on every replica, one after another."""
+        return [r.call(method, *args, timeout=timeout) for r in self.replicas]
+
+    def summary(self) -> list[dict]:
+        return [
+            {
+                "index": r.index,
+                "pid": r.process.pid,
+                "alive": r.is_alive(),
+                "restarts": r.restarts,
+            }
+            for r in self.replicas
+        ]
@@ -0,0 +1,104 @@
+"""In-memory response caching for the model servers.
+
+`ResponseLRU` answers repeated requests from memory before they reach the
+worker queues or the joblib disk cache. `SingleFlight` coalesces identical
+requests that arrive while the first one is still generating.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+import hashlib
+import json
+import threading
+
+
+def request_key(request) -> str:
+    """
+    Hash a request by its JSON content. Cheaper than joblib's argument hashing
+    and stable across processes.
+    """
+    if hasattr(request, "model_dump"):
+        request = request.model_dump(mode="json")
+    payload = json.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseLRU:
+    """
+    A thread-safe least-recently-used map from request key to response.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        """Return the cached response, or None."""
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time. Callers that arrive while a call
+    for the same key is in flight wait for it and share its result (or its
+    exception) instead of starting their own.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> tuple[Any, bool]:
+        """
+        Returns:
+            (result, shared): `shared` is True if another caller ran the function.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result, True
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.exception = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        return len(self.calls)
@@ -0,0 +1,297 @@
+"""Memory-budgeted model residency for the model servers.
+
+Models live on a device (resident) or in host RAM (standby). When a model does
+not fit a device's free memory and budget, the least recently used resident
+models move to standby, and standby models are dropped past the host budget.
+"""
+
+from collections import OrderedDict
+from typing import Callable, Optional, Union
+import threading
+import time
+
+GB = 1024**3
+CPU_DEVICE = -1
+
+
+class InsufficientMemoryError(Exception):
+    pass
+
+
+class DeviceInventory:
+    """
+    Reports total and free memory (in bytes) for each accelerator device.
+    """
+
+    def devices(self) -> list[int]:
+        raise NotImplementedError
+
+    def total_memory(self, device: int) -> int:
+        raise NotImplementedError
+
+    def free_memory(self, device: int) -> int:
+        raise NotImplementedError
+
+
+class TorchDeviceInventory(DeviceInventory):
+    """
+    Inventory backed by `torch.cuda.mem_get_info`.
+    """
+
+    def __init__(self):
+        import torch
+
+        self.torch = torch
+
+    def devices(self) -> list[int]:
+        return list(range(self.torch.cuda.device_count()))
+
+    def total_memory(self, device: int) -> int:
+        return self.torch.cuda.mem_get_info(device)[1]
+
+    def free_memory(self, device: int) -> int:
+        return self.torch.cuda.mem_get_info(device)[0]
+
+
+class SimulatedDeviceInventory(DeviceInventory):
+    """
+    Inventory with a fixed set of devices whose usage is tracked by hand.
+    Used for testing placement decisions without GPUs.
+    """
+
+    def __init__(self, total_memory: dict[int, int]):
+        self._total = dict(total_memory)
+        self._used = {d: 0 for d in total_memory}
+
+    def devices(self) -> list[int]:
+        return sorted(self._total)
+
+    def total_memory(self, device: int) -> int:
+        return self._total[device]
+
+    def free_memory(self, device: int) -> int:
+        return self._total[device] - self._used[device]
+
+    def allocate(self, device: int, nbytes: int):
+        self._used[device] += nbytes
+
+    def release(self, device: int, nbytes: int):
+        self._used[device] = max(0, self._used[device] - nbytes)
+
+
+class ResidencyManager:
+    """
+    Track where each model lives and decide placement and eviction.
+
+    The manager does not move any weights itself. It calls `on_offload(model_name)`
+    to move a resident model to host standby and `on_drop(model_name)` to free a
+    model entirely; the server performs the actual work in those callbacks.
+    `on_offload` returns False if it freed the model instead of keeping it.
+    """
+
+    def __init__(
+        self,
+        inventory: DeviceInventory,
+        on_offload: Callable[[str], Optional[bool]],
+        on_drop: Callable[[str], None],
+        device_budget: Optional[Union[int, dict[int, int]]] = None,
+        host_budget: int = 0,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Parameters:
+            inventory (DeviceInventory): source of per-device free memory
+            on_offload (callable): moves a model's weights to host RAM, or
+                frees them and returns False
+            on_drop (callable): deletes a model
+            device_budget (int | dict): bytes each device may hold; one value for all
+                devices, or a per-device dict. Defaults to the device's total memory.
+            host_budget (int): bytes of host RAM available for standby models
+            clock (callable): time source, overridable for tests
+        """
+        self.inventory = inventory
+        self.on_offload = on_offload
+        self.on_drop = on_drop
+        self.device_budget = device_budget
+        self.host_budget = host_budget
+        self.clock = clock
+
+        self.resident = (
+            OrderedDict()
+        )  # model_name -> {"device", "nbytes", "last_used"}, LRU first
+        self.standby = OrderedDict()  # model_name -> nbytes, LRU first
+        self.pinned = {}  # model_name -> number of active users
+        self.lock = threading.RLock()
+
+    # ---------------------------
+    # Budget helpers
+    # ---------------------------
+
+    def budget(self, device: int) -> int:
+        if self.device_budget is None:
+            return self.inventory.total_memory(device)
+        if isinstance(self.device_budget, dict):
+            return self.device_budget.get(device, self.inventory.total_memory(device))
+        return self.device_budget
+
+    def used(self, device: int) -> int:
+        return sum(
+            info["nbytes"]
+            for info in self.resident.values()
+            if info["device"] == device
+        )
+
+    def headroom(self, device: int) -> int:
+        """Bytes a new model may use on `device` under both the budget and actual free memory."""
+        return min(
+            self.budget(device) - self.used(device), self.inventory.free_memory(device)
+        )
+
+    def host_used(self) -> int:
+        return sum(self.standby.values())
+
+    # ---------------------------
+    # Placement
+    # ---------------------------
+
+    def acquire(self, model_name: str, nbytes: Optional[int] = None) -> tuple[int, str]:
+        """
+        Make `model_name` resident and pin it until `release` is called.
+
+        Returns:
+            (device, state): the device to use and where the model currently is,
+            one of "resident", "standby" or "new". The caller must restore or
+            load the weights onto `device` for the latter two.
+        """
+        with self.lock:
+            if model_name in self.resident:
+                self.touch(model_name)
+                self._pin(model_name)
+                return self.resident[model_name]["device"], "resident"
+
+            if model_name in self.standby:
+                state = "standby"
+                nbytes = self.standby[model_name]
+            else:
+                state = "new"
+                assert nbytes is not None, "Size is required for models not in standby."
+
+            self._pin(model_name)
+            try:
+                device = self._make_room(nbytes)
+            except Exception:
+                # Also when a callback fails, so the model stays evictable
+                self.release(model_name)
+                raise
+            self.standby.pop(model_name, None)
+            self.resident[model_name] = {
+                "device": device,
+                "nbytes": nbytes,
+                "last_used": self.clock(),
+            }
+            return device, state
+
+    def release(self, model_name: str):
+        """Unpin a model so it may be evicted again."""
+        with self.lock:
+            if model_name in self.pinned:
+                self.pinned[model_name] -= 1
+                if self.pinned[model_name] <= 0:
+                    del self.pinned[model_name]
+
+    def touch(self, model_name: str):
+        with self.lock:
+            if model_name in self.resident:
+                self.resident[model_name]["last_used"] = self.clock()
+                self.resident.move_to_end(model_name)
+
+    def update_size(self, model_name: str, nbytes: int):
+        """Replace the estimated size of a resident model with its measured footprint."""
+        with self.lock:
+            if model_name in self.resident:
+                self.resident[model_name]["nbytes"] = nbytes
+
+    def forget(self, model_name: str):
+        """Remove a model from all bookkeeping, e.g. after a failed load."""
+        with self.lock:
+            self.resident.pop(model_name, None)
+            self.standby.pop(model_name, None)
+            self.pinned.pop(model_name, None)
+
+    def _pin(self, model_name: str):
+        self.pinned[model_name] = self.pinned.get(model_name, 0) + 1
+
+    def _best_device(self, nbytes: int) -> Optional[int]:
+        fitting = [d for d in self.inventory.devices() if self.headroom(d) >= nbytes]
+        if not fitting:
+            return None
+        return max(fitting, key=self.headroom)
+
+    def _make_room(self, nbytes: int) -> int:
+        devices = self.inventory.devices()
+        if not devices:
+            return CPU_DEVICE
+
+        device = self._best_device(nbytes)
+        while device is None:
+            victims = [m for m in self.resident if m not in self.pinned]
+            if not victims:
+                raise InsufficientMemoryError(
+                    f"No device can fit {nbytes / GB:.1f} GB and every resident model is in use."
+                )
+            self._evict(victims[0])
+            device = self._best_device(nbytes)
+        return device
+
+    def _evict(self, model_name: str):
+        """Move a resident model to host standby, or drop it if the host is full."""
+        info = self.resident.pop(model_name)
+        nbytes = info["nbytes"]
+        if nbytes > self.host_budget:
+            print(f"[Residency] Dropping {model_name} (larger than host budget).")
+            self.on_drop(model_name)
+            return
+        while self.standby and self.host_used() + nbytes > self.host_budget:
+            oldest, _ = self.standby.popitem(last=False)
+            print(f"[Residency] Dropping standby model {oldest} (host budget).")
+            self.on_drop(oldest)
+        print(f"[Residency] Moving {model_name} to host standby.")
+        if self.on_offload(model_name) is False:
+            print(f"[Residency] Dropped {model_name} instead.")
+            return
+        self.standby[model_name] = nbytes
+
+    def offload_idle(self, max_idle_seconds: float) -> list[str]:
+        """Move resident models unused for `max_idle_seconds` to host standby."""
+        with self.lock:
+            now = self.clock()
+            idle = [
+                m
+                for m, info in self.resident.items()
+                if m not in self.pinned and now - info["last_used"] > max_idle_seconds
+            ]
+            for model_name in idle:
+                self._evict(model_name)
+            return idle
+
+    def summary(self) -> dict:
+        with self.lock:
+            return {
+                "resident": {m: info["device"] for m, info in self.resident.items()},
+                "standby": list(self.standby),
+                "headroom_gb": {
+                    d: round(self.headroom(d) / GB, 2) for d in self.inventory.devices()
+                },
+            }
+
+
+def parse_budget_gb(value: Optional[str]) -> Optional[Union[int, dict[int, int]]]:
+    """
+    Parse a budget such as "20" (all devices) or "20,40" (per device) in GB.
+    """
+    if not value:
+        return None
+    parts = [float(x) for x in value.split(",")]
+    if len(parts) == 1:
+        return int(parts[0] * GB)
+    return {d: int(p * GB) for d, p in enumerate(parts)}
@@ -0,0 +1,100 @@
+"""Admission control and scheduling for the per-model request queues.
+
+Each model gets a bounded `FairPriorityQueue`, served by priority class and
+round-robin across client IDs within a class. A full queue rejects jobs with
+`QueueFullError`, which the server answers with 429.
+"""
+
+from collections import OrderedDict, deque
+from typing import Any, Optional
+import threading
+
+# Highest priority first
+PRIORITIES = ("interactive", "batch", "offline")
+DEFAULT_PRIORITY = "batch"
+DEFAULT_CLIENT_ID = "anonymous"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class FairPriorityQueue:
+    """
+    A bounded, thread-safe queue ordered by priority class, then round-robin
+    over client IDs, then FIFO within a client.
+    """
+
+    def __init__(self, maxsize: int = 0, interactive_reserve: int = 0):
+        """
+        Parameters:
+            maxsize (int): jobs admitted before rejecting; 0 means unbounded
+            interactive_reserve (int): extra slots only interactive jobs may use,
+                so human sessions are still admitted while a sweep fills the queue
+        """
+        self.maxsize = maxsize
+        self.interactive_reserve = interactive_reserve
+        # priority -> client_id -> deque of items; clients in round-robin order
+        self.classes = {p: OrderedDict() for p in PRIORITIES}
+        self.size = 0
+        self.not_empty = threading.Condition()
+
+    def capacity(self, priority: str) -> int:
+        if self.maxsize <= 0:
+            return 0
+        if priority == PRIORITIES[0]:
+            return self.maxsize + self.interactive_reserve
+        return self.maxsize
+
+    def put(
+        self,
+        item: Any,
+        priority: str = DEFAULT_PRIORITY,
+        client_id: Optional[str] = None,
+    ):
+        """Enqueue `item`, raising QueueFullError if the queue is at capacity."""
+        if priority not in self.classes:
+            raise ValueError(
+                f"Unknown priority {priority}, expected one of {PRIORITIES}"
+            )
+        client_id = client_id or DEFAULT_CLIENT_ID
+        with self.not_empty:
+            capacity = self.capacity(priority)
+            if capacity and self.size >= capacity:
+                raise QueueFullError(
+                    f"Queue is full ({self.size} jobs waiting, priority={priority})."
+                )
+            self.classes[priority].setdefault(client_id, deque()).append(item)
+            self.size += 1
+            self.not_empty.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        Remove and return the next item, blocking until one is available.
+        Raises TimeoutError if `timeout` elapses first.
+        """
+        with self.not_empty:
+            if not self.not_empty.wait_for(lambda: self.size > 0, timeout=timeout):
+                raise TimeoutError
+            for priority in PRIORITIES:
+                clients = self.classes[priority]
+                if not clients:
+                    continue
+                client_id, items = next(iter(clients.items()))
+                item = items.popleft()
+                # Rotate this client to the back of its class
+                del clients[client_id]
+                if items:
+                    clients[client_id] = items
+                self.size -= 1
+                return item
+
+    def qsize(self) -> int:
+        return self.size
+
+    def depth_by_priority(self) -> dict[str, int]:
+        with self.not_empty:
+            return {
+                p: sum(len(items) for items in clients.values())
+                for p, clients in self.classes.items()
+            }
@@ -0,0 +1,60 @@
+"""Optional msgpack request bodies for the model servers.
+
+Clients opt in with `LM_TRANSPORT=msgpack` and send `Content-Type:
+application/msgpack`; JSON keeps working and both go through the same pydantic
+validation. Responses stay JSON.
+"""
+
+from fastapi import HTTPException, Request
+from fastapi.routing import APIRoute
+import msgpack
+
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+MSGPACK_CONTENT_TYPES = {
+    MSGPACK_CONTENT_TYPE,
+    "application/x-msgpack",
+    "application/vnd.msgpack",
+}
+
+
+def packb(obj) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpackb(data: bytes):
+    return msgpack.unpackb(data, raw=False)
+
+
+class MsgpackRequest(Request):
+    """A request whose msgpack body is read through `json()`."""
+
+    async def json(self):
+        if not hasattr(self, "_json"):
+            try:
+                self._json = unpackb(await self.body())
+            except (ValueError, msgpack.UnpackException) as e:
+                raise HTTPException(status_code=400, detail=f"Invalid msgpack: {e}")
+        return self._json
+
+
+class MsgpackRoute(APIRoute):
+    """
+    Route that also accepts msgpack bodies. FastAPI only parses bodies sent as
+    JSON, so msgpack requests are relabelled as JSON and decoded by
+    `MsgpackRequest.json`. Set as `app.router.route_class` before adding routes.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request):
+            content_type = request.headers.get("content-type", "")
+            if content_type.split(";")[0].strip() in MSGPACK_CONTENT_TYPES:
+                scope = dict(request.scope)
+                scope["headers"] = [
+                    (k, v) for k, v in request.scope["headers"] if k != b"content-type"
+                ] + [(b"content-type", b"application/json")]
+                request = MsgpackRequest(scope, request.receive)
+            return await handler(request)
+
+        return route_handler
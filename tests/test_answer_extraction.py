@@ -0,0 +1,57 @@
+import unittest
+from datamodels.answer_extraction import extract_answer, is_hedged
+
+
+class TestAnswerExtraction(unittest.TestCase):
+    def test_numbers(self):
+        self.assertEqual(extract_answer("I am 36 years old.", "int"), "36")
+        self.assertEqual(extract_answer("$143,934", "float"), "143934")
+        self.assertEqual(extract_answer("$1,200.50", "float"), "1200.50")
+        self.assertEqual(extract_answer("We have two kids", "int"), "2")
+
+    def test_ambiguous_numbers(self):
+        for answer in [
+            "I'm 36 and my wife is 34",
+            "Since 2019",
+            "Around 1.5 million",
+            "$2,000 to $3,000",
+            "No one works",
+            "I'd rather not say",
+            "About $1,200.50 a month",
+            "I make $3,000 a month",
+            "$25 an hour",
+            "$800 weekly",
+            "My son is 6 months old",
+            "-5",
+            "I am not sure, maybe 30",
+        ]:
+            self.assertIsNone(extract_answer(answer, "float"), answer)
+        self.assertIsNone(extract_answer("3.5", "int"))
+
+    def test_yes_no(self):
+        self.assertEqual(extract_answer("No.", "choice", ["yes", "no"]), "no")
+        self.assertEqual(extract_answer("Yeah, I do.", "choice", ["Yes", "No"]), "Yes")
+        self.assertIsNone(extract_answer("I'm not sure", "choice", ["yes", "no"]))
+
+    def test_choices(self):
+        choices = ["single", "married", "divorced"]
+        self.assertEqual(extract_answer("I'm married.", "choice", choices), "married")
+        self.assertEqual(extract_answer("maried", "choice", choices), "married")
+        self.assertIsNone(extract_answer("I'm not married", "choice", choices))
+        self.assertIsNone(extract_answer("single, soon divorced", "choice", choices))
+        self.assertEqual(
+            extract_answer("I have no income", "choice", ["income", "no income"]),
+            "no income",
+        )
+
+    def test_hedges(self):
+        self.assertTrue(is_hedged("Yes, I think so."))
+        self.assertTrue(is_hedged("Probably married."))
+        self.assertFalse(is_hedged("Yes, I am."))
+
+    def test_unknown_type(self):
+        self.assertIsNone(extract_answer("36", "any"))
+
+
+if __name__ == "__main__":
+    unittest.main()
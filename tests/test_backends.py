@@ -0,0 +1,42 @@
+import unittest
+from server.backends import (
+    get_backend,
+    parse_backend_config,
+    llama_cpp_available,
+    CpuInt8Backend,
+    CudaBnb4bitBackend,
+    LlamaCppBackend,
+)
+
+
+class TestBackendSelection(unittest.TestCase):
+    def test_auto(self):
+        self.assertIsInstance(get_backend("m", {}, has_gpu=True), CudaBnb4bitBackend)
+        self.assertIsInstance(get_backend("m", {}, has_gpu=False), CpuInt8Backend)
+
+    def test_configured_backend_and_options(self):
+        config = parse_backend_config(
+            '{"small": {"backend": "cpu-int8", "threads": 4, "quantize": false}}'
+        )
+        backend = get_backend("small", config, has_gpu=True)
+        self.assertIsInstance(backend, CpuInt8Backend)
+        self.assertFalse(backend.uses_device)
+        self.assertEqual(backend.threads(), 4)
+        self.assertEqual(backend.options, {"threads": 4, "quantize": False})
+
+    def test_cuda_falls_back_without_gpu(self):
+        config = {"m": {"backend": "cuda-4bit"}}
+        self.assertIsInstance(get_backend("m", config, has_gpu=False), CpuInt8Backend)
+
+    def test_llama_cpp_requires_package(self):
+        config = {"m": {"backend": "llama-cpp", "repo_id": "r", "filename": "f"}}
+        expected = LlamaCppBackend if llama_cpp_available() else CpuInt8Backend
+        self.assertIsInstance(get_backend("m", config, has_gpu=False), expected)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_backend("m", {"m": {"backend": "tpu"}}, has_gpu=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from datamodels.checker_analysis import analyze_checker, static_key_spec
+
+CHECKER = """
+def check_eligibility(hh):
+    def _helper(individual):
+        if individual["has_id"] == "yes":
+            return True
+        return False
+    income = hh["income"]
+    if float(income) > 5 and hh["status"].lower() in ["single", "married"]:
+        return True
+    for i in range(int(hh["members"])):
+        if hh[i]["student"] == "no" and "yes" == hh[i]["works"]:
+            return _helper(hh[i])
+    head = hh[0]
+    if head["age"] == "18" or hh["disabled"]:
+        return True
+    return float(hh["rent"]) > 1 and hh["rent"] == "none"
+"""
+
+
+class TestCheckerAnalysis(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.uses = analyze_checker(CHECKER)
+        cls.specs = {key: static_key_spec(use) for key, use in cls.uses.items()}
+
+    def test_casts(self):
+        self.assertEqual(self.specs["income"], ("float", None))
+        self.assertEqual(self.specs["members"], ("int", None))
+
+    def test_literal_choices(self):
+        self.assertEqual(self.specs["student"], ("choice", ["yes", "no"]))
+        self.assertEqual(self.specs["has_id"], ("choice", ["yes", "no"]))
+        self.assertEqual(self.specs["status"], ("choice", None))
+        self.assertEqual(self.uses["status"].literals, ["single", "married"])
+
+    def test_ambiguous_uses(self):
+        # truthiness, numbers stored as text, and mixed casts and literals
+        for key in ("disabled", "age", "rent"):
+            self.assertEqual(self.specs[key], (None, None))
+
+    def test_per_member_keys(self):
+        self.assertTrue(self.uses["student"].per_member)
+        self.assertTrue(self.uses["age"].per_member)
+        self.assertFalse(self.uses["income"].per_member)
+
+    def test_invalid_code(self):
+        self.assertEqual(analyze_checker("def broken(:"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import importlib.util
+import os
+import tempfile
+import threading
+import unittest
+from datamodels.checker_execution import (
+    RerunExecution,
+    ResumableExecution,
+    execute_checker,
+)
+from datamodels.imaginary_data import ImaginaryData
+
+CHECKERS = """
+RUNS = []
+
+
+def check_senior(hh):
+    RUNS.append(1)
+    if int(hh["age"]) < 65:
+        return False
+    for i in range(int(hh["number of household members"])):
+        if hh[i]["is_owner"] == "yes":
+            return True
+    return False
+
+
+def check_with_try(hh):
+    RUNS.append(1)
+    try:
+        return hh["income"] == "0"
+    except Exception:
+        return False
+
+
+def check_broken(hh):
+    return 1 / int(hh["age"])
+"""
+
+
+ANSWERS = {"age": "70", "number of household members": "2", "is_owner": "no"}
+
+
+def drive(execution, hh, answers):
+    """Answer every pending key; return the result and the pending keys."""
+    seen = []
+    pending = execution.resume()
+    while pending is not None:
+        seen.append(pending)
+        target = hh if pending.member_idx is None else hh[pending.member_idx]
+        target[pending.key] = answers[pending.key]
+        pending = execution.resume()
+    return execution.result, seen
+
+
+class TestCheckerExecution(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        handle = tempfile.NamedTemporaryFile("w", suffix=".py", delete=False)
+        handle.write(CHECKERS)
+        handle.close()
+        cls.path = handle.name
+        spec = importlib.util.spec_from_file_location("checkers", cls.path)
+        cls.module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(cls.module)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.path)
+
+    def setUp(self):
+        self.module.RUNS.clear()
+
+    def test_same_result_as_rerunning(self):
+        results = []
+        for cls in (RerunExecution, ResumableExecution):
+            hh = ImaginaryData()
+            execution = cls(self.module.check_senior, hh, self.path)
+            result, seen = drive(execution, hh, ANSWERS)
+            results.append((result, [(p.key, p.member_idx, p.line) for p in seen]))
+        self.assertEqual(results[0], results[1])
+        self.assertFalse(results[0][0])
+        self.assertEqual(results[0][1][0], ("age", None, 'if int(hh["age"]) < 65:'))
+        self.assertEqual(results[0][1][-1][:2], ("is_owner", 1))
+
+    def test_checker_runs_once(self):
+        hh = ImaginaryData()
+        execution = ResumableExecution(self.module.check_senior, hh, self.path)
+        _, seen = drive(execution, hh, ANSWERS)
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(self.module.RUNS), 1)
+
+    def test_try_blocks_are_rerun(self):
+        hh = ImaginaryData()
+        execution = execute_checker(self.module.check_with_try, hh, self.path)
+        self.assertIsInstance(execution, RerunExecution)
+        # The checker handles the missing key itself
+        self.assertIsNone(execution.resume())
+        self.assertFalse(execution.result)
+        self.assertIsInstance(
+            execute_checker(self.module.check_senior, hh, self.path),
+            ResumableExecution,
+        )
+
+    def test_checker_errors_are_raised(self):
+        hh = ImaginaryData()
+        execution = ResumableExecution(self.module.check_broken, hh, self.path)
+        self.assertEqual(execution.resume().key, "age")
+        hh["age"] = "0"
+        with self.assertRaises(ZeroDivisionError):
+            execution.resume()
+
+    def test_close_unwinds_suspended_checker(self):
+        before = threading.active_count()
+        execution = ResumableExecution(
+            self.module.check_senior, ImaginaryData(), self.path
+        )
+        self.assertEqual(execution.resume().key, "age")
+        self.assertEqual(threading.active_count(), before + 1)
+        execution.close()
+        self.assertEqual(threading.active_count(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import re
+import unittest
+from lark import Lark
+from lark.exceptions import LarkError
+from datamodels.checker_grammar import checker_grammar, identifier_excluding
+
+EXAMPLE = '''def check_eligibility(hh: dict) -> bool:
+    """Example from the checker prompt."""
+    def _helper(individual):
+        if individual["has_id"]=="yes": # "Does the individual have an ID?"
+            return True
+        else:
+            return False
+
+    if hh["has_dependents"]=="yes": # "How many dependents does the household have?"
+        num_dependents = hh["num_dependents"]
+        for i in range(len(num_dependents)):
+            if float(hh[i]["dependent_age"]) < 18 and _helper(hh[i]): # "Is the first dependent under 18?"
+                return True
+    return False
+'''
+
+
+def body(*lines):
+    return "def check_eligibility(hh):\n" + "".join(f"    {x}\n" for x in lines)
+
+
+class TestCheckerGrammar(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # outlines parses grammars with the same LALR(1) parser
+        cls.lenient = Lark(checker_grammar(), parser="lalr")
+        cls.strict = Lark(checker_grammar(strict=True), parser="lalr")
+
+    def accepts(self, parser, code):
+        try:
+            parser.parse(code)
+            return True
+        except LarkError:
+            return False
+
+    def test_accepts_prompt_example(self):
+        self.assertTrue(self.accepts(self.strict, EXAMPLE))
+
+    def test_accepts_common_constructs(self):
+        code = body(
+            "passed = [m for m in hh.members if float(m['age']) >= 65]",
+            "total //= 2",
+            "key = sorted(passed, key=lambda m: m['age'])",
+            "while True:",
+            "    break",
+            "return not (total is None or 'x' not in key) if passed else False",
+        )
+        self.assertTrue(self.accepts(self.strict, code))
+
+    def test_rejects_malformed_output(self):
+        for code in [
+            "Here is the code:\n" + body("return True"),
+            body("return True").replace("check_eligibility", "check"),
+            body("x = 1", " return x"),
+            body("if x:", "return x"),
+            body("return 1 iffy else 2"),
+        ]:
+            self.assertFalse(self.accepts(self.lenient, code), code)
+
+    def test_strict_rules(self):
+        for code in [
+            body("return hh.get('age') == '1'"),
+            body("return hh[f'age_{1}'] == '1'"),
+            body("try:", "    return True", "except KeyError:", "    return False"),
+        ]:
+            self.assertFalse(self.accepts(self.strict, code), code)
+            self.assertTrue(self.accepts(self.lenient, code), code)
+
+    def test_max_depth(self):
+        parser = Lark(checker_grammar(max_depth=2), parser="lalr")
+        self.assertTrue(self.accepts(parser, body("if a:", "    return 1")))
+        nested = body("if a:", "    if b:", "        return 1")
+        self.assertFalse(self.accepts(parser, nested))
+
+    def test_identifier_excluding(self):
+        pattern = re.compile(identifier_excluding({"get", "if"}))
+        for name in ["g", "ge", "gets", "getx", "i", "iff", "x_1"]:
+            self.assertTrue(pattern.fullmatch(name), name)
+        for name in ["get", "if", "1x"]:
+            self.assertFalse(pattern.fullmatch(name), name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import math
+import unittest
+from types import SimpleNamespace
+import torch
+from server.choice_scoring import sample_choices, score_choices
+
+VOCAB = ["<pad>", "x", "a", "b", "c"]
+# Next-token probabilities after each token; unlisted tokens share the rest
+NEXT = {"x": {"a": 0.5, "c": 0.3}, "a": {"b": 0.5}}
+
+
+class CharTokenizer:
+    """One token per character of VOCAB."""
+
+    pad_token_id = 0
+    eos_token_id = 0
+
+    def __call__(self, text, return_tensors=None, add_special_tokens=True):
+        ids = [VOCAB.index(ch) for ch in text]
+        if return_tensors == "pt":
+            ids = torch.tensor([ids])
+        return SimpleNamespace(input_ids=ids)
+
+
+class BigramModel:
+    """A causal LM whose next-token distribution depends on the last token."""
+
+    device = torch.device("cpu")
+
+    def __init__(self):
+        table = torch.zeros(len(VOCAB), len(VOCAB))
+        for i, token in enumerate(VOCAB):
+            listed = NEXT.get(token, {})
+            rest = (1 - sum(listed.values())) / (len(VOCAB) - len(listed))
+            for j, next_token in enumerate(VOCAB):
+                table[i, j] = listed.get(next_token, rest)
+        self.logits = table.log()
+
+    def __call__(self, input_ids, attention_mask=None, past_key_values=None, **kw):
+        batch, length = input_ids.shape
+        cache = ((torch.zeros(batch, 1, length, 1), torch.zeros(batch, 1, length, 1)),)
+        return SimpleNamespace(logits=self.logits[input_ids], past_key_values=cache)
+
+
+class TestChoiceScoring(unittest.TestCase):
+    def test_scores_are_per_token(self):
+        scored = score_choices(BigramModel(), CharTokenizer(), "x", ["ab", "c"])
+        # mean log-probs: ab = (log .5 + log .5) / 2, c = log .3
+        expected = 1 / (1 + math.exp(math.log(0.3) - math.log(0.5)))
+        self.assertEqual(scored["choice"], "ab")
+        self.assertAlmostEqual(scored["probs"]["ab"], expected, places=5)
+        self.assertAlmostEqual(sum(scored["probs"].values()), 1, places=5)
+
+    def test_sampling(self):
+        probs = {"yes": 0.8, "no": 0.2}
+        samples = sample_choices(probs, 1000, temperature=0.7, seed=0)
+        self.assertEqual(samples, sample_choices(probs, 1000, 0.7, seed=0))
+        # 0.8 ** (1 / 0.7) / (0.8 ** (1 / 0.7) + 0.2 ** (1 / 0.7)) is about 0.88
+        self.assertGreater(samples.count("yes"), 820)
+        self.assertLess(samples.count("yes"), 940)
+        self.assertIn("no", samples)
+
+
+if __name__ == "__main__":
+    unittest.main()
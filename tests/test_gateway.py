@@ -0,0 +1,201 @@
+import json
+import threading
+import time
+import unittest
+import httpx
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from server import gateway as gateway_module
+from server.gateway import Gateway, UpstreamError
+
+
+class FakeUpstreams:
+    """In-process stand-ins for model servers."""
+
+    def __init__(self, models=None, latency=None, down=(), full=()):
+        self.models = models or {}
+        self.latency = latency or {}
+        self.down = set(down)
+        self.full = set(full)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def send(self, url, payload, timeout):
+        with self.lock:
+            self.calls.append(url)
+        if url in self.down:
+            raise UpstreamError(f"{url} is down")
+        time.sleep(self.latency.get(url, 0))
+        if url in self.full:
+            return 429, {"detail": "full"}, {"Retry-After": "3"}
+        return 200, {"generated_text": url}, {}
+
+    def stream(self, url, payload, timeout):
+        with self.lock:
+            self.calls.append(url)
+        if url in self.down:
+            raise UpstreamError(f"{url} is down")
+        if url in self.full:
+            return 429, {"detail": "full"}, {"Retry-After": "3"}
+        return 200, (event for event in sse_events(url)), {}
+
+    def get_json(self, url, path, timeout):
+        if url in self.down:
+            raise UpstreamError(f"{url} is down")
+        if path == "/models":
+            return {"models": {m: "ready" for m in self.models.get(url, [])}}
+        return {"status": "ok"}
+
+
+def sse_events(text):
+    return [
+        f"data: {json.dumps({'token': text})}\n\n".encode(),
+        f"event: done\ndata: {json.dumps({'generated_text': text})}\n\n".encode(),
+    ]
+
+
+def payload(model="m"):
+    return {"name_of_model": model, "history": []}
+
+
+class TestGateway(unittest.TestCase):
+    def make(self, fake, **kwargs):
+        return Gateway(
+            ["a", "b", "c"],
+            send=fake.send,
+            get_json=fake.get_json,
+            stream=fake.stream,
+            **kwargs,
+        )
+
+    def test_routes_by_model_affinity(self):
+        fake = FakeUpstreams(models={"b": ["m"]})
+        gateway = self.make(fake)
+        gateway.check_health()
+        self.assertEqual(gateway.forward(payload("m"))[1]["generated_text"], "b")
+
+    def test_least_outstanding_and_spill(self):
+        fake = FakeUpstreams(models={"a": ["m"]})
+        gateway = self.make(fake, spill_outstanding=2)
+        gateway.check_health()
+        gateway.upstreams[0].outstanding = 1
+        self.assertEqual(gateway.pick("m").url, "a")
+        gateway.upstreams[0].outstanding = 2
+        self.assertEqual(gateway.pick("m").url, "b")
+
+    def test_new_model_sticks_to_first_upstream(self):
+        fake = FakeUpstreams()
+        gateway = self.make(fake)
+        first = gateway.forward(payload("new"))[1]["generated_text"]
+        self.assertEqual(gateway.pick("new").url, first)
+
+    def test_failover_and_health(self):
+        fake = FakeUpstreams(models={"a": ["m"]}, down={"a"})
+        gateway = self.make(fake)
+        status, body, _ = gateway.forward(payload("m"))
+        self.assertEqual(status, 200)
+        self.assertNotEqual(body["generated_text"], "a")
+        self.assertFalse(gateway.upstreams[0].healthy)
+        fake.down.clear()
+        gateway.check_health()
+        self.assertTrue(gateway.upstreams[0].healthy)
+
+    def test_queue_full_tries_others_then_returns_429(self):
+        fake = FakeUpstreams(full={"a", "b", "c"})
+        status, _, headers = self.make(fake).forward(payload())
+        self.assertEqual(status, 429)
+        self.assertEqual(headers["Retry-After"], "3")
+        self.assertEqual(sorted(fake.calls), ["a", "b", "c"])
+
+    def test_hedges_slow_requests(self):
+        fake = FakeUpstreams(models={"a": ["m"]}, latency={"a": 1.0})
+        gateway = self.make(fake, hedge_after=0.05)
+        gateway.check_health()
+        start = time.time()
+        status, body, _ = gateway.forward(payload("m"))
+        self.assertEqual(status, 200)
+        self.assertNotEqual(body["generated_text"], "a")
+        self.assertLess(time.time() - start, 0.9)
+        self.assertEqual(gateway.hedges.get(), 1)
+
+    def test_no_healthy_upstream(self):
+        fake = FakeUpstreams(down={"a", "b", "c"})
+        gateway = self.make(fake)
+        gateway.check_health()
+        self.assertEqual(gateway.forward(payload())[0], 503)
+
+    def test_stream_routes_by_affinity(self):
+        fake = FakeUpstreams(models={"b": ["m"]})
+        gateway = self.make(fake)
+        gateway.check_health()
+        status, body, _ = gateway.forward_stream(payload("m"))
+        self.assertEqual(status, 200)
+        self.assertEqual(gateway.upstreams[1].outstanding, 1)
+        self.assertEqual(list(body), sse_events("b"))
+        self.assertEqual(gateway.upstreams[1].outstanding, 0)
+
+    def test_stream_fails_over(self):
+        fake = FakeUpstreams(models={"a": ["m"], "b": ["m"]}, down={"a"}, full={"b"})
+        gateway = self.make(fake)
+        status, body, _ = gateway.forward_stream(payload("m"))
+        self.assertEqual(status, 200)
+        self.assertEqual(list(body), sse_events("c"))
+        self.assertFalse(gateway.upstreams[0].healthy)
+        self.assertEqual([u.outstanding for u in gateway.upstreams], [0, 0, 0])
+
+    def test_stream_queue_full_everywhere(self):
+        fake = FakeUpstreams(full={"a", "b", "c"})
+        status, _, headers = self.make(fake).forward_stream(payload())
+        self.assertEqual(status, 429)
+        self.assertEqual(headers["Retry-After"], "3")
+
+    def test_closing_stream_releases_upstream(self):
+        gateway = self.make(FakeUpstreams())
+        _, body, _ = gateway.forward_stream(payload())
+        next(body)
+        body.close()
+        self.assertEqual([u.outstanding for u in gateway.upstreams], [0, 0, 0])
+
+    def test_non_json_response_is_upstream_error(self):
+        html = httpx.Response(
+            502,
+            text="<html>Bad Gateway</html>",
+            request=httpx.Request("POST", "http://a/forward"),
+        )
+        with patch.object(gateway_module.httpx, "post", return_value=html):
+            with self.assertRaises(UpstreamError):
+                gateway_module.http_send("http://a", payload(), 1.0)
+            gateway = Gateway(["http://a", "http://b"])
+            self.assertEqual(gateway.forward(payload())[0], 502)
+        self.assertFalse(any(u.healthy for u in gateway.upstreams))
+
+
+class TestGatewayApp(unittest.TestCase):
+    def serve(self, fake):
+        gateway = Gateway(
+            ["a", "b", "c"], send=fake.send, get_json=fake.get_json, stream=fake.stream
+        )
+        patcher = patch.object(gateway_module, "GATEWAY", gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return TestClient(gateway_module.app)
+
+    def test_forward_stream_passes_events_through(self):
+        client = self.serve(FakeUpstreams(full={"a"}))
+        response = client.post("/forward_stream", json=payload())
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(
+            response.headers["content-type"].startswith("text/event-stream")
+        )
+        self.assertEqual(response.content, b"".join(sse_events("b")))
+
+    def test_forward_stream_queue_full(self):
+        client = self.serve(FakeUpstreams(full={"a", "b", "c"}))
+        response = client.post("/forward_stream", json=payload())
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "3")
+        self.assertEqual(response.json(), {"detail": "full"})
+
+
+if __name__ == "__main__":
+    unittest.main()
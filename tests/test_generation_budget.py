@@ -0,0 +1,85 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from server import concurrent_multiple_model_server as server
+from server import model_client
+from server.model_client import ROLE_GENERATION_DEFAULTS, generation_budget
+
+HISTORY = [{"role": "user", "content": "Hello"}]
+MODEL = "meta-llama/Llama-3.1-8B-Instruct"
+
+
+class TestGenerationBudget(unittest.TestCase):
+    def test_role_defaults(self):
+        self.assertEqual(
+            generation_budget("predict_cq", None, None),
+            ROLE_GENERATION_DEFAULTS["predict_cq"],
+        )
+        self.assertEqual(generation_budget("unknown_role", None, None), (None, None))
+
+    def test_explicit_values_override_defaults(self):
+        self.assertEqual(generation_budget("predict_cq", 16, None), (16, ["\n\n"]))
+        self.assertEqual(generation_budget("predict_cq", None, ["."]), (128, ["."]))
+        self.assertEqual(generation_budget("predict_cq", None, []), (128, None))
+
+    def test_request_carries_budget(self):
+        sent = []
+
+        def post(path, fr, **kwargs):
+            sent.append(fr)
+            return SimpleNamespace(
+                status_code=200, headers={}, json=lambda: {"generated_text": "ok"}
+            )
+
+        client = model_client.ModelAPIClient("http://server", random_seed=0)
+        with patch.object(client, "_post", post):
+            client.forward(HISTORY, MODEL, True, "predict_cq")
+            client.forward(
+                HISTORY, MODEL, True, "predict_cq", max_new_tokens=8, stop=[]
+            )
+        self.assertEqual((sent[0].max_new_tokens, sent[0].stop), (128, ["\n\n"]))
+        self.assertEqual((sent[1].max_new_tokens, sent[1].stop), (8, None))
+
+
+class TestTruncations(unittest.TestCase):
+    def test_server_counts_truncations(self):
+        request = server.ForwardRequest(
+            name_of_model=MODEL,
+            history=HISTORY,
+            use_cache=True,
+            constraints=None,
+            constraint_type="none",
+            response_format=None,
+            random_seed=0,
+            max_new_tokens=4,
+        )
+        before = server.TRUNCATIONS.get(model=MODEL)
+        server.record_truncation(request, 3)
+        self.assertEqual(server.TRUNCATIONS.get(model=MODEL), before)
+        server.record_truncation(request, 4)
+        self.assertEqual(server.TRUNCATIONS.get(model=MODEL), before + 1)
+
+    def test_api_models_count_truncations(self):
+        completion = SimpleNamespace(
+            choices=[
+                SimpleNamespace(
+                    finish_reason="length", message=SimpleNamespace(content="cut")
+                )
+            ]
+        )
+        create = lambda **kwargs: completion
+        openai = lambda: SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+        )
+        before = model_client.TRUNCATIONS.get(model="gpt-4o-mini")
+        with patch.object(model_client, "OpenAI", openai):
+            with self.assertWarns(UserWarning):
+                texts = model_client._gpt_complete(
+                    "gpt-4o-mini", HISTORY, None, 8, None, 1
+                )
+        self.assertEqual(texts, ["cut"])
+        self.assertEqual(model_client.TRUNCATIONS.get(model="gpt-4o-mini"), before + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
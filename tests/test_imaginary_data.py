@@ -0,0 +1,41 @@
+import unittest
+from datamodels.checker_execution import ImaginaryDataKeyError
+from datamodels.imaginary_data import ImaginaryData
+
+
+class TestImaginaryData(unittest.TestCase):
+    def test_missing_key(self):
+        hh = ImaginaryData()
+        with self.assertRaises(ImaginaryDataKeyError) as ctx:
+            hh[1]["age"]
+        self.assertEqual(ctx.exception.args, ("age", 1))
+
+    def test_version_counts_changes(self):
+        hh = ImaginaryData()
+        hh["income"] = "0"
+        self.assertEqual(hh.version, 1)
+        hh["income"] = "0"
+        self.assertEqual(hh.version, 1)
+        hh["income"] = "10"
+        self.assertEqual(hh.version, 2)
+
+    def test_members_share_the_household_version(self):
+        hh = ImaginaryData()
+        member = hh["2"]
+        self.assertIs(member, hh[2])
+        self.assertEqual(hh.version, 1)
+        member["age"] = "70"
+        self.assertEqual(hh.version, 2)
+        self.assertEqual(member.version, 0)
+        self.assertEqual(hh[2]["age"], "70")
+
+    def test_equality(self):
+        a, b = ImaginaryData(), ImaginaryData()
+        a[0]["age"] = b[0]["age"] = "70"
+        self.assertEqual(a, b)
+        b["income"] = "0"
+        self.assertNotEqual(a, b)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import unittest
+from pydantic import BaseModel
+from server.json_schema import (
+    CLAUDE_TOOL_NAME,
+    canonical_schema,
+    claude_tool_def,
+    example_instance,
+    openai_response_format,
+)
+
+
+class Options(BaseModel):
+    options: list[str]
+
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"options": {"type": "array", "items": {"type": "string"}}},
+    "required": ["options"],
+}
+
+
+class TestCanonicalSchema(unittest.TestCase):
+    def test_dict_and_string_agree(self):
+        reordered = json.dumps(dict(reversed(list(SCHEMA.items()))))
+        self.assertEqual(canonical_schema(SCHEMA), canonical_schema(reordered))
+
+    def test_pydantic_model(self):
+        schema = json.loads(canonical_schema(Options))
+        self.assertEqual(schema["required"], ["options"])
+        self.assertEqual(schema["properties"]["options"]["type"], "array")
+
+    def test_rejects_non_object(self):
+        with self.assertRaises(ValueError):
+            canonical_schema("[1, 2]")
+
+
+class TestExampleInstance(unittest.TestCase):
+    def test_minimal_values(self):
+        schema = {
+            "type": "object",
+            "properties": {
+                "answered": {"type": "boolean"},
+                "values": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": ["yes", "no"]},
+                    "minItems": 2,
+                },
+                "count": {"type": "integer", "minimum": 1},
+                "note": {"type": "string"},
+            },
+            "required": ["answered", "values", "count"],
+        }
+        self.assertEqual(
+            example_instance(canonical_schema(schema)),
+            {"answered": False, "values": ["yes", "yes"], "count": 1},
+        )
+
+    def test_pydantic_model(self):
+        self.assertEqual(example_instance(canonical_schema(Options)), {"options": []})
+
+
+class TestApiMappings(unittest.TestCase):
+    def test_openai_response_format(self):
+        response_format = openai_response_format(canonical_schema(SCHEMA))
+        self.assertEqual(response_format["type"], "json_schema")
+        self.assertEqual(response_format["json_schema"]["schema"], SCHEMA)
+
+    def test_claude_tool_def(self):
+        (tool,) = claude_tool_def(canonical_schema(SCHEMA))
+        self.assertEqual(tool["name"], CLAUDE_TOOL_NAME)
+        self.assertEqual(tool["input_schema"], SCHEMA)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import tempfile
+import unittest
+from datamodels.key_registry import KeyRegistry, checker_hash, member_pattern
+
+
+class TestKeyRegistry(unittest.TestCase):
+    def test_persists_across_instances(self):
+        path = os.path.join(tempfile.mkdtemp(), "registry.json")
+        checker = checker_hash("chat", "code", "requirements", "def check(hh): ...")
+        registry = KeyRegistry(path)
+        registry.update(checker, "age", "member", question="How old is person i?")
+        registry.update(checker, "age", "member", key_type="int", choices=None)
+        reloaded = KeyRegistry(path)
+        self.assertEqual(
+            reloaded.get(checker, "age", "member"),
+            {"question": "How old is person i?", "key_type": "int", "choices": None},
+        )
+        self.assertEqual(reloaded.get(checker, "age", "household"), {})
+
+    def test_entries_are_copies(self):
+        registry = KeyRegistry()
+        registry.update("c", "status", "household", choices=["single"])
+        registry.get("c", "status", "household")["choices"].append("married")
+        self.assertEqual(
+            registry.get("c", "status", "household"), {"choices": ["single"]}
+        )
+
+    def test_hash_and_pattern(self):
+        self.assertNotEqual(checker_hash("a", "bc"), checker_hash("ab", "c"))
+        self.assertEqual(member_pattern(None), "household")
+        self.assertEqual(member_pattern(0), member_pattern(3))
+
+
+if __name__ == "__main__":
+    unittest.main()
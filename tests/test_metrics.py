@@ -0,0 +1,53 @@
+import unittest
+from server.metrics import MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        c = self.registry.counter("requests_total", "Requests.", ("model",))
+        c.inc(model="a")
+        c.inc(2, model="a")
+        c.inc(model="b")
+        self.assertEqual(c.get(model="a"), 3)
+        text = self.registry.render()
+        self.assertIn("# TYPE requests_total counter", text)
+        self.assertIn('requests_total{model="a"} 3.0', text)
+        self.assertIn('requests_total{model="b"} 1.0', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        h = self.registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+        for v in (0.05, 0.5, 0.7, 5.0):
+            h.observe(v)
+        text = self.registry.render()
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1.0', text)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 3.0', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4.0', text)
+        self.assertIn("latency_seconds_count 4.0", text)
+        self.assertAlmostEqual(h.get_sum(), 6.25)
+
+    def test_gauge_function(self):
+        g = self.registry.gauge("queue_depth", "Depth.", ("model",))
+        depths = {"a": 3}
+        g.set_function(lambda: {(m,): d for m, d in depths.items()})
+        self.assertIn('queue_depth{model="a"} 3.0', self.registry.render())
+        depths["a"] = 0
+        self.assertIn('queue_depth{model="a"} 0.0', self.registry.render())
+
+    def test_label_escaping_and_validation(self):
+        c = self.registry.counter("c_total", "C.", ("model",))
+        c.inc(model='we"ird')
+        self.assertIn('c_total{model="we\\"ird"} 1.0', self.registry.render())
+        with self.assertRaises(AssertionError):
+            c.inc(other="x")
+
+    def test_duplicate_names_rejected(self):
+        self.registry.gauge("g", "G.")
+        with self.assertRaises(AssertionError):
+            self.registry.gauge("g", "G.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import re
+import unittest
+from types import SimpleNamespace
+from server.prompt_cache import PromptTokenCache, history_digests
+
+SPECIAL = {"<s>": 1, "<e>": 2}
+
+
+class FakeTokenizer:
+    """Character-level tokenizer with a Llama-like chat template."""
+
+    all_special_tokens = list(SPECIAL)
+
+    def __init__(self, dummy_prefix=False):
+        # Like legacy sentencepiece, start every input with a marker token
+        self.dummy_prefix = dummy_prefix
+        self.calls = []
+
+    def apply_chat_template(self, history, tokenize, add_generation_prompt):
+        text = "<s>" + "".join(f"[{m['role']}]{m['content']}<e>" for m in history)
+        return text + ("[assistant]" if add_generation_prompt else "")
+
+    def __call__(self, text, add_special_tokens=True):
+        self.calls.append(text)
+        ids = [SPECIAL["<s>"]] if add_special_tokens else []
+        if self.dummy_prefix:
+            ids.append(0)
+        for part in re.split("(<s>|<e>)", text):
+            if part in SPECIAL:
+                ids.append(SPECIAL[part])
+            elif part:
+                ids += [ord(c) for c in part]
+        return SimpleNamespace(input_ids=ids)
+
+
+def dialog(turns):
+    """A dialog after `turns` exchanges; each turn extends the previous one."""
+    history = [{"role": "system", "content": "You are helpful."}]
+    for i in range(turns):
+        history.append({"role": "user", "content": f"question {i}"})
+        history.append({"role": "assistant", "content": f"answer {i}"})
+    return history + [{"role": "user", "content": f"question {turns}"}]
+
+
+def encode(cache, tokenizer, history, **kwargs):
+    prompt = tokenizer.apply_chat_template(
+        history, tokenize=False, add_generation_prompt=True
+    )
+    ids, reused = cache.encode("m", tokenizer, history, prompt, **kwargs)
+    return prompt, ids, reused
+
+
+class TestPromptTokenCache(unittest.TestCase):
+    def test_growing_dialog_matches_full_tokenization(self):
+        tokenizer = FakeTokenizer()
+        cache = PromptTokenCache()
+        for turns in range(4):
+            prompt, ids, reused = encode(cache, tokenizer, dialog(turns))
+            self.assertEqual(ids, tokenizer(prompt).input_ids)
+            self.assertEqual(reused > 0, turns > 0)
+
+    def test_only_new_messages_are_tokenized(self):
+        tokenizer = FakeTokenizer()
+        cache = PromptTokenCache(verify_first=0)
+        encode(cache, tokenizer, dialog(3))
+        tokenizer.calls.clear()
+        encode(cache, tokenizer, dialog(4))
+        tokenized = "".join(tokenizer.calls)
+        self.assertNotIn("question 0", tokenized)
+        self.assertIn("question 4", tokenized)
+
+    def test_client_prefix_ids(self):
+        tokenizer = FakeTokenizer()
+        cache = PromptTokenCache(verify_first=0)
+        history = dialog(1)
+        prefix = tokenizer.apply_chat_template(
+            history[:1], tokenize=False, add_generation_prompt=False
+        )
+        prefix_ids = tokenizer(prefix).input_ids
+        prompt, ids, reused = encode(
+            cache, tokenizer, history, prefix_token_ids=prefix_ids, prefix_messages=1
+        )
+        self.assertEqual(reused, len(prefix_ids))
+        self.assertEqual(ids, tokenizer(prompt).input_ids)
+
+    def test_disabled_when_ids_differ(self):
+        tokenizer = FakeTokenizer(dummy_prefix=True)
+        cache = PromptTokenCache()
+        encode(cache, tokenizer, dialog(0))
+        prompt, ids, reused = encode(cache, tokenizer, dialog(1))
+        self.assertEqual(ids, tokenizer(prompt).input_ids)
+        self.assertEqual(reused, 0)
+        self.assertIn("m", cache.disabled)
+
+    def test_history_digests(self):
+        history = dialog(2)
+        digests = history_digests(history)
+        self.assertEqual(len(digests), len(history) + 1)
+        self.assertEqual(history_digests(history[:3]), digests[:4])
+        self.assertEqual(len(set(digests)), len(digests))
+
+
+if __name__ == "__main__":
+    unittest.main()
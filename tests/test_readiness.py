@@ -0,0 +1,71 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from server import concurrent_multiple_model_server as server
+
+MODEL = "meta-llama/Llama-3.1-8B-Instruct"
+
+
+class TestReadiness(unittest.TestCase):
+    def setUp(self):
+        self.warmed_up = threading.Event()
+        self.warmups = []
+        for p in [
+            patch.object(server, "PRELOAD_MODELS", [MODEL]),
+            patch.object(server, "submit_job", self.submit_job),
+            patch.dict(server.MODEL_READINESS, clear=True),
+        ]:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def submit_job(self, model_name, request, handler):
+        # Stands in for the model's worker running the warmup generations
+        self.warmups.append(model_name)
+        self.warmed_up.wait(timeout=10)
+
+    def wait_for(self, status):
+        for _ in range(100):
+            if server.MODEL_READINESS.get(MODEL) == status:
+                return
+            time.sleep(0.01)
+        self.fail(f"{MODEL} never became {status}")
+
+    def test_ready_after_preload(self):
+        with TestClient(server.app) as client:
+            self.wait_for("loading")
+            self.assertEqual(client.get("/health").status_code, 200)
+            response = client.get("/ready")
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json()["models"], {MODEL: "loading"})
+            self.assertEqual(client.get("/models").json()["models"][MODEL], "loading")
+
+            self.warmed_up.set()
+            self.wait_for("ready")
+            response = client.get("/ready")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json(), {"ready": True, "models": {MODEL: "ready"}}
+            )
+            self.assertEqual(client.get(f"/ready?model={MODEL}").status_code, 200)
+        # One warmup per preloaded constraint
+        self.assertEqual(set(self.warmups), {MODEL})
+
+    def test_failed_preload_is_not_ready(self):
+        with patch.object(server, "submit_job", side_effect=RuntimeError("no GPU")):
+            with TestClient(server.app) as client:
+                self.wait_for("failed: no GPU")
+                response = client.get("/ready")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["models"], {MODEL: "failed: no GPU"})
+
+    def test_unknown_model_is_not_ready(self):
+        client = TestClient(server.app)
+        response = client.get("/ready?model=unknown")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["models"], {"unknown": "not_loaded"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import unittest
+from server.replicas import ReplicaPool, ReplicaError, ReplicaCrashedError
+
+
+def handler(model_name, index, method, *args):
+    if method == "init":
+        return
+    if method == "echo":
+        return (index, args)
+    if method == "fail":
+        raise ValueError("bad request")
+    if method == "crash":
+        os._exit(1)
+
+
+class TestReplicaPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = ReplicaPool("model", 2, f"{__name__}:handler")
+
+    def tearDown(self):
+        for replica in self.pool.replicas:
+            replica.process.kill()
+
+    def test_calls_run_on_each_replica(self):
+        self.assertEqual(self.pool.replicas[0].call("echo", 1), (0, (1,)))
+        self.assertEqual(self.pool.broadcast("echo", "x"), [(0, ("x",)), (1, ("x",))])
+
+    def test_handler_errors(self):
+        with self.assertRaises(ReplicaError) as ctx:
+            self.pool.replicas[0].call("fail")
+        self.assertEqual(ctx.exception.status_code, 500)
+        self.assertIn("bad request", ctx.exception.detail)
+
+    def test_crashed_replica_is_restarted(self):
+        replica = self.pool.replicas[1]
+        pid = replica.process.pid
+        with self.assertRaises(ReplicaCrashedError):
+            replica.call("crash")
+        self.assertEqual(replica.restarts, 1)
+        self.assertNotEqual(replica.process.pid, pid)
+        self.assertEqual(replica.call("echo"), (1, ()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import threading
+import time
+import unittest
+from server.request_cache import ResponseLRU, SingleFlight, request_key
+
+
+class TestResponseLRU(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        lru = ResponseLRU(2)
+        lru.put("a", 1)
+        lru.put("b", 2)
+        self.assertEqual(lru.get("a"), 1)  # b is now LRU
+        lru.put("c", 3)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("a"), 1)
+        self.assertEqual(lru.get("c"), 3)
+
+    def test_disabled(self):
+        lru = ResponseLRU(0)
+        lru.put("a", 1)
+        self.assertIsNone(lru.get("a"))
+
+    def test_request_key_ignores_key_order(self):
+        self.assertEqual(
+            request_key({"a": 1, "b": [1, 2]}), request_key({"b": [1, 2], "a": 1})
+        )
+        self.assertNotEqual(request_key({"a": 1}), request_key({"a": 2}))
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def slow():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return "result"
+
+        results = []
+
+        def run():
+            results.append(flight.do("k", slow))
+
+        leader = threading.Thread(target=run)
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=run) for _ in range(4)]
+        for t in followers:
+            t.start()
+        for t in [leader] + followers:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [("result", False)] + [("result", True)] * 4)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_exception_is_shared_and_not_sticky(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            flight.do("k", fail)
+        self.assertEqual(flight.do("k", lambda: 1), (1, False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+from server.residency import (
+    ResidencyManager,
+    SimulatedDeviceInventory,
+    InsufficientMemoryError,
+    parse_budget_gb,
+    GB,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResidencyManager(unittest.TestCase):
+    def setUp(self):
+        self.inventory = SimulatedDeviceInventory({0: 24 * GB, 1: 48 * GB})
+        self.clock = FakeClock()
+        self.offloaded = []
+        self.dropped = []
+        self.placements = {}
+        self.manager = ResidencyManager(
+            self.inventory,
+            on_offload=self.offload,
+            on_drop=self.drop,
+            host_budget=20 * GB,
+            clock=self.clock,
+        )
+
+    def offload(self, model_name):
+        device, nbytes = self.placements.pop(model_name)
+        self.inventory.release(device, nbytes)
+        self.offloaded.append(model_name)
+
+    def drop(self, model_name):
+        self.dropped.append(model_name)
+
+    def load(self, model_name, nbytes=None):
+        """Acquire a model and simulate its weights being allocated."""
+        device, state = self.manager.acquire(model_name, nbytes)
+        if state != "resident":
+            nbytes = self.manager.resident[model_name]["nbytes"]
+            self.inventory.allocate(device, nbytes)
+            self.placements[model_name] = (device, nbytes)
+        self.manager.release(model_name)
+        return device, state
+
+    def test_places_on_device_with_most_headroom(self):
+        device, state = self.load("a", 30 * GB)
+        self.assertEqual(device, 1)
+        self.assertEqual(state, "new")
+        device, _ = self.load("b", 20 * GB)
+        self.assertEqual(device, 0)
+
+    def test_resident_model_is_reused(self):
+        self.load("a", 10 * GB)
+        device, state = self.load("a", 10 * GB)
+        self.assertEqual(state, "resident")
+        self.assertEqual(device, 1)
+
+    def test_respects_external_memory_usage(self):
+        # Another process is using most of GPU 1
+        self.inventory.allocate(1, 40 * GB)
+        device, _ = self.load("a", 10 * GB)
+        self.assertEqual(device, 0)
+
+    def test_lru_eviction_to_host_standby(self):
+        self.manager.device_budget = 16 * GB
+        self.load("a", 10 * GB)  # GPU 0
+        self.load("b", 10 * GB)  # GPU 1
+        self.clock.now = 1
+        self.load("a")  # touch a, b is now LRU
+        device, _ = self.load("c", 10 * GB)
+        self.assertEqual(device, 1)
+        self.assertEqual(self.offloaded, ["b"])
+        self.assertIn("b", self.manager.standby)
+        self.assertEqual(self.dropped, [])
+
+    def test_restore_from_standby(self):
+        self.manager.device_budget = 16 * GB
+        self.load("a", 10 * GB)
+        self.load("b", 10 * GB)
+        self.load("c", 10 * GB)  # evicts a
+        device, state = self.load("a")  # evicts b
+        self.assertEqual(state, "standby")
+        self.assertEqual(device, 1)
+        self.assertNotIn("a", self.manager.standby)
+        self.assertEqual(self.offloaded, ["a", "b"])
+
+    def test_host_budget_drops_oldest_standby(self):
+        self.manager.device_budget = 16 * GB
+        self.manager.host_budget = 15 * GB
+        self.load("a", 10 * GB)
+        self.load("b", 10 * GB)
+        self.load("c", 10 * GB)  # a -> standby
+        self.load("d", 10 * GB)  # b -> standby, a dropped
+        self.assertEqual(self.dropped, ["a"])
+        self.assertEqual(list(self.manager.standby), ["b"])
+
+    def test_pinned_models_are_not_evicted(self):
+        self.manager.device_budget = 16 * GB
+        self.manager.acquire("a", 10 * GB)
+        self.manager.acquire("b", 10 * GB)
+        with self.assertRaises(InsufficientMemoryError):
+            self.manager.acquire("c", 10 * GB)
+        self.assertEqual(self.offloaded, [])
+        self.assertNotIn("c", self.manager.pinned)
+
+    def test_failed_offload_releases_pin(self):
+        self.manager.device_budget = 16 * GB
+        self.load("a", 10 * GB)
+        self.load("b", 10 * GB)
+
+        def fail(model_name):
+            raise RuntimeError("cannot move weights")
+
+        self.manager.on_offload = fail
+        with self.assertRaises(RuntimeError):
+            self.manager.acquire("c", 10 * GB)
+        self.assertEqual(self.manager.pinned, {})
+
+    def test_offload_may_drop(self):
+        self.manager.device_budget = 16 * GB
+        self.load("a", 10 * GB)
+        self.load("b", 10 * GB)
+        self.manager.on_offload = lambda model_name: self.offload(model_name) or False
+        self.load("c", 10 * GB)
+        self.assertEqual(self.offloaded, ["a"])
+        self.assertNotIn("a", self.manager.standby)
+
+    def test_offload_idle(self):
+        self.load("a", 10 * GB)
+        self.clock.now = 100
+        self.load("b", 10 * GB)
+        self.clock.now = 150
+        self.assertEqual(self.manager.offload_idle(120), ["a"])
+        self.assertEqual(list(self.manager.resident), ["b"])
+
+    def test_cpu_only(self):
+        manager = ResidencyManager(
+            SimulatedDeviceInventory({}), on_offload=self.offload, on_drop=self.drop
+        )
+        self.assertEqual(manager.acquire("a", 10 * GB), (-1, "new"))
+
+    def test_parse_budget(self):
+        self.assertIsNone(parse_budget_gb(""))
+        self.assertEqual(parse_budget_gb("2"), 2 * GB)
+        self.assertEqual(parse_budget_gb("1,2"), {0: GB, 1: 2 * GB})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from joblib import Memory
+from server import model_client
+from server.concurrent_multiple_model_server import ForwardRequest, sample_requests
+
+HISTORY = [{"role": "user", "content": "Pick a number."}]
+
+
+class FakeOpenAI:
+    """Records `chat.completions.create` calls and returns numbered choices."""
+
+    calls = []
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        FakeOpenAI.calls.append(kwargs)
+        offset = sum(call.get("n", 1) for call in FakeOpenAI.calls[:-1])
+        choices = [
+            SimpleNamespace(
+                finish_reason="stop",
+                message=SimpleNamespace(content=f"sample {offset + i}"),
+            )
+            for i in range(kwargs.get("n", 1))
+        ]
+        return SimpleNamespace(choices=choices)
+
+
+class TestSampleRequests(unittest.TestCase):
+    def test_samples_are_seeded_single_requests(self):
+        request = ForwardRequest(
+            name_of_model="meta-llama/Llama-3.1-8B-Instruct",
+            history=HISTORY,
+            use_cache=True,
+            constraints=None,
+            constraint_type="none",
+            response_format=None,
+            random_seed=7,
+            n=3,
+        )
+        samples = sample_requests(request)
+        self.assertEqual([s.random_seed for s in samples], [7, 8, 9])
+        self.assertTrue(all(s.n == 1 for s in samples))
+        self.assertEqual(samples[0], request.model_copy(update={"n": 1}))
+
+
+class TestGptSamples(unittest.TestCase):
+    def setUp(self):
+        FakeOpenAI.calls = []
+        self.cache_dir = tempfile.TemporaryDirectory()
+        cached = Memory(self.cache_dir.name, verbose=0).cache(
+            model_client.gpt_forward_cached.func
+        )
+        self.patches = [
+            patch.object(model_client, "OpenAI", FakeOpenAI),
+            patch.object(model_client, "gpt_forward_cached", cached),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.cache_dir.cleanup()
+
+    def samples(self, n):
+        return model_client.gpt_forward_samples(
+            "gpt-4o-mini", HISTORY, None, 32, None, 0, n
+        )
+
+    def test_n_is_sent_in_one_call(self):
+        self.assertEqual(self.samples(3), ["sample 0", "sample 1", "sample 2"])
+        self.assertEqual(len(FakeOpenAI.calls), 1)
+        self.assertEqual(FakeOpenAI.calls[0]["n"], 3)
+        self.assertEqual(FakeOpenAI.calls[0]["max_tokens"], 32)
+
+    def test_samples_are_cached_one_by_one(self):
+        self.samples(2)
+        # The first sample shares the entry of the single-sample call
+        self.assertEqual(
+            model_client.gpt_forward_cached("gpt-4o-mini", HISTORY, None, 32, None),
+            "sample 0",
+        )
+        self.assertEqual(len(FakeOpenAI.calls), 1)
+        # Only the missing sample is requested, without `n`
+        self.assertEqual(self.samples(3), ["sample 0", "sample 1", "sample 2"])
+        self.assertEqual(len(FakeOpenAI.calls), 2)
+        self.assertNotIn("n", FakeOpenAI.calls[1])
+
+    def test_sample_seeds(self):
+        self.assertEqual(
+            [model_client._sample_seed(5, i) for i in range(3)], [None, 6, 7]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+from datamodels.imaginary_data import ImaginaryData
+from datamodels.sandbox import (
+    COMPILED_SOURCES,
+    CheckerCrashed,
+    CheckerError,
+    CheckerSandbox,
+    CheckerTimeout,
+)
+
+FUNCTIONS = """
+def owns(hh):
+    return hh["owner"] == "yes"
+
+
+def spin(hh):
+    while True:
+        pass
+
+
+def hoard(hh):
+    return len("x" * (512 * 1024 * 1024))
+
+
+def die(hh):
+    import os
+
+    os._exit(3)
+"""
+
+MODULE = """
+def check_senior(hh):
+    if int(hh["age"]) < 65:
+        return False
+    for i in range(int(hh["number of household members"])):
+        if hh[i]["is_owner"] == "yes":
+            return True
+    return False
+
+
+calls = {"check_senior": check_senior}
+"""
+
+
+class TestCheckerSandbox(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.sandbox = CheckerSandbox(
+            workers=2, timeout=1.0, cpu_timeout=1.0, memory_mb=256
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sandbox.close()
+
+    def test_call(self):
+        self.assertTrue(self.sandbox.call(FUNCTIONS, "owns", {"owner": "yes"}))
+        with self.assertRaises(CheckerError) as raised:
+            self.sandbox.call(FUNCTIONS, "owns", {})
+        self.assertIn("KeyError: 'owner'", str(raised.exception))
+
+    def test_evicted_sources_compile_again(self):
+        sources = [f"def f(hh):\n    return {i}\n" for i in range(COMPILED_SOURCES + 4)]
+        for i, source in enumerate(sources):
+            self.assertEqual(self.sandbox.call(source, "f", {}), i)
+        self.assertEqual(self.sandbox.call(sources[0], "f", {}), 0)
+
+    def test_limits_restart_workers(self):
+        restarts = self.sandbox.restarts
+        with self.assertRaises(CheckerTimeout):
+            self.sandbox.call(FUNCTIONS, "spin", {})
+        with self.assertRaises(CheckerCrashed):
+            self.sandbox.call(FUNCTIONS, "die", {})
+        with self.assertRaises(CheckerError) as raised:
+            self.sandbox.call(FUNCTIONS, "hoard", {})
+        self.assertIn("MemoryError", str(raised.exception))
+        self.assertEqual(self.sandbox.restarts, restarts + 2)
+        # The replacements serve requests as before
+        self.assertFalse(self.sandbox.call(FUNCTIONS, "owns", {"owner": "no"}))
+
+    def test_execution(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+            f.write(MODULE)
+        self.addCleanup(os.remove, f.name)
+        answers = {"age": "70", "number of household members": "2", "is_owner": "no"}
+        hh = ImaginaryData()
+        execution = self.sandbox.execute(f.name, "check_senior", hh)
+        seen = []
+        pending = execution.resume()
+        while pending is not None:
+            seen.append((pending.key, pending.member_idx))
+            target = hh if pending.member_idx is None else hh[pending.member_idx]
+            target[pending.key] = answers[pending.key]
+            pending = execution.resume()
+        self.assertFalse(execution.result)
+        self.assertEqual(seen[-2:], [("is_owner", 0), ("is_owner", 1)])
+        self.assertEqual(self.sandbox.idle.qsize(), self.sandbox.workers)
+
+    def test_required_household_keys(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+            f.write(MODULE)
+        self.addCleanup(os.remove, f.name)
+        hh = ImaginaryData()
+        execution = self.sandbox.execute(f.name, "check_senior", hh)
+        self.assertEqual(execution.resume().key, "age")
+        self.assertEqual(execution.required_household_keys(hh), ["age"])
+        hh["age"] = "70"
+        self.assertEqual(
+            execution.required_household_keys(hh), ["number of household members"]
+        )
+        execution.close()
+
+    def test_execution_uses_known_values(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+            f.write(MODULE)
+        self.addCleanup(os.remove, f.name)
+        hh = ImaginaryData()
+        execution = self.sandbox.execute(f.name, "check_senior", hh)
+        hh["age"] = "70"
+        hh["number of household members"] = "3"
+        pending = execution.resume()
+        self.assertEqual((pending.key, pending.member_idx), ("is_owner", 0))
+        # Members filled together are not asked for again
+        for i in range(3):
+            hh[i]["is_owner"] = "no" if i < 2 else "yes"
+        self.assertIsNone(execution.resume())
+        self.assertTrue(execution.result)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from server.scheduling import FairPriorityQueue, QueueFullError
+
+
+class TestFairPriorityQueue(unittest.TestCase):
+    def drain(self, q):
+        return [q.get(timeout=0) for _ in range(q.qsize())]
+
+    def test_priority_order(self):
+        q = FairPriorityQueue()
+        q.put("offline", priority="offline")
+        q.put("batch", priority="batch")
+        q.put("interactive", priority="interactive")
+        self.assertEqual(self.drain(q), ["interactive", "batch", "offline"])
+
+    def test_round_robin_across_clients(self):
+        q = FairPriorityQueue()
+        for i in range(3):
+            q.put(f"sweep{i}", client_id="sweep")
+        q.put("other0", client_id="other")
+        q.put("other1", client_id="other")
+        self.assertEqual(
+            self.drain(q), ["sweep0", "other0", "sweep1", "other1", "sweep2"]
+        )
+
+    def test_bounded_with_interactive_reserve(self):
+        q = FairPriorityQueue(maxsize=2, interactive_reserve=1)
+        q.put(1)
+        q.put(2)
+        with self.assertRaises(QueueFullError):
+            q.put(3, priority="batch")
+        q.put(3, priority="interactive")
+        with self.assertRaises(QueueFullError):
+            q.put(4, priority="interactive")
+        self.assertEqual(q.depth_by_priority()["interactive"], 1)
+
+    def test_get_timeout_and_unknown_priority(self):
+        q = FairPriorityQueue()
+        with self.assertRaises(TimeoutError):
+            q.get(timeout=0.01)
+        with self.assertRaises(ValueError):
+            q.put(1, priority="urgent")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from server import gateway as gateway_module
+from server import model_client
+from server.gateway import Gateway
+from test_gateway import FakeUpstreams
+
+HISTORY = [{"role": "user", "content": "Hello"}]
+
+
+class Response:
+    """The parts of `requests.Response` that `ModelAPIClient.stream` uses."""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.text = response.text
+        self.closed = False
+        self.json = response.json
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.text.splitlines())
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TestClientStream(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeUpstreams(full={"a"})
+        gateway = Gateway(
+            ["a", "b"],
+            send=self.fake.send,
+            get_json=self.fake.get_json,
+            stream=self.fake.stream,
+        )
+        self.http = TestClient(gateway_module.app)
+        self.responses = []
+        for p in [
+            patch.object(gateway_module, "GATEWAY", gateway),
+            patch.object(model_client.requests, "post", self.post),
+            patch.object(model_client.time, "sleep", lambda seconds: None),
+        ]:
+            p.start()
+            self.addCleanup(p.stop)
+        self.client = model_client.ModelAPIClient("http://gateway", random_seed=0)
+
+    def post(self, url, json=None, **kwargs):
+        response = Response(self.http.post(url[url.index("/forward") :], json=json))
+        self.responses.append(response)
+        return response
+
+    def stream(self):
+        return self.client.stream(
+            HISTORY, "meta-llama/Llama-3.1-8B-Instruct", True, "chatbot"
+        )
+
+    def test_tokens_through_gateway(self):
+        self.assertEqual(list(self.stream()), ["b"])
+        self.assertEqual(self.fake.calls, ["a", "b"])
+        self.assertTrue(self.responses[-1].closed)
+
+    def test_retries_when_queue_full(self):
+        self.fake.full = {"a", "b"}
+        stream = self.stream()
+        with self.assertRaises(Exception):
+            next(stream)
+        self.assertEqual(len(self.responses), model_client.MAX_QUEUE_FULL_RETRIES)
+        # Every busy response is closed before retrying
+        self.assertTrue(all(response.closed for response in self.responses))
+
+
+if __name__ == "__main__":
+    unittest.main()
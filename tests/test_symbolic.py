@@ -0,0 +1,112 @@
+import unittest
+from datamodels.imaginary_data import ImaginaryData
+from datamodels.symbolic import enumerate_keys, required_household_keys
+
+
+def check_childcare(hh):
+    if float(hh["monthly income"]) * 12 > 50000:
+        return False
+    if hh["filing status"].lower() in ["single", "married"]:
+        for i in range(len(hh)):
+            if hh[i]["is_student"] == "yes" and int(hh[i]["age"]) < 18:
+                return True
+    return hh["disabled"] == "yes"
+
+
+def is_adult(member):
+    return int(member["age"]) >= 18
+
+
+def check_adults(hh):
+    return any(is_adult(hh[i]) for i in range(int(hh["number of household members"])))
+
+
+def check_income(hh):
+    income = float(hh["wages"]) + float(hh["benefits"])
+    return income < 20000 and hh["renter"] == "yes"
+
+
+def check_spins(hh):
+    if hh["has_id"] == "yes":
+        while True:
+            pass
+    return False
+
+
+class TestSymbolicExecution(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.enumeration = enumerate_keys(check_childcare, max_members=2)
+
+    def test_reachable_keys(self):
+        self.assertTrue(self.enumeration.complete)
+        self.assertEqual(
+            set(self.enumeration.keys),
+            {
+                "monthly income",
+                "filing status",
+                "number of household members",
+                "is_student",
+                "age",
+                "disabled",
+            },
+        )
+        self.assertEqual(
+            {path.result for path in self.enumeration.paths}, {True, False}
+        )
+
+    def test_member_patterns(self):
+        keys = self.enumeration.keys
+        self.assertEqual(keys["age"].patterns, {"member"})
+        self.assertEqual(keys["age"].members, {0, 1})
+        self.assertEqual(keys["disabled"].patterns, {"household"})
+
+    def test_guards(self):
+        guard = "not ((float(hh['monthly income']) * 12) > 50000)"
+        self.assertEqual(self.enumeration.keys["monthly income"].guards, [()])
+        for guards in self.enumeration.keys["filing status"].guards:
+            self.assertIn(guard, guards)
+        self.assertTrue(
+            any(
+                "hh[1]['is_student'] == 'yes'" in guards
+                for guards in self.enumeration.keys["age"].guards
+            )
+        )
+
+    def test_worst_case_questions(self):
+        # income, status, size, both students, both ages and disabled
+        self.assertEqual(self.enumeration.max_questions, 8)
+
+    def test_loops_are_cut_off(self):
+        enumeration = enumerate_keys(check_spins, max_steps=1000)
+        self.assertEqual(set(enumeration.keys), {"has_id"})
+        errors = [path.error for path in enumeration.paths if path.error]
+        self.assertEqual(len(errors), 1)
+        self.assertIn("PathLimit", errors[0])
+        self.assertFalse(enumeration.complete)
+
+    def test_required_household_keys(self):
+        hh = ImaginaryData()
+        self.assertEqual(
+            required_household_keys(check_childcare, hh), ["monthly income"]
+        )
+        hh["monthly income"] = "1000"
+        self.assertEqual(
+            required_household_keys(check_childcare, hh), ["filing status"]
+        )
+        hh["filing status"] = "widowed"
+        self.assertEqual(required_household_keys(check_childcare, hh), ["disabled"])
+        self.assertEqual(required_household_keys(check_income), ["wages", "benefits"])
+        self.assertIsNone(required_household_keys(check_spins, max_steps=1000))
+
+    def test_module_helpers(self):
+        enumeration = enumerate_keys(check_adults)
+        self.assertTrue(enumeration.complete)
+        self.assertEqual(enumeration.keys["age"].members, {0, 1})
+        self.assertEqual({path.result for path in enumeration.paths}, {True, False})
+        # The builtins are back once enumeration ends
+        self.assertNotIn("int", globals())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import threading
+import time
+import unittest
+from datamodels.synthesis import (
+    RateLimiter,
+    key_specs_schema,
+    ordered_map,
+    parse_key_specs,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestSynthesis(unittest.TestCase):
+    def test_ordered_map_keeps_input_order(self):
+        def slow_square(x):
+            # Later items finish first
+            time.sleep(0.01 * (5 - x))
+            return x * x
+
+        self.assertEqual(ordered_map(slow_square, range(5), 4), [0, 1, 4, 9, 16])
+        self.assertEqual(ordered_map(slow_square, range(5), 1), [0, 1, 4, 9, 16])
+
+    def test_ordered_map_runs_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+        self.assertEqual(
+            ordered_map(lambda x: barrier.wait() >= 0, range(3), 3), [True] * 3
+        )
+
+    def test_ordered_map_raises(self):
+        def fail_on_two(x):
+            if x == 2:
+                raise ValueError(x)
+            return x
+
+        with self.assertRaises(ValueError):
+            ordered_map(fail_on_two, range(4), 2)
+
+    def test_rate_limiter_spaces_calls(self):
+        clock = FakeClock()
+        limiter = RateLimiter(4, clock=clock, sleep=clock.sleep)
+        starts = []
+        for _ in range(3):
+            limiter.acquire()
+            starts.append(clock.now)
+        self.assertEqual(starts, [0.0, 0.25, 0.5])
+        RateLimiter(None, clock=clock, sleep=clock.sleep).acquire()
+        self.assertEqual(clock.now, 0.5)
+
+    def test_key_specs_schema_requires_every_key(self):
+        schema = key_specs_schema(["age", "student"])
+        self.assertEqual(schema["required"], ["age", "student"])
+        self.assertEqual(
+            schema["properties"]["age"]["properties"]["type"]["enum"],
+            ["int", "float", "choice"],
+        )
+
+    def test_parse_key_specs(self):
+        response = {
+            "age": {"type": "int", "options": []},
+            "student": {"type": "choice", "options": ["yes", "no"]},
+            "income": {"type": "money", "options": []},
+            "status": {"type": "choice", "options": []},
+        }
+        valid, invalid = parse_key_specs(
+            json.dumps(response), ["age", "student", "income", "status", "rent"]
+        )
+        self.assertEqual(
+            valid, {"age": ("int", None), "student": ("choice", ["yes", "no"])}
+        )
+        self.assertEqual(invalid, ["income", "status", "rent"])
+        self.assertEqual(parse_key_specs("{", ["age"]), ({}, ["age"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+from server.transport import MSGPACK_CONTENT_TYPE, MsgpackRoute, packb
+
+app = FastAPI()
+app.router.route_class = MsgpackRoute
+
+
+class Request(BaseModel):
+    name_of_model: str
+    history: list[dict]
+
+
+@app.post("/forward")
+def forward(request: Request):
+    return {"model": request.name_of_model, "last": request.history[-1]["content"]}
+
+
+class TestMsgpackRoute(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+        self.body = {"name_of_model": "m", "history": [{"content": "héllo"}]}
+
+    def post_msgpack(self, data):
+        return self.client.post(
+            "/forward", content=data, headers={"Content-Type": MSGPACK_CONTENT_TYPE}
+        )
+
+    def test_msgpack_and_json_agree(self):
+        response = self.post_msgpack(packb(self.body))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), self.client.post("/forward", json=self.body).json()
+        )
+
+    def test_validation_still_applies(self):
+        response = self.post_msgpack(packb({"name_of_model": "m"}))
+        self.assertEqual(response.status_code, 422)
+
+    def test_malformed_body(self):
+        self.assertEqual(self.post_msgpack(b"\xc1").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()